@@ -16,9 +16,7 @@ Spawn Source:   fileHero Python Project by same author.
 #   Development:
 #
 
-from tkinter import Tk, messagebox, N, S, E, W
-
-from view.Hardware import HardwareProbeViewController, ViewMode
+from sys import argv
 
 PROGRAM_TITLE   = 'GearboxMD'
 TESTING = True
@@ -35,7 +33,19 @@ def ExitProgram():
         mainView.destroy()
 
 
+#   Subcommands which run without a display.  service.Headless never imports tkinter or any view module.
+HEADLESS_COMMANDS = ('probe', 'ingest')
+
+
 if __name__ == '__main__':
+    if len(argv) > 1 and argv[1] in HEADLESS_COMMANDS:
+        from service.Headless import main
+        exit(main(argv[1:]))
+
+    from tkinter import Tk, messagebox, N, S, E, W
+
+    from view.Hardware import HardwareProbeViewController, ViewMode
+
     mainView = Tk()
     mainView.geometry("1000x600+50+50")
     mainView.title(PROGRAM_TITLE)
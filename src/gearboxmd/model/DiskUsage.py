@@ -0,0 +1,267 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         model/DiskUsage.py
+#   Date Started:   October 16, 2026
+#   Purpose:        Disk usage of every directory under a folder, as du -x reports it, for showing where the space
+#                   on a filesystem has gone.
+#   Development:
+#       Walking the whole of / takes a long time, so the folder's top level directories are walked at the same time
+#       on a pool of threads, and running totals are posted to a Queue for the Tk thread to poll as they grow.
+#       The walk uses os.scandir(), stays on the filesystem of the folder it starts from, and counts a file with
+#       more than one hard link only the first time its (device, inode) is seen.
+#       Each directory's result is kept, keyed by its path and mtime.  A rescan with useCache stats each directory
+#       and, where the mtime is unchanged, reuses what was found in it instead of reading and stating its entries
+#       again.  A file that changes size without being created, removed, or renamed, as a growing log does, leaves
+#       its directory's mtime as it was, so the cache is only for a quick look again, and is off by default.
+#
+
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Thread, Lock
+from queue import Queue
+from time import monotonic
+from sys import exc_info, stderr
+
+
+PROGRAM_TITLE = "Disk Usage"
+INSTALLING  = False
+TESTING     = True
+DEBUG       = False
+
+
+class DirectoryTotal:
+    """
+    What a scan found in one directory.  The own values are for the directory itself and the files directly in
+    it, not counting files with more than one link, which are listed in links as (device, inode, bytes) and
+    counted in linkBytes by whichever directory a scan reaches them from first.  The totals include every
+    subdirectory on the same filesystem.  Bytes are allocated blocks, as du counts them.
+    """
+
+    __slots__ = ('path', 'mtime', 'ownBytes', 'ownFiles', 'links', 'childPaths', 'linkBytes', 'linkFiles',
+                 'totalBytes', 'totalFiles')
+
+    def __init__(self, path: str, mtime: int, ownBytes: int, ownFiles: int, links: tuple, childPaths: tuple):
+        self.path       = path
+        self.mtime      = mtime
+        self.ownBytes   = ownBytes
+        self.ownFiles   = ownFiles
+        self.links      = links
+        self.childPaths = childPaths
+        self.linkBytes  = 0
+        self.linkFiles  = 0
+        self.totalBytes = ownBytes
+        self.totalFiles = ownFiles
+
+    def __str__(self):
+        return self.path + ":\t" + str(self.totalBytes) + " bytes in " + str(self.totalFiles) + " files"
+
+
+class DiskUsageScanner:
+    """
+    Computes a DirectoryTotal for every directory under rootPath.  start() scans on a background thread and
+    posts these to messages:
+        {'source': 'DiskUsageScanner.scanTree', 'type': 'progress', 'path': <top level directory>,
+            'bytes': <int>, 'files': <int>}     running totals, at most every PROGRESS_INTERVAL seconds.
+        {'source': 'DiskUsageScanner.scan', 'type': 'directory', 'total': <DirectoryTotal>}
+                                                when a top level directory is finished.
+        {'source': 'DiskUsageScanner.scan', 'type': 'complete', 'total': <DirectoryTotal of rootPath>,
+            'errors': <int>, 'cancelled': <bool>}
+    """
+
+    #   The walk waits on the disk far more than on the interpreter, so more threads than cores still help.
+    MAX_WORKERS         = 8
+    #   Seconds.
+    PROGRESS_INTERVAL   = 0.25
+    BLOCK_SIZE          = 512
+
+    def __init__(self, rootPath: str='/', maxWorkers: int=MAX_WORKERS):
+        if not isinstance(rootPath, str) or not os.path.isdir(rootPath):
+            raise Exception("DiskUsageScanner constructor - Invalid rootPath argument:  " + str(rootPath))
+        if not isinstance(maxWorkers, int) or maxWorkers < 1:
+            raise Exception("DiskUsageScanner constructor - Invalid maxWorkers argument:  " + str(maxWorkers))
+        self.rootPath   = os.path.abspath(rootPath)
+        self.maxWorkers = maxWorkers
+        self.messages   = Queue()
+        #   Key is the directory path, value its DirectoryTotal from the latest scan.
+        self.totals     = OrderedDict()
+        self.device     = None
+        self.seenLinks  = set()
+        #   Guards seenLinks and errorCount, which every pool thread updates.
+        self.lock       = Lock()
+        self.errorCount = 0
+        self.cancelled  = False
+        self.thread     = None
+
+    def start(self, useCache: bool=False):
+        """
+        Scans on a background thread, which reports through messages.  Ignored if a scan is running.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return
+        #   Cleared here rather than by the scan, so that a cancel() before the thread gets going is not lost.
+        self.cancelled = False
+        self.thread = Thread(target=self.scan, args=(useCache,), name="DiskUsageScanner", daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Stops the scan running, or the one start() is starting.  A scan() called directly stays cancelled until
+        the next start().
+        """
+        self.cancelled = True
+
+    def scan(self, useCache: bool=False):
+        """
+        Scans rootPath on this thread, with its top level directories walked on the pool.
+        :param useCache:    Reuse what the last scan found in directories whose mtime has not changed, which misses
+                            files that changed size in place.
+        :return:            The DirectoryTotal of rootPath, or None if it cannot be read.
+        """
+        previous = self.totals if useCache else {}
+        self.totals = OrderedDict()
+        self.seenLinks = set()
+        self.errorCount = 0
+        rootTotal = None
+        try:
+            self.device = os.stat(self.rootPath).st_dev
+            rootTotal = self.scanDirectory(self.rootPath, previous)
+            if rootTotal is not None:
+                with ThreadPoolExecutor(max_workers=self.maxWorkers,
+                                        thread_name_prefix='DiskUsageScanner') as executor:
+                    futures = [executor.submit(self.scanTree, childPath, previous)
+                               for childPath in rootTotal.childPaths]
+                    for future in as_completed(futures):
+                        childTotal = future.result()
+                        if childTotal is not None:
+                            self.messages.put({'source': 'DiskUsageScanner.scan', 'type': 'directory',
+                                               'total': childTotal})
+                self.sumChildren(rootTotal)
+        except Exception:
+            outputText = 'DiskUsageScanner.scan - scan of ' + self.rootPath + ' failed:\n'
+            for line in exc_info():
+                outputText += str(line) + '\n'
+            print(outputText, file=stderr)
+        self.messages.put({'source': 'DiskUsageScanner.scan', 'type': 'complete', 'total': rootTotal,
+                           'errors': self.errorCount, 'cancelled': self.cancelled})
+        return rootTotal
+
+    def scanDirectory(self, path: str, previous: dict):
+        """
+        Finds the own values of the directory at path, from the previous scan if its mtime is unchanged, and
+        counts its hard linked files which no other directory has counted yet in this scan.
+        :return:    Its DirectoryTotal, or None if it cannot be read.
+        """
+        try:
+            directoryStat = os.stat(path, follow_symlinks=False)
+            mtime = directoryStat.st_mtime_ns
+            cached = previous.get(path)
+            if cached is not None and cached.mtime == mtime:
+                directoryTotal = DirectoryTotal(path, mtime, cached.ownBytes, cached.ownFiles, cached.links,
+                                                cached.childPaths)
+            else:
+                ownBytes = directoryStat.st_blocks * DiskUsageScanner.BLOCK_SIZE
+                ownFiles, links, childPaths = 0, [], []
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            entryStat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            self.countError()
+                            continue
+                        if entryStat.st_dev != self.device:
+                            #   A mount point.  What is mounted on it belongs to another filesystem.
+                            continue
+                        size = entryStat.st_blocks * DiskUsageScanner.BLOCK_SIZE
+                        if entry.is_dir(follow_symlinks=False):
+                            childPaths.append(entry.path)
+                        elif entryStat.st_nlink > 1:
+                            links.append((entryStat.st_dev, entryStat.st_ino, size))
+                        else:
+                            ownBytes += size
+                            ownFiles += 1
+                directoryTotal = DirectoryTotal(path, mtime, ownBytes, ownFiles, tuple(links), tuple(childPaths))
+        except OSError:
+            #   Unreadable, or removed since its parent was read.
+            self.countError()
+            return None
+        if len(directoryTotal.links) > 0:
+            with self.lock:
+                for device, inode, size in directoryTotal.links:
+                    if (device, inode) not in self.seenLinks:
+                        self.seenLinks.add((device, inode))
+                        directoryTotal.linkBytes += size
+                        directoryTotal.linkFiles += 1
+        directoryTotal.totalBytes = directoryTotal.ownBytes + directoryTotal.linkBytes
+        directoryTotal.totalFiles = directoryTotal.ownFiles + directoryTotal.linkFiles
+        #   Each thread walks different directories, so no two write the same key.
+        self.totals[path] = directoryTotal
+        return directoryTotal
+
+    def countError(self):
+        with self.lock:
+            self.errorCount += 1
+
+    def scanTree(self, topPath: str, previous: dict):
+        """
+        Walks the tree under topPath on a pool thread, depth first without recursion so that no depth of nesting
+        can overflow the stack, then sums it from the bottom up.
+        :return:    The DirectoryTotal of topPath, or None if it cannot be read.
+        """
+        visited = []
+        stack = [topPath]
+        runningBytes, runningFiles = 0, 0
+        lastProgress = monotonic()
+        while len(stack) > 0 and not self.cancelled:
+            directoryTotal = self.scanDirectory(stack.pop(), previous)
+            if directoryTotal is None:
+                continue
+            visited.append(directoryTotal)
+            stack.extend(directoryTotal.childPaths)
+            runningBytes += directoryTotal.totalBytes
+            runningFiles += directoryTotal.totalFiles
+            if monotonic() - lastProgress >= DiskUsageScanner.PROGRESS_INTERVAL:
+                lastProgress = monotonic()
+                self.messages.put({'source': 'DiskUsageScanner.scanTree', 'type': 'progress', 'path': topPath,
+                                   'bytes': runningBytes, 'files': runningFiles})
+        #   Every directory was visited after its parent, so in reverse its children are always summed first.
+        for directoryTotal in reversed(visited):
+            self.sumChildren(directoryTotal)
+        return visited[0] if len(visited) > 0 and visited[0].path == topPath else None
+
+    def sumChildren(self, directoryTotal: DirectoryTotal):
+        for childPath in directoryTotal.childPaths:
+            childTotal = self.totals.get(childPath)
+            if childTotal is not None:
+                directoryTotal.totalBytes += childTotal.totalBytes
+                directoryTotal.totalFiles += childTotal.totalFiles
+
+    def getTotal(self, path: str):
+        return self.totals.get(os.path.abspath(path))
+
+    def getChildren(self, path: str):
+        """
+        :return:    The DirectoryTotals of the subdirectories of path found by the latest scan, largest first.
+        """
+        directoryTotal = self.getTotal(path)
+        if directoryTotal is None:
+            return ()
+        children = (self.totals.get(childPath) for childPath in directoryTotal.childPaths)
+        return tuple(sorted((child for child in children if child is not None),
+                            key=lambda child: child.totalBytes, reverse=True))
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    diskUsageScanner = DiskUsageScanner(argv[1] if len(argv) > 1 else os.environ['HOME'])
+    startTime = monotonic()
+    rootTotal = diskUsageScanner.scan()
+    print("First scan:\t" + str(rootTotal) + "\tin " + str(round(monotonic() - startTime, 3)) + " seconds")
+    startTime = monotonic()
+    rootTotal = diskUsageScanner.scan(useCache=True)
+    print("Rescan:\t" + str(rootTotal) + "\tin " + str(round(monotonic() - startTime, 3)) + " seconds")
+    for childTotal in diskUsageScanner.getChildren(diskUsageScanner.rootPath):
+        print("\t" + str(childTotal))
@@ -12,20 +12,27 @@
 #               with the rest of the logs.
 #
 
-from os import walk, listdir, environ, mkdir
+from os import listdir, environ, mkdir, makedirs, stat, utime, geteuid, killpg
+from signal import SIGTERM
 from subprocess import Popen, STDOUT, PIPE
 from os.path import isfile, exists, split, isdir
-from sys import stderr
-from copy import deepcopy
+from shutil import copyfileobj, which
+from queue import Queue, Empty
+import mmap
+from sys import stderr, exc_info
 from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from array import array
 from enum import Enum
 from json import loads
 import re
-from collections import OrderedDict
-from threading import Thread
+from threading import Thread, Lock
+from fnmatch import fnmatch
+from time import time, sleep
 import logging
 import gzip, tarfile
 
+import numpy as np
 import pyudev
 
 #   The current version of watchdog requires Python 3.6 or better.
@@ -36,10 +43,10 @@ import pyudev
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from tkinter import Tk, messagebox
-
-from service.Linux import LinuxUtilities
+from service.Linux import LinuxUtilities, DeviceCommand
 from model.Paths import COMMAND_OUTPUT_FOLDER, HW_PROBE_FOLDER, HW_PROBE_TXZ
+from model.ParseCache import ParseCache
+from model.Sysfs import SysfsBlock, SysfsUSB
 
 
 PROGRAM_TITLE = "Hardware Inventory"
@@ -48,6 +55,16 @@ TESTING     = True
 DEBUG       = False
 
 
+def showWarning(title: str, message: str):
+    #   tkinter is only imported here, and not when this module is loaded, so that the model can be used on
+    #   machines with no display and no Tk installed, by the command line interface in service/Headless.py.
+    try:
+        from tkinter import messagebox
+        messagebox.showwarning(title, message)
+    except Exception:
+        print(title + ":  " + message, file=stderr)
+
+
 class ContentID:
     DEVICES         = 'Devices'
     HOST            = 'Host'
@@ -67,6 +84,7 @@ class KeyName(Enum):
     NAME        = 'name'
     TEXT        = 'text'
     SLAVE_LIST  = 'slaveList'
+    SLAVE_SOURCE    = 'slaveSource'
 
     def __str__(self):
         return self.value
@@ -146,6 +164,431 @@ class DevType(Enum):
         return self.value
 
 
+class LineStore(Sequence):
+    """
+    Immutable sequence of the text lines of a file, held as the file's raw bytes in one buffer plus an array of
+    the offsets at which each line starts.
+    A tuple of str costs over 50 bytes per line before the text itself, which adds up quickly for a maximal
+    dmesg or an ACPI dump, while the offset array costs 8.  Lines are decoded only when they are indexed or
+    iterated over.
+    Line boundaries are the same as those of str.split('\n'), including the empty line after a final newline.
+    """
+
+    ENCODING    = 'utf-8'
+
+    def __init__(self, buffer: bytes, offsets: array=None):
+        """
+        :param buffer:  The file content.  Any object supporting the buffer protocol and slicing to bytes will do.
+        :param offsets: Line start offsets previously computed by LineStore.lineOffsets() for this buffer.
+        """
+        if buffer is None:
+            raise Exception("LineStore constructor - Invalid buffer argument:  " + str(buffer))
+        if offsets is not None and not isinstance(offsets, array):
+            raise Exception("LineStore constructor - Invalid offsets argument:  " + str(offsets))
+        self.buffer     = buffer
+        if offsets is None:
+            offsets = LineStore.lineOffsets(buffer)
+        self.offsets    = offsets
+
+    #   Bytes compared for newlines at a time, which bounds the temporary arrays however large a mapped file is.
+    SCAN_BLOCK  = 16 * 1024 * 1024
+
+    @staticmethod
+    def lineOffsets(buffer):
+        """
+        The offset of the start of every line, followed by a sentinel one past the end of the buffer so that line
+        n always ends one byte, its newline, before offsets[n+1].
+        The newlines are found by numpy, a block at a time, so no Python code runs per line.
+        """
+        offsets = array('Q', [0])
+        content = np.frombuffer(buffer, dtype=np.uint8)
+        for blockStart in range(0, len(content), LineStore.SCAN_BLOCK):
+            newLines = np.flatnonzero(content[blockStart:blockStart + LineStore.SCAN_BLOCK] == 0x0A)
+            newLines += blockStart + 1
+            offsets.frombytes(newLines.astype(np.uint64, copy=False).tobytes())
+        offsets.append(len(buffer) + 1)
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self.lineAt(lineIdx) for lineIdx in range(*index.indices(len(self))))
+        if not isinstance(index, int):
+            raise TypeError("LineStore indices must be integers or slices, not " + type(index).__name__)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("LineStore index out of range")
+        return self.lineAt(index)
+
+    def __iter__(self):
+        for lineIdx in range(len(self)):
+            yield self.lineAt(lineIdx)
+
+    def lineAt(self, lineIdx: int):
+        return bytes(self.buffer[self.offsets[lineIdx]:self.offsets[lineIdx+1]-1]).decode(LineStore.ENCODING,
+                                                                                          errors='replace')
+
+    def byteSize(self):
+        return len(self.buffer) + self.offsets.itemsize * len(self.offsets)
+
+
+class MappedLineStore(LineStore):
+    """
+    LineStore over a file on disk which is memory mapped rather than read, for the ACPI dump and other logs
+    too large to be worth holding in memory.
+    The line offset index is saved next to the file, in the same name with '.idx' appended, so that reopening an
+    unchanged file needs neither a scan for newlines nor a read of the content.  Only the pages holding the lines
+    actually asked for, for instance the visible window of a ListFrame, are ever read in by the kernel.
+    """
+
+    INDEX_SUFFIX    = '.idx'
+
+    def __init__(self, filePath: str):
+        if not isinstance(filePath, str) or not isfile(filePath):
+            raise Exception("MappedLineStore constructor - Invalid filePath argument:  " + str(filePath))
+        self.filePath   = filePath
+        fileStat = stat(filePath)
+        self.fileSize   = fileStat.st_size
+        self.fileMTime  = fileStat.st_mtime_ns
+        if fileStat.st_size == 0:
+            #   A zero length file cannot be mapped.
+            buffer = b''
+        else:
+            with open(filePath, 'rb') as contentFile:
+                buffer = mmap.mmap(contentFile.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = MappedLineStore.loadIndex(filePath + MappedLineStore.INDEX_SUFFIX, fileStat)
+        if offsets is None:
+            offsets = LineStore.lineOffsets(buffer)
+            MappedLineStore.saveIndex(filePath + MappedLineStore.INDEX_SUFFIX, fileStat, offsets)
+        LineStore.__init__(self, buffer, offsets)
+
+    @staticmethod
+    def loadIndex(indexPath: str, fileStat):
+        """
+        The index file holds the size and modification time of the content file it was built for, followed by
+        the line offsets.  It is ignored if either no longer matches.
+        """
+        if not isfile(indexPath):
+            return None
+        offsets = array('Q')
+        try:
+            with open(indexPath, 'rb') as indexFile:
+                offsets.frombytes(indexFile.read())
+        except (OSError, ValueError):
+            return None
+        if len(offsets) < 4 or offsets[0] != fileStat.st_size or offsets[1] != fileStat.st_mtime_ns:
+            return None
+        return offsets[2:]
+
+    @staticmethod
+    def saveIndex(indexPath: str, fileStat, offsets: array):
+        try:
+            with open(indexPath, 'wb') as indexFile:
+                array('Q', (fileStat.st_size, fileStat.st_mtime_ns)).tofile(indexFile)
+                offsets.tofile(indexFile)
+        except OSError as exception:
+            #   The index is only an optimization, so a read-only data folder is not an error.
+            print("MappedLineStore.saveIndex - index not saved:  " + str(exception), file=stderr)
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __reduce__(self):
+        return MappedLineStore.restore, (self.filePath, self.fileSize, self.fileMTime)
+
+    @staticmethod
+    def checkFile(filePath: str, fileSize: int, fileMTime: int):
+        """
+        Raises an Exception if the file at filePath is not the one with the size and modification time given,
+        as when a later hw-probe archive has written its own ACPI logs over the ones a pickle refers to.
+        """
+        try:
+            fileStat = stat(filePath)
+        except OSError as exception:
+            raise Exception("MappedLineStore.checkFile - Mapped file is gone:  " + filePath + ":  " + str(exception))
+        if fileStat.st_size != fileSize or fileStat.st_mtime_ns != fileMTime:
+            raise Exception("MappedLineStore.checkFile - Mapped file has changed:  " + filePath)
+
+    @staticmethod
+    def restore(filePath: str, fileSize: int, fileMTime: int):
+        MappedLineStore.checkFile(filePath, fileSize, fileMTime)
+        return MappedLineStore(filePath)
+
+
+class MappedLogSource:
+    """
+    LazyLineMap source which opens a file as a MappedLineStore the first time it is looked up.  It records the
+    size and modification time of the file when it is made, and unpickling it fails if the file no longer has
+    them, so that a cached content map never shows another archive's copy of the file.
+    """
+
+    __slots__ = ('filePath', 'fileSize', 'fileMTime')
+
+    def __init__(self, filePath: str, fileSize: int=None, fileMTime: int=None):
+        if not isinstance(filePath, str) or not isfile(filePath):
+            raise Exception("MappedLogSource constructor - Invalid filePath argument:  " + str(filePath))
+        if fileSize is None or fileMTime is None:
+            fileStat = stat(filePath)
+            fileSize, fileMTime = fileStat.st_size, fileStat.st_mtime_ns
+        self.filePath   = filePath
+        self.fileSize   = fileSize
+        self.fileMTime  = fileMTime
+
+    def __call__(self):
+        return MappedLineStore(self.filePath)
+
+    def __reduce__(self):
+        return MappedLogSource.restore, (self.filePath, self.fileSize, self.fileMTime)
+
+    @staticmethod
+    def restore(filePath: str, fileSize: int, fileMTime: int):
+        MappedLineStore.checkFile(filePath, fileSize, fileMTime)
+        return MappedLogSource(filePath, fileSize, fileMTime)
+
+
+class LazyLineMap(Mapping):
+    """
+    Read-only mapping of file name to the LineStore of text lines in that file, used for the logMap and testMap
+    entries of the hw-probe content map.
+    All of the names are known when the map is constructed, but the bytes of a file are only indexed into lines
+    the first time its name is looked up.  The LineStore is then cached.
+    """
+
+    def __init__(self, sources: OrderedDict):
+        """
+        :param sources: Maps each file name to either the raw bytes of the file or a callable with no arguments
+                        which returns them or a LineStore over them.
+        """
+        if not isinstance(sources, dict):
+            raise Exception("LazyLineMap constructor - Invalid sources argument:  " + str(sources))
+        for name, source in sources.items():
+            if not isinstance(source, bytes) and not callable(source):
+                raise Exception("LazyLineMap constructor - Invalid source for " + str(name) + ":  " + str(source))
+        self.sources    = OrderedDict(sources)
+        self.lineCache  = {}
+
+    def __getitem__(self, name):
+        if name in self.lineCache:
+            return self.lineCache[name]
+        self.lineCache[name] = self.uncached(name)
+        return self.lineCache[name]
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def isDecoded(self, name):
+        return name in self.lineCache
+
+    def uncached(self, name):
+        """
+        The lines of a file without adding them to the cache, for a one time pass over every file such as a
+        snapshot write, which would otherwise leave every log indexed in memory.
+        """
+        if name in self.lineCache:
+            return self.lineCache[name]
+        source = self.sources[name]
+        if callable(source):
+            source = source()
+        if not isinstance(source, LineStore):
+            source = LineStore(source)
+        return source
+
+    @staticmethod
+    def jsonDefault(value):
+        """
+        For use as the default argument of json.dumps(), which does not otherwise serialize Mapping or LineStore
+        objects.
+        """
+        if isinstance(value, LazyLineMap):
+            return OrderedDict((name, value.uncached(name)) for name in value)
+        if isinstance(value, LineStore):
+            return list(value)
+        raise TypeError("Object of type " + type(value).__name__ + " is not JSON serializable")
+
+
+class DeferredLineStore(LineStore):
+    """
+    Stands in for one entry of a LazyLineMap under a second key of the content map, as the ACPI logs are both in
+    logMap and at the top level.  The entry is only looked up, and so only read and indexed, when its lines are
+    first used, and every attribute is then that of the LineStore the map holds.
+    """
+
+    def __init__(self, lineMap: LazyLineMap, name: str):
+        if not isinstance(lineMap, LazyLineMap) or name not in lineMap:
+            raise Exception("DeferredLineStore constructor - Invalid lineMap or name argument:  " + str(name))
+        self.lineMap    = lineMap
+        self.name       = name
+
+    def __getattr__(self, attrName):
+        #   Only reached for attributes not set on this object.  The two set in the constructor are excluded so
+        #   that an object not yet constructed, as while being unpickled, cannot recurse.
+        if attrName in ('lineMap', 'name'):
+            raise AttributeError(attrName)
+        return getattr(self.lineMap[self.name], attrName)
+
+    def isDecoded(self):
+        return self.lineMap.isDecoded(self.name)
+
+    def __reduce__(self):
+        return DeferredLineStore, (self.lineMap, self.name)
+
+
+class PrivilegeHelper(Enum):
+    AUTO        = 'auto'
+    NONE        = 'none'
+    SUDO        = 'sudo'
+    PKEXEC      = 'pkexec'
+    TERMINAL    = 'terminal'
+
+    def __str__(self):
+        return self.value
+
+
+class ProbeRunner(Thread):
+    """
+    Handle on a running hw-probe process, returned by HardwareProbe.launchProbe() as soon as the process is
+    started.
+    Each line the probe writes to stdout or stderr is posted to the events queue as it arrives, followed by a
+    final exit event, so the view can show progress by polling the queue with after() while the Tk mainloop
+    keeps running.  Event messages are dicts:
+        {'source': 'ProbeRunner.run', 'type': 'output', 'line': <str>}
+        {'source': 'ProbeRunner.run', 'type': 'exit', 'returnCode': <int>, 'cancelled': <bool>}
+        {'source': 'ProbeRunner.run', 'type': 'error', 'error': <str>}      in place of the exit event, if the
+                                                                            process could not be started or run.
+    exitCallback, if given, is called on this thread with the return code and cancelled flag after the final
+    event is posted, however the run ends, so that whatever is waiting on the probe can always stop waiting.
+    The return code is None if the probe was cancelled before it was started, or could not be started.
+    """
+
+    def __init__(self, commandList, events: Queue=None, exitCallback=None):
+        """
+        :param commandList: The command to run, or a callable with no arguments which returns it.  A callable is
+                            called on this thread, since HardwareProbe.probeCommand() may have to wait on sudo.
+        """
+        if not callable(commandList) and (not isinstance(commandList, tuple) or len(commandList) == 0):
+            raise Exception("ProbeRunner constructor - Invalid commandList argument:  " + str(commandList))
+        if events is not None and not isinstance(events, Queue):
+            raise Exception("ProbeRunner constructor - Invalid events argument:  " + str(events))
+        if exitCallback is not None and not callable(exitCallback):
+            raise Exception("ProbeRunner constructor - Invalid exitCallback argument:  " + str(exitCallback))
+        Thread.__init__(self, name="ProbeRunner", daemon=True)
+        self.commandSource  = commandList
+        self.commandList    = commandList if isinstance(commandList, tuple) else None
+        self.events         = events if events is not None else Queue()
+        self.exitCallback   = exitCallback
+        self.process        = None
+        self.cancelled      = False
+        self.returnCode     = None
+        #   Guards process and cancelled between this thread and the one calling cancel().
+        self.lock           = Lock()
+
+    @staticmethod
+    def privilegeHelper(commandList: tuple):
+        return {'sudo': PrivilegeHelper.SUDO, 'pkexec': PrivilegeHelper.PKEXEC,
+                'gnome-terminal': PrivilegeHelper.TERMINAL}.get(split(commandList[0])[-1], PrivilegeHelper.NONE)
+
+    def ownSession(self):
+        """
+        Whether the probe is started in a session of its own, so that it and every process it starts can be
+        signalled together as one process group.  Not when sudo may need to prompt on this process's terminal.
+        """
+        helper = ProbeRunner.privilegeHelper(self.commandList)
+        return helper == PrivilegeHelper.PKEXEC or (helper == PrivilegeHelper.SUDO and '-n' in self.commandList)
+
+    def run(self):
+        try:
+            if self.commandList is None:
+                self.commandList = self.commandSource()
+            with self.lock:
+                if not self.cancelled:
+                    self.process = Popen(self.commandList, stdout=PIPE, stderr=STDOUT,
+                                         start_new_session=self.ownSession())
+            if self.process is None:
+                self.events.put({'source': 'ProbeRunner.run', 'type': 'exit', 'returnCode': None,
+                                 'cancelled': True})
+                return
+            #   Reading the pipe to its end before waiting means a chatty probe can never block on a full pipe.
+            for line in self.process.stdout:
+                self.events.put({'source': 'ProbeRunner.run', 'type': 'output',
+                                 'line': line.decode('utf-8', errors='replace').rstrip('\n')})
+            self.process.stdout.close()
+            self.returnCode = self.process.wait()
+            self.events.put({'source': 'ProbeRunner.run', 'type': 'exit', 'returnCode': self.returnCode,
+                             'cancelled': self.cancelled})
+        except Exception as exception:
+            outputText = 'ProbeRunner.run - probe failed:\n'
+            for line in exc_info():
+                outputText += str(line) + '\n'
+            print(outputText, file=stderr)
+            if self.process is not None:
+                self.returnCode = self.process.poll()
+            self.events.put({'source': 'ProbeRunner.run', 'type': 'error', 'error': str(exception)})
+        finally:
+            if self.exitCallback is not None:
+                self.exitCallback(self.returnCode, self.cancelled)
+
+    def canCancel(self):
+        """
+        False when hw-probe runs in a terminal window, since gnome-terminal hands it to its server process and
+        what is started here is only the client.  The probe is then stopped by closing the window.
+        """
+        return self.commandList is None or \
+            ProbeRunner.privilegeHelper(self.commandList) != PrivilegeHelper.TERMINAL
+
+    def cancel(self):
+        """
+        Stops the probe, or keeps it from starting if the command has not been run yet.
+        hw-probe runs as root, and under pkexec, or sudo configured not to relay signals, this process may not
+        signal it.  The same helper is then used to run kill as root, on a thread of its own since pkexec may
+        ask for the password again.
+        :return:    False if the probe is not running or cannot be cancelled from here.
+        """
+        with self.lock:
+            if self.process is None:
+                if not self.canCancel():
+                    return False
+                self.cancelled = True
+                return True
+            if self.process.poll() is not None or not self.canCancel():
+                return False
+            self.cancelled = True
+        try:
+            if self.ownSession():
+                killpg(self.process.pid, SIGTERM)
+            else:
+                #   sudo relays the signal to hw-probe.
+                self.process.terminate()
+            return True
+        except PermissionError:
+            pass
+        Thread(target=self.killAsRoot, name="ProbeRunner.killAsRoot", daemon=True).start()
+        return True
+
+    def killAsRoot(self):
+        helper = ProbeRunner.privilegeHelper(self.commandList)
+        helperList = ['pkexec'] if helper == PrivilegeHelper.PKEXEC else ['sudo', '-n']
+        target = '-' + str(self.process.pid) if self.ownSession() else str(self.process.pid)
+        try:
+            output = Popen(helperList + ['kill', '-TERM', '--', target], stdout=PIPE, stderr=STDOUT).communicate()[0]
+            if self.process.poll() is None and len(output) > 0:
+                print("ProbeRunner.killAsRoot - " + output.decode('utf-8', errors='replace'), file=stderr)
+        except OSError as exception:
+            print("ProbeRunner.killAsRoot - kill not run:  " + str(exception), file=stderr)
+
+    def isRunning(self):
+        return self.is_alive()
+
+
 class HardwareProbe:
     """
     Uses launch of Linux process to run hw_probe and collect information, including logs, for analysis.
@@ -187,38 +630,133 @@ class HardwareProbe:
                                 HwProbeOption.SAVE_TO_DIR.value[KeyName.TEXT],
                                 COMMAND_OUTPUT_FOLDER)
 
-    class FileSystemChangeHandler(FileSystemEventHandler):
+    class ProbeCompletionHandler(FileSystemEventHandler):
+        """
+        Decides when hw-probe has finished writing its archive.  The archive is not trusted on the first
+        event seen for it, since hw-probe creates the file and then writes it for some time.  It is checked when
+        the writer closes it (inotify close-write, where watchdog reports it), and again when the probe
+        process exits, which covers platforms and watchdog versions with no close events.  An archive is
+        complete when its size is stable and it holds a whole xz stream, header magic to footer magic.
+        The callback is called once per launch, with:
+            {'source': 'ProbeCompletionHandler.archiveComplete', 'type': 'complete', 'path': <str>}
+            {'source': 'ProbeCompletionHandler.probeExited', 'type': 'noArchive', 'returnCode': <int>}
+            {'source': 'ProbeCompletionHandler.probeExited', 'type': 'cancelled'}
+            {'source': 'ProbeCompletionHandler.probeExited', 'type': 'notStarted'}
+        """
 
-        def __init__(self, outputObserver, callback):
+        ARCHIVE_PATTERN = 'hw.info*.txz'
+        XZ_HEADER_MAGIC = b'\xfd7zXZ\x00'
+        XZ_FOOTER_MAGIC = b'YZ'
+        #   Seconds between the two size readings taken to confirm that no one is still writing the archive.
+        STABLE_INTERVAL = 0.25
+
+        def __init__(self, watchFolder: str, callback, startTime: float=None):
+            if not isinstance(watchFolder, str) or not isdir(watchFolder):
+                raise Exception("ProbeCompletionHandler constructor - Invalid watchFolder argument:  " +
+                                str(watchFolder))
+            if not callable(callback):
+                raise Exception("ProbeCompletionHandler constructor - Invalid callback argument:  " + str(callback))
             FileSystemEventHandler.__init__(self)
-            self.callback = callback
-            self.outputObserver = outputObserver
+            self.watchFolder    = watchFolder
+            self.callback       = callback
+            #   Archives left from earlier runs are older than this and are not mistaken for this run's output.
+            self.startTime      = startTime if startTime is not None else time()
+            self.candidates     = set()
+            self.completed      = False
+            self.lock           = Lock()
+
+        @staticmethod
+        def isArchiveName(path: str):
+            return fnmatch(split(path)[-1], HardwareProbe.ProbeCompletionHandler.ARCHIVE_PATTERN)
+
+        @staticmethod
+        def archivesSince(folder: str, startTime: float):
+            """
+            :return:    The paths of the hw-probe archives in folder modified at or after startTime, newest first.
+            """
+            archives = []
+            for fileName in listdir(folder):
+                path = folder + '/' + fileName
+                if HardwareProbe.ProbeCompletionHandler.isArchiveName(path) and isfile(path) and \
+                        stat(path).st_mtime >= startTime:
+                    archives.append(path)
+            return sorted(archives, key=lambda path: stat(path).st_mtime, reverse=True)
+
+        @staticmethod
+        def isComplete(path: str):
+            try:
+                firstSize = stat(path).st_size
+                if firstSize < len(HardwareProbe.ProbeCompletionHandler.XZ_HEADER_MAGIC) + \
+                        len(HardwareProbe.ProbeCompletionHandler.XZ_FOOTER_MAGIC):
+                    return False
+                sleep(HardwareProbe.ProbeCompletionHandler.STABLE_INTERVAL)
+                if stat(path).st_size != firstSize:
+                    return False
+                with open(path, 'rb') as archiveFile:
+                    header = archiveFile.read(len(HardwareProbe.ProbeCompletionHandler.XZ_HEADER_MAGIC))
+                    archiveFile.seek(-len(HardwareProbe.ProbeCompletionHandler.XZ_FOOTER_MAGIC), 2)
+                    footer = archiveFile.read()
+            except OSError:
+                return False
+            return header == HardwareProbe.ProbeCompletionHandler.XZ_HEADER_MAGIC and \
+                footer == HardwareProbe.ProbeCompletionHandler.XZ_FOOTER_MAGIC
+
+        def noteEvent(self, path: str):
+            if self.isArchiveName(path):
+                with self.lock:
+                    self.candidates.add(path)
 
         def on_created(self, event):
-            if TESTING:
-                #   <FileCreatedEvent:  event_type  = created,
-                #                       src_path    = '/home/keithcollins/PycharmProjects/fileHero/data/commandOutput/hw.info.2022-09-05.txz',
-                #                       is_directory= False>
-                for key, value in event.__dict__.items():
-                    print("\t" + key + ":\t" + value)
-            self.outputObserver.stop()
-            if self.callback is not None and callable(self.callback):
-                if '_src_path' in event.__dict__:
-                    self.callback({'source': "FileSystemChangeHandler.on_created", 'type': 'created', 'path': event._src_path})
-                else:
-                    self.callback({'source': "FileSystemChangeHandler.on_created", 'type': 'created', 'path': "UNRECOGNIZED"})
-            else:
-                raise Exception("FileSystemChangeHandler.on_created - callback argument is not callable")
-
+            if not event.is_directory:
+                self.noteEvent(event.src_path)
 
         def on_modified(self, event):
-            self.outputObserver.stop()
+            if not event.is_directory:
+                self.noteEvent(event.src_path)
 
         def on_moved(self, event):
-            self.outputObserver.stop()
-
-        def on_deleted(self, event):
-            self.outputObserver.stop()
+            if not event.is_directory:
+                self.noteEvent(event.dest_path)
+                self.archiveComplete(event.dest_path)
+
+        def on_closed(self, event):
+            if not event.is_directory:
+                self.archiveComplete(event.src_path)
+
+        def archiveComplete(self, path: str):
+            if not self.isArchiveName(path):
+                return False
+            with self.lock:
+                if self.completed or not self.isComplete(path):
+                    return self.completed
+                self.completed = True
+            self.callback({'source': 'ProbeCompletionHandler.archiveComplete', 'type': 'complete', 'path': path})
+            return True
+
+        def probeExited(self, returnCode: int, cancelled: bool):
+            if cancelled or returnCode is None:
+                with self.lock:
+                    self.completed = True
+                self.callback({'source': 'ProbeCompletionHandler.probeExited',
+                               'type': 'cancelled' if cancelled else 'notStarted'})
+                return
+            with self.lock:
+                candidates = set(self.candidates)
+            candidates.update(self.archivesSince(self.watchFolder, self.startTime))
+            #   Newest first, in case more than one archive was written during the run.
+            for path in sorted((path for path in candidates if isfile(path)),
+                               key=lambda path: stat(path).st_mtime, reverse=True):
+                if self.archiveComplete(path):
+                    return
+            with self.lock:
+                if self.completed:
+                    return
+                self.completed = True
+            self.callback({'source': 'ProbeCompletionHandler.probeExited', 'type': 'noArchive',
+                           'returnCode': returnCode})
+
+    #   Logs which are written out to the logs folder and memory mapped instead of being held in memory.
+    MAPPED_LOGS     = ("acpidump", 'acpidump_decoded')
 
     def __init__(self, hwProbeArgs: tuple=None, **keyWordArguments):
         """
@@ -245,110 +783,225 @@ class HardwareProbe:
             self.hwProbeArgs = hwProbeArgs
         self.hardwareMap    = OrderedDict()
         self.hardwareMap['summary']     = 'Nothing Yet'
+        self.parseCache     = ParseCache()
+        self.outputObserver = None
+        #   Results of automatically loading the archive written by a launched probe, for the view to poll:
+        #       {'source': 'HardwareProbe.messageReceiver', 'type': 'loaded', 'path': <str>,
+        #           'hwProbeContentMap': <OrderedDict>}
+        #       {'source': 'HardwareProbe.messageReceiver', 'type': 'failed', 'error': <str>}
+        self.archiveEvents  = Queue()
 
     def launchProbe(self):
         #   Set up file system monitor to listen for changes in: COMMAND_OUTPUT_FOLDER))
-        #   It will call self.messageReceiver() when it detects a change.
+        #   It will call self.messageReceiver() once the probe's archive is complete, which then loads it.
         if not isdir(COMMAND_OUTPUT_FOLDER):
             mkdir(COMMAND_OUTPUT_FOLDER)
+        self.stopObserver()
+        completionHandler = HardwareProbe.ProbeCompletionHandler(COMMAND_OUTPUT_FOLDER, self.messageReceiver)
         self.outputObserver = Observer()
-        eventHandler = HardwareProbe.FileSystemChangeHandler(self.outputObserver, self.messageReceiver)
-        self.outputObserver.schedule(event_handler=eventHandler,
+        self.outputObserver.schedule(event_handler=completionHandler,
                                        path=COMMAND_OUTPUT_FOLDER,
                                        recursive=False)
         self.outputObserver.start()
-        #   self.outputObserver.join()
-        self.probeThread = Thread(target=self.runProbe, args=(self.hwProbeArgs,))
-        self.probeThread.start()
-        self.probeThread.join()
+        #   Deciding how to run hw-probe as root may wait on sudo, so it is done on the runner's thread.
+        hwProbeArgs = self.hwProbeArgs
+        self.probeRunner = ProbeRunner(lambda: HardwareProbe.probeCommand(hwProbeArgs),
+                                       exitCallback=completionHandler.probeExited)
+        self.probeRunner.start()
+        return self.probeRunner
+
+    @staticmethod
+    def probeCommand(hwProbeArgs: tuple, privilegeHelper: PrivilegeHelper=PrivilegeHelper.AUTO):
+        """
+        hw-probe must run as root.  With PrivilegeHelper.AUTO, when it can be run without a password prompt on
+        the console, or pkexec can prompt for one graphically, its output comes back through a pipe and can be
+        shown as progress.  Otherwise it is run in a terminal to get the password for sudo, and the output is
+        only visible there.
+        NONE runs hw-probe as is, SUDO lets sudo prompt on the controlling terminal, and PKEXEC and TERMINAL
+        force the corresponding AUTO choice.
+        AUTO runs sudo to find out whether it needs a password, so call this off the Tk thread, as ProbeRunner does.
+        """
+        if not isinstance(privilegeHelper, PrivilegeHelper):
+            raise Exception("HardwareProbe.probeCommand - Invalid privilegeHelper argument:  " + str(privilegeHelper))
+        hwProbe = which('hw-probe')
+        if hwProbe is None:
+            hwProbe = 'hw-probe'
+        if privilegeHelper == PrivilegeHelper.NONE or (privilegeHelper == PrivilegeHelper.AUTO and geteuid() == 0):
+            return tuple([hwProbe] + list(hwProbeArgs))
+        if privilegeHelper == PrivilegeHelper.SUDO:
+            return tuple(['sudo', hwProbe] + list(hwProbeArgs))
+        if privilegeHelper == PrivilegeHelper.AUTO and which('sudo') is not None and \
+                Popen(('sudo', '-n', 'true'), stdout=PIPE, stderr=STDOUT).wait() == 0:
+            return tuple(['sudo', '-n', hwProbe] + list(hwProbeArgs))
+        if privilegeHelper == PrivilegeHelper.PKEXEC or \
+                (privilegeHelper == PrivilegeHelper.AUTO and which('pkexec') is not None):
+            return tuple(['pkexec', hwProbe] + list(hwProbeArgs))
+        #   --wait keeps gnome-terminal from returning until the probe has finished.
+        return tuple(['gnome-terminal', '--wait', "--geometry=120x25+200+100", "--"] +
+                     ['sudo', 'hw-probe'] + list(hwProbeArgs))
 
     def runProbe(self, hwProbeArgs):
-        #   Run command in terminal to get password to run in sudo mode,
-        #   then read in resulting 'hw.info.2022-09-05.txz' file to:
+        #   Run hw-probe to completion, then read in resulting 'hw.info.txz' file to:
         #       unzip, traverse, and parse for content.
-        #   Default command:    gnome-terminal -- sudo python3 -q
-        commandList = tuple(['gnome-terminal', "--geometry=120x25+200+100", "--"] +
-                            ['sudo', 'hw-probe'] + list(hwProbeArgs))
-
-        process = Popen(commandList, stdout=PIPE, stderr=STDOUT)
-        process.wait()
+        process = Popen(HardwareProbe.probeCommand(hwProbeArgs), stdout=PIPE, stderr=STDOUT)
         output, errorMessge = process.communicate()
         outputLines = output.decode('utf-8').split('\n')
         if DEBUG:
             print("\nResponse to:\t" + HardwareProbe.DEFAULT_COMMAND)
             for line in outputLines:
                 print('\t' + line)
-
+        return outputLines
 
     def loadLatest(self):
-        hwProbeFilePath     = HW_PROBE_TXZ
+        return self.loadArchive(HW_PROBE_TXZ)
+
+    def loadArchive(self, hwProbeFilePath: str):
+        """
+        Reads the archive, warning the user if it cannot be.  For use on the Tk thread or from the command line.
+        """
+        contentMap, error = self.readContentMap(hwProbeFilePath)
+        if error is not None:
+            showWarning("hw-probe File Not Found", error)
+        return contentMap
+
+    def readContentMap(self, hwProbeFilePath: str):
+        """
+        Reads the archive without showing anything, so it can be called on any thread.
+        :return:    (content map, None), or (None, a message saying why the archive could not be read).
+        """
         try:
             if not tarfile.is_tarfile(hwProbeFilePath):
-                messagebox.showwarning("hw-probe File Not Found", "hw-probe output file\n" + hwProbeFilePath + "\n" +
-                                       "Is not present.")
-        except:
-            messagebox.showwarning("hw-probe File Not Found", "hw-probe output file\n" + hwProbeFilePath + "\n" +
-                                   "Is not present.")
-            return
-        if tarfile.is_tarfile(hwProbeFilePath):
-            tarfileHwProbe = tarfile.open(hwProbeFilePath, 'r:xz')
-            tarfileHwProbe.extractall(path=COMMAND_OUTPUT_FOLDER)
-            self.hwProbeContentMap = OrderedDict()
-
-            for dirName, subdirList, fileList in walk(HW_PROBE_FOLDER, topdown=True):
-                if dirName == HW_PROBE_FOLDER:
-                    #   host and devices files should be present in this folder
-                    if isfile(HW_PROBE_FOLDER + '/host'):
-                        self.hwProbeContentMap['hostFileLines'] = tuple(open(HW_PROBE_FOLDER + '/host', 'r').
-                                                                        read().split('\n'))
-                    if isfile(HW_PROBE_FOLDER + '/devices'):
-                        self.hwProbeContentMap['devicesLines'] = tuple(open(HW_PROBE_FOLDER + '/devices', 'r').
-                                                                       read().split('\n'))
-                elif dirName == HW_PROBE_FOLDER + '/logs':
-                    #   read in whatever log files are present
-                    self.hwProbeContentMap['logMap'] = OrderedDict()
-                    tempMap = {}
-                    fNameList = []
-                    for fname in fileList:
-                        tempMap[fname] = tuple(open(HW_PROBE_FOLDER + '/logs/' + fname).read().split('\n'))
-                        fNameList.append(fname)
-                    fNameList.sort()
-                    for fname in fNameList:
-                        self.hwProbeContentMap['logMap'][fname] = tempMap[fname]
-                        if fname == "acpidump" or fname == 'acpidump_decoded':             # ACPI Dump
-                            self.hwProbeContentMap[fname] = tempMap[fname]
-
-                elif dirName == HW_PROBE_FOLDER + '/tests':
+                return None, "hw-probe output file\n" + hwProbeFilePath + "\n" + "Is not present."
+        except Exception:
+            return None, "hw-probe output file\n" + hwProbeFilePath + "\n" + "Is not present."
+        try:
+            #   An archive which has already been loaded once is not decompressed and parsed again.
+            archiveDigest = ParseCache.digest(hwProbeFilePath)
+            self.hwProbeContentMap = self.parseCache.load(archiveDigest)
+            if self.hwProbeContentMap is None:
+                self.hwProbeContentMap = HardwareProbe.readArchive(hwProbeFilePath)
+                self.parseCache.store(archiveDigest, self.hwProbeContentMap)
+        except Exception as exception:
+            return None, "hw-probe output file\n" + hwProbeFilePath + "\n" + "Could not be read:  " + str(exception)
+        return self.hwProbeContentMap, None
+
+    @staticmethod
+    def readArchive(hwProbeFilePath: str, mappedLogFolder: str=HW_PROBE_FOLDER + '/logs'):
+        """
+        Build the content map for a hw-probe output archive in a single streaming pass over its members.
+        Each regular file is decompressed once and routed directly into the map by its path inside the archive,
+        so nothing is extracted to disk and nothing is read back.
+        The archive root folder is 'hw.info', containing the host and devices files and the logs and tests folders.
+        The exception is the logs named in MAPPED_LOGS, which are copied to mappedLogFolder and opened as
+        MappedLineStores.
+        :param hwProbeFilePath: Path of the xz compressed tar file written by hw-probe.
+        :param mappedLogFolder: Folder to write the MAPPED_LOGS files to.
+        :return:                OrderedDict with 'hostFileLines', 'devicesLines', 'logMap' and 'testMap' for
+                                whichever of these are present in the archive.  logMap and testMap are LazyLineMaps,
+                                so only the logs and tests actually viewed are ever split into lines.
+        """
+        if not isinstance(hwProbeFilePath, str):
+            raise Exception("HardwareProbe.readArchive - Invalid hwProbeFilePath argument:  " + str(hwProbeFilePath))
+        hostFileLines   = None
+        devicesLines    = None
+        logMap  = None
+        testMap = None
+        #   'r|xz' is the stream mode of tarfile, so members are visited strictly in archive order without seeking.
+        with tarfile.open(hwProbeFilePath, 'r|xz') as tarfileHwProbe:
+            for member in tarfileHwProbe:
+                if not member.isfile():
+                    continue
+                pathParts = member.name.strip('/').split('/')[1:]
+                if pathParts == ['host']:
+                    hostFileLines = HardwareProbe.memberLines(tarfileHwProbe, member)
+                elif pathParts == ['devices']:
+                    devicesLines = HardwareProbe.memberLines(tarfileHwProbe, member)
+                elif len(pathParts) == 2 and pathParts[0] == 'logs':
+                    if logMap is None:
+                        logMap = {}
+                    if pathParts[1] in HardwareProbe.MAPPED_LOGS:
+                        logMap[pathParts[1]] = MappedLogSource(HardwareProbe.memberToFile(tarfileHwProbe, member,
+                                                                                          mappedLogFolder))
+                    else:
+                        logMap[pathParts[1]] = HardwareProbe.memberBytes(tarfileHwProbe, member)
+                elif len(pathParts) == 2 and pathParts[0] == 'tests':
                     #   The format of this folder is the same as that of the logs folder
-                    self.hwProbeContentMap['testMap'] = OrderedDict()
-                    tempMap = {}
-                    fnameList = []
-                    for fName in fileList:
-                        tempMap[fName]  = tuple(open(HW_PROBE_FOLDER + '/tests/' + fName).read().split('\n'))
-                        fnameList.append(fName)
-                    fnameList.sort()
-                    for fname in fnameList:
-                        self.hwProbeContentMap['testMap'][fname] = tempMap[fname]
-
-            return self.hwProbeContentMap
-        else:
-            messagebox.showwarning("hw-probe File Not Found", "hw-probe output file\n" + hwProbeFilePath + "\n" +
-                                                              "Is not present.")
+                    if testMap is None:
+                        testMap = {}
+                    testMap[pathParts[1]] = HardwareProbe.memberBytes(tarfileHwProbe, member)
+
+        hwProbeContentMap = OrderedDict()
+        if hostFileLines is not None:
+            hwProbeContentMap['hostFileLines'] = hostFileLines
+        if devicesLines is not None:
+            hwProbeContentMap['devicesLines'] = devicesLines
+        if logMap is not None:
+            hwProbeContentMap['logMap'] = LazyLineMap(OrderedDict((fname, logMap[fname]) for fname in sorted(logMap)))
+            for fname in HardwareProbe.MAPPED_LOGS:                             # ACPI Dump
+                if fname in logMap:
+                    #   These each have their own notebook page, but are only indexed when the page is shown.
+                    hwProbeContentMap[fname] = DeferredLineStore(hwProbeContentMap['logMap'], fname)
+        if testMap is not None:
+            hwProbeContentMap['testMap'] = LazyLineMap(OrderedDict((fname, testMap[fname]) for fname in sorted(testMap)))
+        return hwProbeContentMap
+
+    @staticmethod
+    def memberLines(tarFile: tarfile.TarFile, member: tarfile.TarInfo):
+        return tuple(HardwareProbe.memberBytes(tarFile, member).decode('utf-8', errors='replace').split('\n'))
+
+    @staticmethod
+    def memberBytes(tarFile: tarfile.TarFile, member: tarfile.TarInfo):
+        memberFile = tarFile.extractfile(member)
+        if memberFile is None:
+            return b''
+        return memberFile.read()
+
+    @staticmethod
+    def memberToFile(tarFile: tarfile.TarFile, member: tarfile.TarInfo, folder: str):
+        """
+        Copy one member to folder in fixed size chunks, giving the file the member's modification time.
+        A file already there with the same size and modification time is assumed to be this member from an
+        earlier load and is left as is, which also keeps its saved line index valid.
+        :return:    The path of the file.
+        """
+        filePath = folder + '/' + split(member.name)[-1]
+        if isfile(filePath):
+            fileStat = stat(filePath)
+            if fileStat.st_size == member.size and int(fileStat.st_mtime) == int(member.mtime):
+                return filePath
+        makedirs(folder, exist_ok=True)
+        memberFile = tarFile.extractfile(member)
+        with open(filePath, 'wb') as outputFile:
+            if memberFile is not None:
+                copyfileobj(memberFile, outputFile)
+        utime(filePath, (member.mtime, member.mtime))
+        return filePath
+
+    def stopObserver(self):
+        #   Not joined, since this is also called from the observer's own thread.
+        if self.outputObserver is not None:
+            self.outputObserver.stop()
+            self.outputObserver = None
 
     def messageReceiver(self, message: dict):
         if 'source' in message:
-            if message['source'] == "FileSystemChangeHandler.on_created":
-                if 'type' in message and message['type'] == 'created':
-                    if 'path' in message and isfile(message['path']):
-                        pathParts = split(message['path'])
-                        if pathParts[-1] == 'hw.info.2022-09-05.txz':
-                            if tarfile.is_tarfile(message['path']):
-                                hwProbeOutput = tarfile.open(message['path'], 'r:xz')
-                                hwContent = hwProbeOutput.list()
-                                print("Type of hw.info.2022-09-05.txz content:\t" + str(type(hwContent)))
-                            else:
-                                raise Exception("HardwareProbe.messageReceiver - hw-probe output file format not recognized:  " + \
-                                                message['path'])
+            if message['source'] == 'ProbeCompletionHandler.archiveComplete':
+                self.stopObserver()
+                #   Runs on the observer or probe runner thread, so the GUI keeps running while the archive loads.
+                #   Nothing may be shown from here, so an error goes to the view with the result.
+                contentMap, error = self.readContentMap(message['path'])
+                if contentMap is not None:
+                    self.archiveEvents.put({'source': 'HardwareProbe.messageReceiver', 'type': 'loaded',
+                                            'path': message['path'], 'hwProbeContentMap': contentMap})
+                else:
+                    self.archiveEvents.put({'source': 'HardwareProbe.messageReceiver', 'type': 'failed',
+                                            'error': error})
+            elif message['source'] == 'ProbeCompletionHandler.probeExited':
+                self.stopObserver()
+                if message['type'] == 'noArchive':
+                    self.archiveEvents.put({'source': 'HardwareProbe.messageReceiver', 'type': 'failed',
+                                            'error': "hw-probe exited with code " + str(message['returnCode']) +
+                                                     " without writing an archive"})
 
     def list(self):
         print("Results of HardwareProbe:")
@@ -359,6 +1012,13 @@ class HardwareProbe:
 class BlockSet:
 
     class BlockDev:
+        """
+        One block device.  The fields reference the values in the lsblk record rather than copying them, and
+        parents and children link the device into the disk, partition and holder tree BlockSet builds.
+        """
+
+        __slots__ = ('record', 'name', 'maj_min', 'rm', 'size', 'ro', 'type', 'mountPoints', 'parents', 'children')
+
         def __init__(self, record: dict):
             """
             Populates fields of this descriptor object using a line of the output of the command:
@@ -369,28 +1029,22 @@ class BlockSet:
             """
             if record is None or not isinstance(record, dict):
                 raise Exception('BlockSet.BlockDev constructor - invalid record argument:\t' + str(record))
-            self.record = deepcopy(record)
-            self.name = None
-            self.maj_min    = None
-            self.rm     = None
-            self.size   = None
-            self.ro     = None
-            self.type   = None
-            self.mountPoints = None
-            if 'name' in self.record:
-                self.name = self.record['name']
-            if 'maj:min' in self.record:
-                self.maj_min = self.record['maj:min']
-            if 'rm' in self.record:
-                self.rm = self.record['rm']
-            if 'size' in self.record:
-                self.size = self.record['size']
-            if 'ro' in self.record:
-                self.ro = self.record['ro']
-            if 'type' in self.record:
-                self.type = self.record['type']
-            if 'mountpoints' in self.record:
-                self.mountPoints = tuple(self.record['mountpoints'])
+            self.record     = record
+            self.name       = record.get('name')
+            self.maj_min    = record.get('maj:min')
+            self.rm         = record.get('rm')
+            self.size       = record.get('size')
+            self.ro         = record.get('ro')
+            self.type       = record.get('type')
+            #   lsblk before version 2.37 has a single 'mountpoint'.
+            if 'mountpoints' in record:
+                self.mountPoints = tuple(record['mountpoints'])
+            elif 'mountpoint' in record:
+                self.mountPoints = (record['mountpoint'],)
+            else:
+                self.mountPoints = None
+            self.parents    = []
+            self.children   = []
 
         def getAttribute(self, attrName: str):
             if attrName in self.record:
@@ -400,25 +1054,79 @@ class BlockSet:
         def list(self):
             pass
 
-    def __init__(self, lsblkOutput: str):
+    def __init__(self, lsblkOutput):
         """
         If there are ever fields other than 'blockdevices' in the json map returned by lsblk, they are not
         recorded by this class (yet).
+        :param lsblkOutput:     The text output of 'lsblk --all --json --bytes', or the same map already parsed,
+                                as SysfsBlock.getBlockJSON() returns it.
         """
-
-        self.toolOutput = lsblkOutput
+        if isinstance(lsblkOutput, str):
+            self.toolOutput = lsblkOutput
+            self.blockJSON = loads(self.toolOutput)
+        elif isinstance(lsblkOutput, dict):
+            self.toolOutput = None
+            self.blockJSON = lsblkOutput
+        else:
+            raise Exception("BlockSet constructor - Invalid lsblkOutput argument:  " + str(lsblkOutput))
         if DEBUG:
             print(self.toolOutput)
-        self.blockJSON = loads(self.toolOutput)
+        #   Key is the row index and value is the BlockDev of each top level device.
         self.blockMap = OrderedDict()
+        #   Every device in the tree, once each, however many devices it is built on.
+        self.nameIndex      = OrderedDict()
+        self.majMinIndex    = {}
+        self.mountIndex     = {}
+        self.diskJSON       = None
+        self.partitionJSON  = None
         if DEBUG:
             print(self.blockJSON)
         if 'blockdevices' in self.blockJSON:
             self.blockJSON['blockdevices'] = tuple(self.blockJSON['blockdevices'])
             rowIdx = 0
             for blockDevice in self.blockJSON['blockdevices']:
-                self.blockMap[rowIdx]   = BlockSet.BlockDev(blockDevice)
+                self.blockMap[rowIdx]   = self.addDevice(blockDevice, None)
                 rowIdx += 1
+            self.diskJSON = tuple(device for device in self.blockJSON['blockdevices'] if device.get('type') == 'disk')
+            self.partitionJSON = tuple(subDisk for device in self.diskJSON for subDisk in device.get('children', ())
+                                       if subDisk.get('type') == 'part')
+
+    def addDevice(self, record: dict, parent):
+        """
+        Adds the device in record and everything nested under it to the tree and the indexes.  lsblk repeats a
+        holder, e.g. a RAID or multipath device, under each device it is built on, so a name already in the tree
+        is only linked to its new parent.
+        """
+        name = record.get('name')
+        blockDev = self.nameIndex.get(name) if name is not None else None
+        if blockDev is None:
+            blockDev = BlockSet.BlockDev(record)
+            if name is not None:
+                self.nameIndex[name] = blockDev
+            if blockDev.maj_min is not None:
+                self.majMinIndex[blockDev.maj_min] = blockDev
+            for mountPoint in blockDev.mountPoints or ():
+                if mountPoint is not None:
+                    self.mountIndex[mountPoint] = blockDev
+            for childRecord in record.get('children', ()):
+                self.addDevice(childRecord, blockDev)
+        if parent is not None and blockDev not in parent.children:
+            parent.children.append(blockDev)
+            blockDev.parents.append(parent)
+        return blockDev
+
+    @staticmethod
+    def fromSysfs():
+        """
+        BlockSet read from sysfs and procfs, without running lsblk.  lsblk is only run if sysfs and
+        /proc/partitions are both unreadable.
+        """
+        try:
+            return BlockSet(SysfsBlock().getBlockJSON())
+        except Exception as exception:
+            if DEBUG:
+                print("BlockSet.fromSysfs - falling back to lsblk:\t" + str(exception), file=stderr)
+            return BlockSet(LinuxUtilities.runCachedTool(DeviceCommand.LSBLK))
 
     def getBlockJSON(self):
         return self.blockJSON
@@ -429,78 +1137,78 @@ class BlockSet:
         return None
 
     def getDiskJSON(self):
-        diskJSON = []
-        if 'blockdevices' in self.blockJSON:
-            for device in self.blockJSON['blockdevices']:
-                if device['type'] == 'disk':
-                    diskJSON.append(device)
-            return tuple(diskJSON)
-        return None
+        return self.diskJSON
 
     def getPartitionJSON(self):
-        partitionJSON = []
-        if 'blockdevices' in self.blockJSON:
-            for device in self.blockJSON['blockdevices']:
-                if 'type' in device and device['type'] == 'disk':
-                    if 'children' in device:        #   Assumes that 'children' is either a list or a tuple
-                        for subDisk in device['children']:
-                            if 'type' in subDisk and subDisk['type'] == 'part':
-                                partitionJSON.append(subDisk)
-            return tuple(partitionJSON)
-        return None
+        return self.partitionJSON
 
     def getBlockMap(self):
         return self.blockMap
 
+    def getByName(self, name: str):
+        return self.nameIndex.get(name)
+
+    def getByMajMin(self, majMin: str):
+        return self.majMinIndex.get(majMin)
+
+    def getByMountPoint(self, mountPoint: str):
+        return self.mountIndex.get(mountPoint)
+
     def getToolOutput(self):
         return self.toolOutput
 
 
 class BlkIdSet:
+    """
+    Parses the output of either "blkid -o full" or "blkid -o export" in one pass, into BlockIds keyed by device
+    path with secondary indexes by UUID and PARTUUID, for joining with BlockSet's devices.
+    """
 
     class BlockIdAttr(Enum):
+        DEVNAME     = 'DEVNAME'
         BLOCK_SIZE  = 'BLOCK_SIZE'
         LABEL       = 'LABEL'
         UUID        = 'UUID'
         TYPE        = 'TYPE'
         PARTUUID    = 'PARTUUID'
+        PARTLABEL   = 'PARTLABEL'
+        SEC_TYPE    = 'SEC_TYPE'
+        PTUUID      = 'PTUUID'
+        PTTYPE      = 'PTTYPE'
 
         def __str__(self):
             return self.value
 
+    #   "blkid -o full":    /dev/mapper/vg-root: LABEL="A=B" UUID="..." TYPE="ext4"
+    #   Values are in double quotes, with any double quote or backslash in them escaped by a backslash.  The device
+    #   path is matched lazily up to the colon which is followed by nothing but well formed attributes, so a colon
+    #   in the path itself does not end it.
+    FULL_LINE       = re.compile(r'^(?P<devPath>.+?):(?P<attributes>(?:\s+[A-Z_]+="(?:[^"\\]|\\.)*")*)\s*$')
+    FULL_ATTRIBUTE  = re.compile(r'([A-Z_]+)="((?:[^"\\]|\\.)*)"')
+    #   "blkid -o export":  one NAME=value per line, a blank line between devices, and shell escaping in values.
+    EXPORT_LINE     = re.compile(r'^([A-Z_]+)=(.*)$')
+    ESCAPE          = re.compile(r'\\(.)')
+
     class BlockId:
-        def __init__(self, textRecord: str):
+        def __init__(self, attributes: dict):
             """
-            Populates fields of this descriptor object using a line of the output of the command:
-                "blkid -o full"
-            Assumes the output format of Linux Mint / Ubuntu, which also is the format for all Debian
-            derivatives.
-            :param textRecord:  A line of output from the blkid command.
+            Populates fields of this descriptor object from the attributes blkid reports for one device.
+            :param attributes:  Map of blkid attribute name to value, including DEVNAME, the device path.
             """
-            if not isinstance(textRecord, str):
-                raise Exception('BlockId constructor - invalid textRecord argument:\t' + str(textRecord))
-            self.label      = None
-            self.devPath    = None
+            if not isinstance(attributes, dict):
+                raise Exception('BlockId constructor - invalid attributes argument:\t' + str(attributes))
+            self.attributes = attributes
+            self.devPath    = attributes.get(str(BlkIdSet.BlockIdAttr.DEVNAME))
+            self.label      = attributes.get(str(BlkIdSet.BlockIdAttr.LABEL))
             self.blockSize  = None
-            self.uuid       = None
-            self.type       = None
-            self.partUUID   = None
-            self.devPath, attributetext  = textRecord.split(':')
-            #   Since value can have spaces in them a simple solit() will not work.
-            #   However, all values are in double quotes, so scanning for these will work.
-            attributes = attributetext.split('" ')
-            for attribute in attributes:
-                name, value = attribute.split('=')
-                if str(BlkIdSet.BlockIdAttr.BLOCK_SIZE) in name:
-                    self.blockSize = int(value.strip('"'))
-                elif str(BlkIdSet.BlockIdAttr.TYPE) in name:
-                    self.type = value.strip('"')
-                elif str(BlkIdSet.BlockIdAttr.UUID) in name:
-                    self.uuid = value.strip('"')
-                elif str(BlkIdSet.BlockIdAttr.LABEL) in name:
-                    self.label  = value.strip('"')
-                elif str(BlkIdSet.BlockIdAttr.PARTUUID) in name:
-                    self.partUUID  = value.strip('"')
+            self.uuid       = attributes.get(str(BlkIdSet.BlockIdAttr.UUID))
+            self.type       = attributes.get(str(BlkIdSet.BlockIdAttr.TYPE))
+            self.partUUID   = attributes.get(str(BlkIdSet.BlockIdAttr.PARTUUID))
+            if str(BlkIdSet.BlockIdAttr.BLOCK_SIZE) in attributes:
+                self.blockSize = int(attributes[str(BlkIdSet.BlockIdAttr.BLOCK_SIZE)])
+
+        def getAttribute(self, attrName: str):
+            return self.attributes.get(attrName)
 
         def list(self):
             print("\nBlockId:")
@@ -515,48 +1223,148 @@ class BlkIdSet:
         if not isinstance(blkIdTextOutput, str):
             raise Exception('BlkIdSet constructor - invalid blkIdTextOutput argument:\t' + str(blkIdTextOutput))
         self.lines  = blkIdTextOutput.split('\n')
-        self.blockIdList = []
-        for line in self.lines:
-            if line.strip() != '':
-                self.blockIdList.append(BlkIdSet.BlockId(line))
-        self.blockIdList = tuple(self.blockIdList)
+        #   Key is the device path.
+        self.blockIdMap     = OrderedDict()
+        self.uuidIndex      = {}
+        self.partUUIDIndex  = {}
+        for attributes in BlkIdSet.parse(self.lines):
+            self.addBlockId(BlkIdSet.BlockId(attributes))
+        self.blockIdList = tuple(self.blockIdMap.values())
+
+    @staticmethod
+    def unescape(value: str):
+        return BlkIdSet.ESCAPE.sub(r'\1', value)
+
+    @staticmethod
+    def parse(lines):
+        """
+        Generator of one attribute map per device, from the lines of either output format.
+        """
+        attributes = None
+        for line in lines:
+            if line.strip() == '':
+                #   Blank lines only separate devices in export output.
+                if attributes is not None:
+                    yield attributes
+                    attributes = None
+                continue
+            match = BlkIdSet.EXPORT_LINE.match(line)
+            if match is not None:
+                if match.group(1) == str(BlkIdSet.BlockIdAttr.DEVNAME) and attributes is not None:
+                    yield attributes
+                    attributes = {}
+                elif attributes is None:
+                    attributes = {}
+                attributes[match.group(1)] = BlkIdSet.unescape(match.group(2))
+                continue
+            match = BlkIdSet.FULL_LINE.match(line)
+            if match is None:
+                raise Exception('BlkIdSet.parse - line not recognized as blkid output:\t' + line)
+            fullAttributes = {str(BlkIdSet.BlockIdAttr.DEVNAME): match.group('devPath')}
+            for name, value in BlkIdSet.FULL_ATTRIBUTE.findall(match.group('attributes')):
+                fullAttributes[name] = BlkIdSet.unescape(value)
+            yield fullAttributes
+        if attributes is not None:
+            yield attributes
+
+    def addBlockId(self, blockId):
+        self.blockIdMap[blockId.devPath] = blockId
+        if blockId.uuid is not None:
+            self.uuidIndex[blockId.uuid] = blockId
+        if blockId.partUUID is not None:
+            self.partUUIDIndex[blockId.partUUID] = blockId
+
+    def getByDevPath(self, devPath: str):
+        return self.blockIdMap.get(devPath)
+
+    def getByUUID(self, uuid: str):
+        return self.uuidIndex.get(uuid)
+
+    def getByPartUUID(self, partUUID: str):
+        return self.partUUIDIndex.get(partUUID)
 
 
 class USBset:
+    """
+    Parses the output of "lsusb --verbose" in one linear pass, one USBRecord per device.
+    """
+
+    #   Bus 001 Device 003: ID 0c45:6321 Microdia HP Webcam-101
+    BUS_LINE        = re.compile(r'^Bus (\d+) Device (\d+): ID ([0-9a-fA-F]{4}):([0-9a-fA-F]{4})\s?(.*)$')
+    #   Attribute names are separated from their values by two or more spaces.  The first word of the rest is the
+    #   value, and anything after it describes the value.
+    ATTRIBUTE_LINE  = re.compile(r'^(\S+(?: \S+)*?)\s{2,}(\S+)(?:\s+(.*?))?\s*$')
 
     class USBRecord:
-        def __init__(self, textLines: tuple):
+
+        #   Device Descriptor fields with decimal integer values.  idVendor and idProduct are hexadecimal, and the
+        #   bcd fields are left as the version strings lsusb prints.
+        INTEGER_FIELDS  = ('bLength', 'bDescriptorType', 'bDeviceClass', 'bDeviceSubClass', 'bDeviceProtocol',
+                           'bMaxPacketSize0', 'iManufacturer', 'iProduct', 'iSerial', 'bNumConfigurations')
+        HEX_FIELDS      = ('idVendor', 'idProduct')
+
+        def __init__(self, textLines: tuple, descriptorTree: list=None):
+            """
+            :param textLines:   The lines lsusb prints for one device, starting with its 'Bus ... Device ...: ID'
+                                line.
+            :param descriptorTree:  A descriptor tree already decoded, as SysfsUSB.getDevices() gives it, in which
+                                case textLines need only hold the 'Bus' line.
+            Each line is a node in descriptorTree, nested under the nearest preceding line indented less than it.
+            Nodes are dicts:
+                {'name': <str>, 'value': <str or None>, 'description': <str or None>, 'children': [<node>, ...]}
+            Headings such as 'Configuration Descriptor:' have no value, and their descriptors are their children.
+            """
             if not isinstance(textLines, tuple):
                 raise Exception('USBset.USBRecord constructor - invalid textLines argument:\t' + str(textLines))
+            if descriptorTree is not None and not isinstance(descriptorTree, list):
+                raise Exception('USBset.USBRecord constructor - invalid descriptorTree argument:\t' +
+                                str(descriptorTree))
+            self.busNumber      = None
+            self.deviceNumber   = None
+            self.vendorName     = None
             self.lineAnalysis = []
+            self.descriptorTree = []
+            #   (indent, node) for each line which could still have lines nested under it.
+            nesting = []
             for line in textLines:
                 if not isinstance(line, str):
                     raise Exception('USBset.USBRecord constructor - invalid line in textLines argument:\t' + str(line))
-                if len(line.strip()) == 0:
+                text = line.strip()
+                if len(text) == 0:
+                    continue
+                busMatch = USBset.BUS_LINE.match(line)
+                if busMatch is not None:
+                    self.busNumber      = int(busMatch.group(1))
+                    self.deviceNumber   = int(busMatch.group(2))
+                    self.vendorName     = busMatch.group(5)
                     continue
-                count   = 0
-                idx     = 0
-                while line[idx] == ' ':
-                    count += 1
-                    idx += 1
-                self.lineAnalysis.append({
-                    'leadingSpaces': count,
-                    'text': line
-                })
-
-                #   Still need to detect when block headings happen.
-                #   They are on separate lines, are indented two spaces less than their content lines,
-                #       appear to have standard phrases for names and all end in a colon.
-                if count % 2 == 0:
-                    self.lineAnalysis[-1]['name-value'] = True
-                    lineParts   = re.split(r'\s{2,}', line.strip())
-                    if len(lineParts) > 1:
-                        self.lineAnalysis[-1]['attrName'] = lineParts[0]
-                        self.lineAnalysis[-1]['attrValue']  = lineParts[1]
-                    if len(lineParts) > 2:
-                        self.lineAnalysis[-1]['description']  = lineParts[2]
+                count = len(line) - len(line.lstrip(' '))
+                analysis = {'leadingSpaces': count, 'text': line}
+                node = {'name': text, 'value': None, 'description': None, 'children': []}
+                attributeMatch = USBset.ATTRIBUTE_LINE.match(text)
+                if attributeMatch is not None and not text.endswith(':'):
+                    #   Some headings carry a value too, as in 'Device Status:     0x0001'.
+                    node['name']        = attributeMatch.group(1).rstrip(':')
+                    node['value']       = attributeMatch.group(2)
+                    node['description'] = attributeMatch.group(3) if attributeMatch.group(3) else None
+                    analysis['name-value']  = True
+                    analysis['attrName']    = node['name']
+                    analysis['attrValue']   = node['value']
+                    if node['description'] is not None:
+                        analysis['description'] = node['description']
                 else:
-                    self.lineAnalysis[-1]['name-value'] = False
+                    node['name'] = text.rstrip(':')
+                    analysis['name-value']  = False
+                self.lineAnalysis.append(analysis)
+                while len(nesting) > 0 and nesting[-1][0] >= count:
+                    nesting.pop()
+                if len(nesting) > 0:
+                    nesting[-1][1]['children'].append(node)
+                else:
+                    self.descriptorTree.append(node)
+                nesting.append((count, node))
+            if descriptorTree is not None:
+                self.descriptorTree = descriptorTree
 
             if DEBUG:
                 print("")
@@ -578,12 +1386,13 @@ class USBset:
             self.iSerial            = None
             self.bNumConfigurations = None
 
+            #   The text lsusb prints after each value, e.g. the vendor name after idVendor.
             self.fieldDescription = OrderedDict({
                 'bLength' : None,
                 'bDescriptorType' : None,
                 'bcdUSB' : None,
                 'bDeviceClass' : None,
-                'bDeviceSubClass ' : None,
+                'bDeviceSubClass' : None,
                 'bDeviceProtocol' : None,
                 'bMaxPacketSize0' : None,
                 'idVendor' : None,
@@ -591,7 +1400,7 @@ class USBset:
                 'bcdDevice' : None,
                 'iManufacturer' : None,
                 'iProduct' : None,
-                'iSerial ' : None,
+                'iSerial' : None,
                 'bNumConfigurations' : None
             })
             """
@@ -610,9 +1419,46 @@ class USBset:
               iSerial                 0 
               bNumConfigurations      1
             """
+            deviceDescriptor = self.getDescriptor('Device Descriptor')
+            if deviceDescriptor is not None:
+                for node in deviceDescriptor['children']:
+                    if node['name'] in self.fieldDescription and node['value'] is not None:
+                        value = node['value']
+                        try:
+                            if node['name'] in USBset.USBRecord.INTEGER_FIELDS:
+                                value = int(value)
+                            elif node['name'] in USBset.USBRecord.HEX_FIELDS:
+                                value = int(value, 16)
+                        except ValueError:
+                            pass
+                        setattr(self, node['name'], value)
+                        self.fieldDescription[node['name']] = node['description']
+
+        def getDescriptor(self, name: str):
+            """
+            The first top level node with the given name, e.g. 'Device Descriptor', 'Hub Descriptor', or
+            'Device Status'.
+            """
+            for node in self.descriptorTree:
+                if node['name'] == name:
+                    return node
+            return None
 
-
-            #   count spaces at the start to determine nesting level in the attribute lists.from
+    @staticmethod
+    def records(lines):
+        """
+        Generator of one USBRecord per device in the lines of lsusb --verbose output.
+        """
+        blockLines = None
+        for line in lines:
+            if line.startswith('Bus ') and USBset.BUS_LINE.match(line) is not None:
+                if blockLines is not None:
+                    yield USBset.USBRecord(tuple(blockLines))
+                blockLines = [line]
+            elif blockLines is not None:
+                blockLines.append(line)
+        if blockLines is not None:
+            yield USBset.USBRecord(tuple(blockLines))
 
     def __init__(self, lsUSBoutput: str):
         """
@@ -628,67 +1474,389 @@ class USBset:
             print("\nlsusb Output:")
             print("\n" + lsUSBoutput.strip('\t'))       #   this shows that only space characters are used for tree
                                                         #   format of output.  This parse will fail otherwise.
-        #   Divide into individual device record text
         self.outputLines = lsUSBoutput.split('\n')
-        lineIdx = 0
-        inBlock = False
-        blockLines = []
-        self.usbRecords = []
-        while lineIdx < len(self.outputLines)-1:
-            if self.outputLines[lineIdx].upper().startswith("BUS") and \
-                    self.outputLines[lineIdx+1].upper().startswith("DEVICE DESCRIPTOR:"):
-                inBlock = True
-                lineIdx += 2
-                while inBlock and lineIdx < len(self.outputLines):
-                    if self.outputLines[lineIdx].upper().startswith("BUS") and \
-                            self.outputLines[lineIdx + 1].upper().startswith("DEVICE DESCRIPTOR:"):
-                        inBlock = False
-                        self.usbRecords.append(USBset.USBRecord(tuple(blockLines)))
-                    else:
-                        blockLines.append(self.outputLines[lineIdx])
-                        lineIdx += 1
-            lineIdx += 1
+        self.usbRecords = list(USBset.records(self.outputLines))
+
+    @staticmethod
+    def fromSysfs():
+        """
+        USBset decoded from the descriptors in sysfs, without running lsusb or needing root.  lsusb is only run if
+        /sys/bus/usb/devices is not readable.
+        """
+        try:
+            devices = SysfsUSB().getDevices()
+        except Exception as exception:
+            if DEBUG:
+                print("USBset.fromSysfs - falling back to lsusb:\t" + str(exception), file=stderr)
+            return USBset(LinuxUtilities.runCachedTool(DeviceCommand.LSUSB))
+        usbSet = USBset('')
+        usbSet.usbRecords = [USBset.USBRecord((device['busLine'],), device['descriptorTree']) for device in devices]
+        return usbSet
+
+
+class DeviceRecord:
+    """
+    What DeviceIndex keeps of one udev device: its identity, the fields it is indexed by, and its udev properties.
+    """
+
+    __slots__ = ('sysPath', 'sysName', 'subsystem', 'devType', 'driver', 'devNode', 'properties')
+
+    def __init__(self, device):
+        self.sysPath    = device.sys_path
+        self.sysName    = device.sys_name
+        self.subsystem  = device.subsystem
+        self.devType    = device.device_type
+        self.driver     = device.driver
+        self.devNode    = device.device_node
+        self.properties = dict(device.properties)
+
+    def get(self, propertyName: str, default=None):
+        return self.properties.get(propertyName, default)
+
+    def __str__(self):
+        return "DeviceRecord('" + self.sysPath + "')"
+
+
+class DeviceIndex:
+    """
+    In memory snapshot of every udev device, enumerated once and then kept current by a udev monitor which applies
+    each add, change, move, and remove event as it arrives.  Records are keyed by sys_path, with secondary indexes by
+    subsystem, devtype, driver, device node, and (subsystem, sys_name), so queries cost a dict lookup rather than
+    an enumeration.
+    Listeners are called on the monitor's thread with (action, DeviceRecord) after each event is applied.  For a
+    remove, the record is the one which was removed.
+    """
+
+    sharedIndex = None
+    sharedLock  = Lock()
+
+    @staticmethod
+    def shared():
+        """
+        The DeviceIndex shared by DeviceList, BlockPartitions, and any other reader, created on first use.
+        """
+        with DeviceIndex.sharedLock:
+            if DeviceIndex.sharedIndex is None:
+                DeviceIndex.sharedIndex = DeviceIndex()
+            return DeviceIndex.sharedIndex
+
+    def __init__(self, context=None, monitor: bool=True):
+        self.context    = context if context is not None else pyudev.Context()
+        self.lock       = Lock()
+        self.records    = OrderedDict()
+        self.subsystemIndex = {}
+        self.devTypeIndex   = {}
+        self.driverIndex    = {}
+        self.devNodeIndex   = {}
+        self.nameIndex      = {}
+        self.listeners  = []
+        self.observer   = None
+        #   Advances with every event applied, so a reader can tell whether anything changed since it last looked.
+        self.generation = 0
+        with self.lock:
+            #   The monitor is started first so nothing is missed; events wait on the lock until the enumeration is in.
+            if monitor:
+                self.startMonitor()
+            for device in self.context.list_devices():
+                self.addRecord(DeviceRecord(device))
+
+    def startMonitor(self):
+        udevMonitor = pyudev.Monitor.from_netlink(self.context)
+        self.observer = pyudev.MonitorObserver(udevMonitor, callback=self.deviceEvent, name='DeviceIndex')
+        self.observer.daemon = True
+        self.observer.start()
+
+    def stopMonitor(self):
+        if self.observer is not None:
+            self.observer.send_stop()
+            self.observer = None
+
+    @staticmethod
+    def indexAdd(index: dict, key, sysPath: str):
+        if key is not None:
+            index.setdefault(key, OrderedDict())[sysPath] = None
+
+    @staticmethod
+    def indexRemove(index: dict, key, sysPath: str):
+        if key is not None and key in index:
+            index[key].pop(sysPath, None)
+            if len(index[key]) == 0:
+                del index[key]
+
+    def addRecord(self, record: DeviceRecord):
+        if record.sysPath in self.records:
+            self.removeRecord(record.sysPath)
+        self.records[record.sysPath] = record
+        DeviceIndex.indexAdd(self.subsystemIndex, record.subsystem, record.sysPath)
+        DeviceIndex.indexAdd(self.devTypeIndex, record.devType, record.sysPath)
+        DeviceIndex.indexAdd(self.driverIndex, record.driver, record.sysPath)
+        if record.devNode is not None:
+            self.devNodeIndex[record.devNode] = record.sysPath
+        self.nameIndex[(record.subsystem, record.sysName)] = record.sysPath
+
+    def removeRecord(self, sysPath: str):
+        record = self.records.pop(sysPath, None)
+        if record is None:
+            return None
+        DeviceIndex.indexRemove(self.subsystemIndex, record.subsystem, sysPath)
+        DeviceIndex.indexRemove(self.devTypeIndex, record.devType, sysPath)
+        DeviceIndex.indexRemove(self.driverIndex, record.driver, sysPath)
+        if self.devNodeIndex.get(record.devNode) == sysPath:
+            del self.devNodeIndex[record.devNode]
+        if self.nameIndex.get((record.subsystem, record.sysName)) == sysPath:
+            del self.nameIndex[(record.subsystem, record.sysName)]
+        return record
+
+    def deviceEvent(self, device):
+        action = device.action
+        with self.lock:
+            if action == 'remove':
+                record = self.removeRecord(device.sys_path)
+                if record is None:
+                    return
+            else:
+                if action == 'move' and 'DEVPATH_OLD' in device.properties:
+                    self.removeRecord('/sys' + device.properties['DEVPATH_OLD'])
+                record = DeviceRecord(device)
+                self.addRecord(record)
+            self.generation += 1
+            listeners = tuple(self.listeners)
+        for listener in listeners:
+            #   An exception escaping here would end the monitor's thread, and the index would stop updating.
+            try:
+                listener(action, record)
+            except Exception:
+                outputText = 'DeviceIndex.deviceEvent - listener ' + str(listener) + ' failed on ' + action + \
+                             ' ' + record.sysPath + ':\n'
+                for line in exc_info():
+                    outputText += str(line) + '\n'
+                print(outputText, file=stderr)
+
+    def addListener(self, listener):
+        if not callable(listener):
+            raise Exception("DeviceIndex.addListener - Invalid listener argument:  " + str(listener))
+        with self.lock:
+            self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def lookup(self, index: dict, key):
+        with self.lock:
+            return tuple(self.records[sysPath] for sysPath in index.get(key, ()))
+
+    def get(self, sysPath: str):
+        with self.lock:
+            return self.records.get(sysPath)
+
+    def getAll(self):
+        with self.lock:
+            return tuple(self.records.values())
+
+    def getBySubsystem(self, subsystem: str, devType: str=None):
+        with self.lock:
+            sysPaths = self.subsystemIndex.get(subsystem, ())
+            if devType is not None:
+                typePaths = self.devTypeIndex.get(devType, {})
+                sysPaths = [sysPath for sysPath in sysPaths if sysPath in typePaths]
+            return tuple(self.records[sysPath] for sysPath in sysPaths)
+
+    def getByDevType(self, devType: str):
+        return self.lookup(self.devTypeIndex, devType)
+
+    def getByDriver(self, driver: str):
+        return self.lookup(self.driverIndex, driver)
+
+    def getByDevNode(self, devNode: str):
+        with self.lock:
+            sysPath = self.devNodeIndex.get(devNode)
+            return self.records[sysPath] if sysPath is not None else None
+
+    def getByName(self, subsystem: str, sysName: str):
+        with self.lock:
+            sysPath = self.nameIndex.get((subsystem, sysName))
+            return self.records[sysPath] if sysPath is not None else None
+
+
+class DeltaType(Enum):
+    ADDED       = 'added'
+    REMOVED     = 'removed'
+    CHANGED     = 'changed'
+
+    def __str__(self):
+        return self.value
+
+
+class DeviceDelta:
+    """
+    One change to the set of devices: what happened, what kind of device it happened to, and the device's record,
+    which for a removal is the record as it was before the device went away.
+    """
+
+    __slots__ = ('deltaType', 'deviceType', 'record')
+
+    def __init__(self, deltaType: DeltaType, deviceType: DeviceType, record: DeviceRecord):
+        if not isinstance(deltaType, DeltaType):
+            raise Exception("DeviceDelta constructor - Invalid deltaType argument:  " + str(deltaType))
+        self.deltaType  = deltaType
+        self.deviceType = deviceType
+        self.record     = record
+
+    def getKey(self):
+        return self.record.sysPath
+
+    def __str__(self):
+        return str(self.deltaType) + ' ' + str(self.deviceType) + ' ' + self.record.sysPath
+
+
+class HotplugEventStream:
+    """
+    Turns the udev events DeviceIndex applies into DeviceDeltas for storage and USB devices, and queues them for a
+    Tk view to collect in batches with nextBatch() from an after() callback, since Tk widgets may only be touched on
+    the thread running mainloop.
+    """
+
+    SUBSYSTEMS      = ('block', 'usb')
+    #   Block devices which come and go with no hardware behind them, e.g. the loop devices of snap packages.
+    VIRTUAL_PREFIXES = ('loop', 'ram', 'zram')
+    MAX_BATCH       = 200
+    ACTION_DELTAS   = {'add': DeltaType.ADDED, 'remove': DeltaType.REMOVED}
+
+    def __init__(self, deviceIndex: DeviceIndex=None, subsystems: tuple=SUBSYSTEMS):
+        if deviceIndex is not None and not isinstance(deviceIndex, DeviceIndex):
+            raise Exception("HotplugEventStream constructor - Invalid deviceIndex argument:  " + str(deviceIndex))
+        self.deviceIndex    = deviceIndex if deviceIndex is not None else DeviceIndex.shared()
+        self.subsystems     = subsystems
+        self.deltas         = Queue()
+        self.running        = False
+
+    @staticmethod
+    def deviceType(record: DeviceRecord):
+        """
+        The DeviceType of the udev device, or None if it is not one which is shown as a device, such as a USB
+        interface or hub port.
+        """
+        if record.subsystem == 'block':
+            if record.sysName.startswith('mmcblk') or record.get('ID_DRIVE_FLASH_SD') == '1' or \
+                    record.get('ID_DRIVE_MEDIA_FLASH_SD') == '1':
+                return DeviceType.SD_MSD
+            if record.get('ID_CDROM') == '1':
+                return DeviceType.CD_DVD
+            if record.devType == 'partition':
+                return DeviceType.PARTITION
+            if record.get('ID_BUS') == 'usb':
+                return DeviceType.USB
+            return DeviceType.HDD
+        if record.subsystem == 'usb' and record.devType == 'usb_device':
+            return DeviceType.USB
+        return None
+
+    @staticmethod
+    def describe(record: DeviceRecord):
+        vendor = record.get('ID_VENDOR', record.get('ID_VENDOR_FROM_DATABASE', ''))
+        model = record.get('ID_MODEL', record.get('ID_MODEL_FROM_DATABASE', ''))
+        description = (vendor + ' ' + model).replace('_', ' ').strip()
+        if record.devNode is not None:
+            description += '  (' + record.devNode + ')'
+        return description.strip()
+
+    def start(self):
+        if not self.running:
+            self.deviceIndex.addListener(self.deviceEvent)
+            self.running = True
+
+    def stop(self):
+        if self.running:
+            self.deviceIndex.removeListener(self.deviceEvent)
+            self.running = False
+
+    def deviceEvent(self, action: str, record: DeviceRecord):
+        if record.subsystem not in self.subsystems or record.sysName.startswith(HotplugEventStream.VIRTUAL_PREFIXES):
+            return
+        deviceType = HotplugEventStream.deviceType(record)
+        if deviceType is not None:
+            self.deltas.put(DeviceDelta(HotplugEventStream.ACTION_DELTAS.get(action, DeltaType.CHANGED),
+                                        deviceType, record))
+
+    def nextBatch(self, maxCount: int=MAX_BATCH):
+        """
+        Takes up to maxCount deltas off the queue without waiting, and reduces them to at most one per device, so a
+        device plugged in and pulled out between two polls costs the view nothing.
+        :return:    A list of DeviceDeltas, in the order their devices first appeared in the batch.
+        """
+        deltas = []
+        while len(deltas) < maxCount:
+            try:
+                deltas.append(self.deltas.get_nowait())
+            except Empty:
+                break
+        return HotplugEventStream.coalesce(deltas)
+
+    @staticmethod
+    def coalesce(deltas: list):
+        deltaMap = OrderedDict()
+        for delta in deltas:
+            key = delta.getKey()
+            previous = deltaMap.get(key)
+            if previous is None:
+                deltaMap[key] = delta
+            elif previous.deltaType == DeltaType.ADDED and delta.deltaType == DeltaType.REMOVED:
+                del deltaMap[key]
+            elif previous.deltaType == DeltaType.ADDED:
+                deltaMap[key] = DeviceDelta(DeltaType.ADDED, delta.deviceType, delta.record)
+            elif previous.deltaType == DeltaType.REMOVED and delta.deltaType == DeltaType.ADDED:
+                deltaMap[key] = DeviceDelta(DeltaType.CHANGED, delta.deviceType, delta.record)
+            else:
+                deltaMap[key] = delta
+        return list(deltaMap.values())
 
 
 class DeviceList:
 
-    def __init__(self):
-        self.context = pyudev.Context()
-        self.devices = self.context.list_devices()
+    def __init__(self, deviceIndex: DeviceIndex=None):
+        self.deviceIndex = deviceIndex if deviceIndex is not None else DeviceIndex.shared()
 
     def getDevices(self):
-        return self.devices
+        return self.deviceIndex.getAll()
 
     def list(self):
         print("\nDeviceList:")
-        for device in self.devices:
+        for device in self.getDevices():
             print("\t" + str(device))
 
 
 class BlockPartitions:
 
-    def __init__(self):
-        self.context = pyudev.Context()
-        self.devices = self.context.list_devices(subsystem='block', DEVTYPE='partition')
+    def __init__(self, deviceIndex: DeviceIndex=None):
+        self.deviceIndex = deviceIndex if deviceIndex is not None else DeviceIndex.shared()
+
+    def getDevices(self):
+        return self.deviceIndex.getBySubsystem('block', 'partition')
 
     def getByName(self, name: str):
         """
-        Retrieve a Device object for the named block device.
+        Retrieve a Device object for the named block device.  The index finds its sys_path without enumerating.
         :param name: e.g. sda, sdb, sdc
         :return:
         """
-        return pyudev.Devices.from_name(self.context, 'block', name)
+        record = self.deviceIndex.getByName('block', name)
+        if record is None:
+            #   Raises DeviceNotFoundByNameError, as this always has for a name which is not a block device.
+            return pyudev.Devices.from_name(self.deviceIndex.context, 'block', name)
+        return pyudev.Devices.from_sys_path(self.deviceIndex.context, record.sysPath)
 
     def list(self):
         print("\nBlock Partition List:")
-        for device in self.devices:
+        for device in self.getDevices():
             print("\t" + str(device))
 
 
 class BlockFileSystems:
 
     def __init__(self):
-        self.inventoryJSON = loads(LinuxUtilities.runLinuxTool(LinuxUtilities.DeviceCommand.LSBLK_FS.value))
+        self.inventoryJSON = loads(LinuxUtilities.runCachedTool(DeviceCommand.LSBLK_FS))
 
 
 def ExitProgram():
@@ -698,6 +1866,7 @@ def ExitProgram():
 
 
 if __name__ == '__main__':
+    from tkinter import Tk, messagebox
 
     for name, value in environ.items():
         print(name + ':\t' + value)
@@ -0,0 +1,126 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         model/ParseCache.py
+#   Date Started:   October 16, 2026
+#   Purpose:        Content addressed cache of parsed hw-probe archives.
+#   Development:
+#       Entries are pickles of the hw-probe content map, named by the SHA-256 digest of the archive they were
+#       parsed from, so loading the same archive twice only decompresses and parses it once.
+#       Least recently used entries are deleted once the folder grows past its size limit.  An entry's
+#       modification time is its last use.
+#
+
+from os import listdir, makedirs, remove, replace, stat, utime
+from os.path import isfile, isdir
+from sys import stderr
+from hashlib import sha256
+import pickle
+
+from model.Paths import PARSE_CACHE_FOLDER
+
+
+PROGRAM_TITLE = "Parse Cache"
+INSTALLING  = False
+TESTING     = True
+DEBUG       = False
+
+
+class ParseCache:
+
+    DEFAULT_MAX_BYTES   = 256 * 1024 * 1024
+    ENTRY_SUFFIX        = '.pickle'
+    READ_CHUNK_SIZE     = 1024 * 1024
+
+    def __init__(self, cacheFolder: str=PARSE_CACHE_FOLDER, maxBytes: int=DEFAULT_MAX_BYTES):
+        if not isinstance(cacheFolder, str):
+            raise Exception("ParseCache constructor - Invalid cacheFolder argument:  " + str(cacheFolder))
+        if not isinstance(maxBytes, int) or maxBytes < 0:
+            raise Exception("ParseCache constructor - Invalid maxBytes argument:  " + str(maxBytes))
+        self.cacheFolder    = cacheFolder
+        self.maxBytes       = maxBytes
+
+    @staticmethod
+    def digest(filePath: str):
+        fileHash = sha256()
+        with open(filePath, 'rb') as archiveFile:
+            chunk = archiveFile.read(ParseCache.READ_CHUNK_SIZE)
+            while chunk:
+                fileHash.update(chunk)
+                chunk = archiveFile.read(ParseCache.READ_CHUNK_SIZE)
+        return fileHash.hexdigest()
+
+    def entryPath(self, digest: str):
+        return self.cacheFolder + '/' + digest + ParseCache.ENTRY_SUFFIX
+
+    def load(self, digest: str):
+        """
+        :param digest:  SHA-256 hex digest of the archive, as returned by ParseCache.digest().
+        :return:        The content map stored for the archive, or None if there is none or it cannot be read.
+        """
+        entryPath = self.entryPath(digest)
+        if not isfile(entryPath):
+            return None
+        try:
+            with open(entryPath, 'rb') as entryFile:
+                contentMap = pickle.load(entryFile)
+            utime(entryPath)
+        except Exception as exception:
+            #   A truncated entry, or one referring to a mapped log file which has since been deleted or overwritten
+            #   by another archive's copy.
+            print("ParseCache.load - discarding unreadable entry " + entryPath + ":  " + str(exception), file=stderr)
+            self.discard(digest)
+            return None
+        if DEBUG:
+            print("ParseCache.load - hit:\t" + digest)
+        return contentMap
+
+    def store(self, digest: str, contentMap: dict):
+        """
+        Pickles contentMap as it is, so a log which has already been looked up is stored with its line index as
+        well as its raw bytes.  HardwareProbe.loadArchive() stores a map straight from readArchive(), which looks
+        up none of them.
+        """
+        makedirs(self.cacheFolder, exist_ok=True)
+        entryPath = self.entryPath(digest)
+        try:
+            with open(entryPath + '.part', 'wb') as entryFile:
+                pickle.dump(contentMap, entryFile, protocol=pickle.HIGHEST_PROTOCOL)
+            #   Readers never see a partly written entry.
+            replace(entryPath + '.part', entryPath)
+        except Exception as exception:
+            print("ParseCache.store - entry not stored:  " + str(exception), file=stderr)
+            return False
+        self.evict()
+        return True
+
+    def discard(self, digest: str):
+        if isfile(self.entryPath(digest)):
+            remove(self.entryPath(digest))
+
+    def evict(self):
+        """
+        Delete least recently used entries until the total size of the cache is within maxBytes.
+        """
+        if not isdir(self.cacheFolder):
+            return
+        entries = []
+        totalBytes = 0
+        for fileName in listdir(self.cacheFolder):
+            if fileName.endswith(ParseCache.ENTRY_SUFFIX):
+                entryStat = stat(self.cacheFolder + '/' + fileName)
+                entries.append((entryStat.st_mtime_ns, entryStat.st_size, fileName))
+                totalBytes += entryStat.st_size
+        entries.sort()
+        for lastUsed, size, fileName in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            remove(self.cacheFolder + '/' + fileName)
+            totalBytes -= size
+            if DEBUG:
+                print("ParseCache.evict - removed:\t" + fileName)
+
+
+if __name__ == '__main__':
+    print('ParseCache.py RUNNING')
@@ -22,12 +22,16 @@ BASE_LOG_FOLDER                 = '/var/log'
 INSTALLATION_FOLDER                 = USER_HOME + '/gearboxmd-0.0.1/src/gearboxmd'
 #   INSTALLATION_FOLDER                 = USER_HOME + '/gearboxmd/src/gearboxmd'
 TEMP_DATA_FOLDER                    = INSTALLATION_FOLDER + '/data/temp'
+PARSE_CACHE_FOLDER                  = TEMP_DATA_FOLDER + '/parseCache'
 COMMAND_OUTPUT_FOLDER               = INSTALLATION_FOLDER + '/data/commandOutput'
+DATABASE_FOLDER                     = INSTALLATION_FOLDER + '/data/database'
+TIME_SERIES_FOLDER                  = DATABASE_FOLDER + '/timeSeries'
 
 HW_PROBE_FOLDER                     = COMMAND_OUTPUT_FOLDER + '/hw.info'
 HW_PROBE_TXZ                        = COMMAND_OUTPUT_FOLDER + '/hw.info.txz'
 HW_PROBE_JSONFILE                   = COMMAND_OUTPUT_FOLDER + '/hw.info.json'
 HW_PROBE_ZIPFILE                    = COMMAND_OUTPUT_FOLDER + '/hw.info.gzip'
+HW_PROBE_SNAPSHOT                   = COMMAND_OUTPUT_FOLDER + '/hw.info.gbs'
 
 DOCUMENTATION_FOLDER                = INSTALLATION_FOLDER + '/documentation'
 IMAGES_FOLDER                       = INSTALLATION_FOLDER + "/graphics"
@@ -9,23 +9,28 @@
 #       2022-09-97:
 #           Appropriate polling schedules should be available for information that can change and change in which
 #           is relevant to system performance evaluation or for issue diagnostics.
+#       2026-10-16:
+#           PollingScheduler runs the collectors for such information, each on its own schedule, from one thread.
+#           ProcessSampler finds the processes using the most CPU, memory, and disk I/O.
 #
 
 from collections import OrderedDict
 from enum import Enum
-
-from tkinter import Tk, messagebox, OptionMenu, Label, LabelFrame, Listbox, \
-                    SINGLE, MULTIPLE, EXTENDED, END, \
-                    FLAT, RIDGE, GROOVE, SUNKEN, RAISED, \
-                    N, S, E, W, X, Y, BOTH
+from threading import Thread, Condition
+from time import monotonic, time
+from math import ceil
+from functools import partial
+from sys import exc_info, stderr
+import heapq
 
 import psutil
 from psutil import pids, pid_exists, process_iter, disk_usage, disk_partitions, disk_io_counters, \
     virtual_memory, swap_memory, cpu_stats, net_if_stats, net_if_addrs, getloadavg, wait_procs, sensors_fans, \
     sensors_battery, sensors_temperatures, boot_time, cpu_times, cpu_percent, cpu_count, cpu_freq, cpu_times_percent, \
     net_connections, net_io_counters, users, version_info
+from psutil import Process, NoSuchProcess, AccessDenied, ZombieProcess
 import platform
-from os import environ
+from os import environ, sysconf
 from datetime import datetime
 
 """
@@ -39,6 +44,325 @@ DEBUG       = False
 
 PSUTIL_SERVICES = ()
 
+
+class Collector:
+    """
+    A psutil function to be called every interval seconds by a PollingScheduler.
+    """
+
+    __slots__ = ('name', 'function', 'interval', 'nextDue', 'active')
+
+    def __init__(self, name: str, function, interval: float):
+        if not isinstance(name, str):
+            raise Exception("Collector constructor - Invalid name argument:  " + str(name))
+        if not callable(function):
+            raise Exception("Collector constructor - Invalid function argument:  " + str(function))
+        if not isinstance(interval, (int, float)) or interval <= 0:
+            raise Exception("Collector constructor - Invalid interval argument:  " + str(interval))
+        self.name       = name
+        self.function   = function
+        self.interval   = float(interval)
+        self.nextDue    = None
+        #   Cleared when the collector is removed, so its entry still in the heap is dropped when it comes up.
+        self.active     = True
+
+
+class PollingScheduler(Thread):
+    """
+    Runs collectors at their own intervals on one background thread.
+    Every due time is the scheduler's start time plus a whole number of the collector's intervals, and intervals
+    are rounded to a multiple of TICK, so collectors whose schedules line up fall due at exactly the same moment and
+    are run in one wakeup.  Due times never drift, since each is computed from the start rather than from when the
+    last run happened to finish, and runs missed while the machine was suspended or overloaded are skipped rather
+    than made up.  Between wakeups the thread sleeps in Condition.wait(), so it costs nothing while idle.
+    Subscribers are called on the scheduler's thread, once per wakeup, with an OrderedDict of collector name to
+    (timeStamp, value) for the collectors which ran.  A Tk view should subscribe with a Queue's put() and poll
+    the queue with after().
+    """
+
+    #   Seconds.  Intervals are rounded to this, so that schedules can coincide.
+    TICK                = 0.1
+
+    DEFAULT_INTERVALS   = OrderedDict((
+        ('cpu_times_percent',   (cpu_times_percent, 1.0)),
+        ('cpu_stats',           (cpu_stats, 5.0)),
+        ('cpu_freq',            (cpu_freq, 5.0)),
+        ('getloadavg',          (getloadavg, 5.0)),
+        ('virtual_memory',      (virtual_memory, 2.0)),
+        ('swap_memory',         (swap_memory, 10.0)),
+        ('disk_io_counters',    (partial(disk_io_counters, perdisk=True), 2.0)),
+        ('net_io_counters',     (partial(net_io_counters, pernic=True), 2.0)),
+        ('sensors_temperatures', (sensors_temperatures, 10.0)),
+        ('sensors_fans',        (sensors_fans, 10.0)),
+        ('sensors_battery',     (sensors_battery, 30.0)),
+    ))
+
+    def __init__(self, collectors: OrderedDict=None):
+        """
+        :param collectors:  Map of name to (function, interval), DEFAULT_INTERVALS if None.
+        """
+        Thread.__init__(self, name="PollingScheduler", daemon=True)
+        self.condition      = Condition()
+        self.collectors     = OrderedDict()
+        self.heap           = []
+        self.sequence       = 0
+        self.subscribers    = []
+        self.stopped        = False
+        self.startTime      = monotonic()
+        for name, (function, interval) in (collectors if collectors is not None else
+                                           PollingScheduler.DEFAULT_INTERVALS).items():
+            self.addCollector(name, function, interval)
+
+    def addCollector(self, name: str, function, interval: float):
+        collector = Collector(name, function, max(PollingScheduler.TICK,
+                                                  round(interval / PollingScheduler.TICK) * PollingScheduler.TICK))
+        with self.condition:
+            if name in self.collectors:
+                self.collectors[name].active = False
+            self.collectors[name] = collector
+            #   First run at the next multiple of the interval after now, counted from the start.
+            elapsed = monotonic() - self.startTime
+            collector.nextDue = self.startTime + ceil(elapsed / collector.interval) * collector.interval
+            self.push(collector)
+            self.condition.notify()
+        return collector
+
+    def removeCollector(self, name: str):
+        with self.condition:
+            collector = self.collectors.pop(name, None)
+            if collector is not None:
+                collector.active = False
+
+    def push(self, collector: Collector):
+        #   The sequence number keeps heap entries with equal due times from comparing collectors.
+        self.sequence += 1
+        heapq.heappush(self.heap, (collector.nextDue, self.sequence, collector))
+
+    def subscribe(self, callback, names: tuple=None):
+        """
+        :param names:   Only the results of these collectors are passed to callback, which is not called for a
+                        wakeup in which none of them ran.  All of them if None.
+        """
+        if not callable(callback):
+            raise Exception("PollingScheduler.subscribe - Invalid callback argument:  " + str(callback))
+        with self.condition:
+            self.subscribers.append((callback, frozenset(names) if names is not None else None))
+
+    def unsubscribe(self, callback):
+        with self.condition:
+            self.subscribers = [subscriber for subscriber in self.subscribers if subscriber[0] != callback]
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def nextBatch(self):
+        """
+        Waits until the earliest due time, then takes every active collector due at that moment off the heap and
+        schedules its next run.  Returns None once stopped.
+        """
+        with self.condition:
+            while not self.stopped:
+                while len(self.heap) > 0 and not self.heap[0][2].active:
+                    heapq.heappop(self.heap)
+                if len(self.heap) == 0:
+                    self.condition.wait()
+                    continue
+                dueTime = self.heap[0][0]
+                now = monotonic()
+                if dueTime > now:
+                    self.condition.wait(dueTime - now)
+                    continue
+                batch = []
+                while len(self.heap) > 0 and self.heap[0][0] <= dueTime:
+                    collector = heapq.heappop(self.heap)[2]
+                    if not collector.active:
+                        continue
+                    batch.append(collector)
+                    collector.nextDue += collector.interval
+                    if collector.nextDue <= now:
+                        collector.nextDue += ceil((now - collector.nextDue) / collector.interval) * \
+                                             collector.interval
+                        if collector.nextDue <= now:
+                            collector.nextDue += collector.interval
+                    self.push(collector)
+                return batch, tuple(self.subscribers)
+            return None
+
+    def run(self):
+        while True:
+            scheduled = self.nextBatch()
+            if scheduled is None:
+                return
+            batch, subscribers = scheduled
+            results = OrderedDict()
+            for collector in batch:
+                try:
+                    results[collector.name] = (time(), collector.function())
+                except Exception:
+                    outputText = 'PollingScheduler.run - collector ' + collector.name + ' failed:\n'
+                    for line in exc_info():
+                        outputText += str(line) + '\n'
+                    print(outputText, file=stderr)
+            for callback, names in subscribers:
+                if names is not None:
+                    selected = OrderedDict((name, result) for name, result in results.items() if name in names)
+                    if len(selected) == 0:
+                        continue
+                else:
+                    selected = results
+                #   A subscriber which fails must not stop the scheduler, and with it every other collector.
+                try:
+                    callback(selected)
+                except Exception:
+                    outputText = 'PollingScheduler.run - subscriber ' + \
+                                 getattr(callback, '__qualname__', str(callback)) + ' failed:\n'
+                    for line in exc_info():
+                        outputText += str(line) + '\n'
+                    print(outputText, file=stderr)
+
+
+class ProcessRecord:
+    """
+    A process being sampled, with its psutil Process handle and its counters as of the last sample.
+    """
+
+    __slots__ = ('pid', 'process', 'name', 'startTicks', 'cpuTime', 'readBytes', 'writeBytes',
+                 'cpuPercent', 'rss', 'readRate', 'writeRate')
+
+    def __init__(self, process: Process):
+        self.pid        = process.pid
+        self.process    = process
+        self.name       = None
+        #   Clock ticks from boot to the start of the process, which with the pid identifies it.
+        self.startTicks = None
+        #   None until the first sample.  The rates need two samples, so they stay 0.0 until the second.
+        self.cpuTime    = None
+        self.readBytes  = None
+        self.writeBytes = None
+        self.cpuPercent = 0.0
+        self.rss        = 0
+        self.readRate   = 0.0
+        self.writeRate  = 0.0
+
+
+class ProcessSampler:
+    """
+    Samples every process and keeps the topCount largest by each of the METRICS.
+    A Process handle is kept for each pid from one sample to the next, so that its name is read once and each
+    sample costs only a read of /proc/<pid>/stat, for the CPU time and start time, and the reads inside one
+    oneshot() block.  A pid whose start time has changed belongs to a new process, which gets a new record.
+    CPU percent is of one core, as top
+    shows it, and the I/O rates are bytes per second read from and written to storage, since the last sample.
+    The I/O counters of other users' processes cannot be read without root, and their rates stay 0.0.
+    sample() can be registered with a PollingScheduler as a collector.
+    """
+
+    METRICS         = ('cpuPercent', 'rss', 'readRate', 'writeRate')
+    DEFAULT_TOP     = 10
+    CLOCK_TICKS     = sysconf('SC_CLK_TCK')
+
+    def __init__(self, topCount: int=DEFAULT_TOP):
+        if not isinstance(topCount, int) or topCount < 1:
+            raise Exception("ProcessSampler constructor - Invalid topCount argument:  " + str(topCount))
+        self.topCount   = topCount
+        #   Key is pid, value is its ProcessRecord.
+        self.records    = OrderedDict()
+        self.sampleTime = None
+        self.top        = OrderedDict((metric, ()) for metric in ProcessSampler.METRICS)
+
+    def sample(self):
+        """
+        :return:    OrderedDict of metric name to a tuple of (value, pid, name), largest first.  The caller may
+                    keep it; the next sample makes a new one.
+        """
+        sampleTime = monotonic()
+        elapsed = sampleTime - self.sampleTime if self.sampleTime is not None else None
+        self.sampleTime = sampleTime
+        currentPids = set(pids())
+        for pid in tuple(self.records.keys()):
+            if pid not in currentPids:
+                del self.records[pid]
+        for pid in currentPids:
+            if pid not in self.records:
+                try:
+                    self.records[pid] = ProcessRecord(Process(pid))
+                except (NoSuchProcess, AccessDenied):
+                    continue
+        for pid, record in tuple(self.records.items()):
+            if not self.update(record, elapsed):
+                del self.records[pid]
+        records = self.records.values()
+        top = OrderedDict()
+        for metric in ProcessSampler.METRICS:
+            #   nlargest keeps a heap of only topCount entries as it goes through the records.
+            largest = heapq.nlargest(self.topCount, records, key=lambda record: getattr(record, metric))
+            top[metric] = tuple((getattr(record, metric), record.pid, record.name) for record in largest)
+        self.top = top
+        return OrderedDict(top)
+
+    @staticmethod
+    def readStat(pid: int):
+        """
+        :return:    (CPU seconds, user and system, start time in clock ticks since boot) of the process pid.
+        """
+        with open('/proc/' + str(pid) + '/stat', 'rb') as statFile:
+            statText = statFile.read()
+        #   The name in parentheses may hold spaces, so the fields are counted from after its closing parenthesis,
+        #   starting with field 3, the state.
+        fields = statText[statText.rfind(b')') + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / ProcessSampler.CLOCK_TICKS, int(fields[19])
+
+    @staticmethod
+    def update(record: ProcessRecord, elapsed: float):
+        """
+        Reads the counters of record's process and computes its rates since the last sample.
+        :return:    False if the process has gone, or its pid now belongs to a different process.
+        """
+        process = record.process
+        try:
+            cpuTime, startTicks = ProcessSampler.readStat(record.pid)
+        except OSError:
+            return False
+        if record.startTicks is None:
+            record.startTicks = startTicks
+        elif startTicks != record.startTicks:
+            #   The pid has been reused.  The record is replaced at the next sample.
+            return False
+        if record.cpuTime is not None and elapsed:
+            record.cpuPercent = (cpuTime - record.cpuTime) / elapsed * 100
+        record.cpuTime = cpuTime
+        try:
+            with process.oneshot():
+                if record.name is None:
+                    record.name = process.name()
+                record.rss = process.memory_info().rss
+                try:
+                    ioCounters = process.io_counters()
+                except AccessDenied:
+                    ioCounters = None
+        except (NoSuchProcess, ZombieProcess):
+            return False
+        except AccessDenied:
+            return True
+        if ioCounters is not None:
+            if record.readBytes is not None and elapsed:
+                record.readRate = max(0, ioCounters.read_bytes - record.readBytes) / elapsed
+                record.writeRate = max(0, ioCounters.write_bytes - record.writeBytes) / elapsed
+            record.readBytes = ioCounters.read_bytes
+            record.writeBytes = ioCounters.write_bytes
+        return True
+
+    def getTop(self, metric: str):
+        if metric not in self.top:
+            raise Exception("ProcessSampler.getTop - Invalid metric argument:  " + str(metric))
+        return self.top[metric]
+
+    def getProcessCount(self):
+        return len(self.records)
+
+
 def ExitProgram():
     answer = messagebox.askyesno(parent=mainView, title='Exit program ', message="Exit the " + PROGRAM_TITLE + " program?")
     if answer:
@@ -46,6 +370,8 @@ def ExitProgram():
 
 
 if __name__ == '__main__':
+    from tkinter import Tk, messagebox
+
     print("PsUtil.py Runnnig\n")
     print("pids:\t" + str(pids))
     print("\tpids():\t" + str(pids()))
@@ -55,7 +381,7 @@ if __name__ == '__main__':
     #   Next do ls on / and find disk usage for all directories of the root dir in a pie chart.
     #   Could let user pick one from a folder tree to show its information, adding it to a vertical bar chart.
     #   Will need to do a file system walk in a background thread since for th entire disk this can take quite
-    #   a bit of time.
+    #   a bit of time.  DiskUsageScanner, in model/DiskUsage.py, does this walk.
 
     print("\ndisk_partitions:\t" + str(disk_partitions))
     print("\tdisk_partitions:\t" + str(disk_partitions()))
@@ -0,0 +1,269 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         model/Snapshot.py
+#   Date Started:   October 16, 2026
+#   Purpose:        Persistence of the hw-probe content map.
+#   Development:
+#       Snapshots are written on a background thread so that saving a loaded probe never holds up the Tk
+#       mainloop.  In either format the map is encoded incrementally and each piece goes straight into the
+#       compressor, so the whole text never exists in memory at once and the file is written only once.
+#
+#       The binary snapshot format, file extension .gbs, is laid out as:
+#           header:     magic b'GBMDSNAP', format version (uint16), reserved (uint16),
+#                       table of contents offset (uint64), table of contents length (uint32), all little endian.
+#           sections:   The text of each line list in the content map, joined with newlines and compressed
+#                       separately, one after the other.
+#           contents:   JSON object listing each section's name, offset, stored and raw lengths and codec, plus
+#                       the aliases for content map keys which share a section, e.g. 'acpidump'.
+#       The table of contents is written last so sections can be streamed out without knowing their sizes in
+#       advance.  A reader needs only the header and the table of contents to open a snapshot and can then
+#       decompress any one section, such as the host file or a single log, without touching the others.
+#
+
+from os import replace
+from sys import argv, stderr
+from json import JSONEncoder, loads, dumps
+from threading import Thread
+from collections import OrderedDict
+from functools import partial
+from enum import Enum
+import gzip, zlib, struct
+
+from model.Hardware import HardwareProbe, LazyLineMap, LineStore, DeferredLineStore
+from model.Paths import HW_PROBE_ZIPFILE, HW_PROBE_SNAPSHOT
+
+
+PROGRAM_TITLE = "Probe Snapshots"
+INSTALLING  = False
+TESTING     = True
+DEBUG       = False
+
+
+class SnapshotFormat(Enum):
+    JSON_GZIP   = 'json.gzip'
+    BINARY      = 'gbs'
+
+    def __str__(self):
+        return self.value
+
+
+class SectionCodec(Enum):
+    NONE        = 'none'
+    ZLIB        = 'zlib'
+
+    def __str__(self):
+        return self.value
+
+
+class BinarySnapshot:
+
+    MAGIC           = b'GBMDSNAP'
+    VERSION         = 1
+    HEADER          = struct.Struct('<8sHHQI')
+    COMPRESS_LEVEL  = 6
+    #   Sections smaller than this are not worth the zlib header and the decompression call.
+    MIN_COMPRESS_SIZE   = 256
+    CHUNK_SIZE      = 1024 * 1024
+    #   Content map keys holding a map of file name to lines, stored as one section per file.
+    LINE_MAP_KEYS   = ('logMap', 'testMap')
+
+    @staticmethod
+    def write(contentMap: dict, filePath: str):
+        """
+        Write contentMap to filePath in the binary snapshot format.  Line lists may be tuples or lists of str
+        or LineStores, and the line maps may be LazyLineMaps, which are read without filling their caches.
+        """
+        if not isinstance(contentMap, dict):
+            raise Exception("BinarySnapshot.write - Invalid contentMap argument:  " + str(contentMap))
+        sections = []
+        aliases = OrderedDict()
+        with open(filePath, 'wb') as snapshotFile:
+            snapshotFile.write(BinarySnapshot.HEADER.pack(BinarySnapshot.MAGIC, BinarySnapshot.VERSION, 0, 0, 0))
+            for key, value in contentMap.items():
+                if key in BinarySnapshot.LINE_MAP_KEYS:
+                    for name in value:
+                        if isinstance(value, LazyLineMap):
+                            lines = value.uncached(name)
+                        else:
+                            lines = value[name]
+                        sections.append(BinarySnapshot.writeSection(snapshotFile, key + '/' + name, lines))
+                elif key in HardwareProbe.MAPPED_LOGS and 'logMap' in contentMap and key in contentMap['logMap']:
+                    #   The ACPI entries are copies of the logMap entries of the same name.
+                    aliases[key] = 'logMap/' + key
+                else:
+                    sections.append(BinarySnapshot.writeSection(snapshotFile, key, value))
+            tocOffset = snapshotFile.tell()
+            tocBytes = dumps({'sections': sections, 'aliases': aliases}).encode('utf-8')
+            snapshotFile.write(tocBytes)
+            snapshotFile.seek(0)
+            snapshotFile.write(BinarySnapshot.HEADER.pack(BinarySnapshot.MAGIC, BinarySnapshot.VERSION, 0,
+                                                          tocOffset, len(tocBytes)))
+
+    @staticmethod
+    def writeSection(snapshotFile, name: str, lines):
+        if isinstance(lines, LineStore):
+            rawLength = len(lines.buffer)
+            rawView = memoryview(lines.buffer)
+        elif isinstance(lines, (tuple, list)):
+            rawView = memoryview('\n'.join(lines).encode('utf-8'))
+            rawLength = len(rawView)
+        else:
+            raise Exception("BinarySnapshot.writeSection - Invalid lines for section " + name + ":  " + str(lines))
+        offset = snapshotFile.tell()
+        if rawLength < BinarySnapshot.MIN_COMPRESS_SIZE:
+            codec = SectionCodec.NONE
+            snapshotFile.write(rawView)
+        else:
+            codec = SectionCodec.ZLIB
+            compressor = zlib.compressobj(BinarySnapshot.COMPRESS_LEVEL)
+            for start in range(0, rawLength, BinarySnapshot.CHUNK_SIZE):
+                snapshotFile.write(compressor.compress(rawView[start:start + BinarySnapshot.CHUNK_SIZE]))
+            snapshotFile.write(compressor.flush())
+        rawView.release()
+        return {'name': name, 'offset': offset, 'length': snapshotFile.tell() - offset,
+                'rawLength': rawLength, 'codec': str(codec)}
+
+    @staticmethod
+    def convert(sourcePath: str, destPath: str=HW_PROBE_SNAPSHOT):
+        """
+        Convert a hw.info.json or hw.info.gzip snapshot to the binary format.
+        :param sourcePath:  Either a plain or a gzip compressed JSON snapshot, recognized by its content.
+        """
+        with open(sourcePath, 'rb') as sourceFile:
+            sourceBytes = sourceFile.read()
+        if sourceBytes[:2] == b'\x1f\x8b':
+            sourceBytes = gzip.decompress(sourceBytes)
+        contentMap = loads(sourceBytes.decode('utf-8'), object_pairs_hook=OrderedDict)
+        BinarySnapshot.write(contentMap, destPath)
+        return destPath
+
+
+class SnapshotReader:
+
+    def __init__(self, filePath: str=HW_PROBE_SNAPSHOT):
+        """
+        Opening a snapshot reads only its header and table of contents.
+        """
+        if not isinstance(filePath, str):
+            raise Exception("SnapshotReader constructor - Invalid filePath argument:  " + str(filePath))
+        self.filePath = filePath
+        with open(filePath, 'rb') as snapshotFile:
+            magic, version, reserved, tocOffset, tocLength = \
+                BinarySnapshot.HEADER.unpack(snapshotFile.read(BinarySnapshot.HEADER.size))
+            if magic != BinarySnapshot.MAGIC or version > BinarySnapshot.VERSION:
+                raise Exception("SnapshotReader constructor - Not a supported snapshot file:  " + filePath)
+            snapshotFile.seek(tocOffset)
+            toc = loads(snapshotFile.read(tocLength).decode('utf-8'), object_pairs_hook=OrderedDict)
+        self.sections = OrderedDict()
+        for section in toc['sections']:
+            self.sections[section['name']] = section
+        self.aliases = toc['aliases']
+
+    def sectionNames(self):
+        return tuple(self.sections.keys())
+
+    def readSectionBytes(self, name: str):
+        if name in self.aliases:
+            name = self.aliases[name]
+        if name not in self.sections:
+            raise Exception("SnapshotReader.readSectionBytes - No such section:  " + str(name))
+        section = self.sections[name]
+        with open(self.filePath, 'rb') as snapshotFile:
+            snapshotFile.seek(section['offset'])
+            storedBytes = snapshotFile.read(section['length'])
+        if section['codec'] == str(SectionCodec.ZLIB):
+            return zlib.decompress(storedBytes)
+        return storedBytes
+
+    def readSection(self, name: str):
+        return LineStore(self.readSectionBytes(name))
+
+    def contentMap(self):
+        """
+        The content map in the same form HardwareProbe.readArchive() builds, with every log and test left
+        undecompressed until it is looked up.
+        """
+        contentMap = OrderedDict()
+        lineMaps = OrderedDict()
+        for name in self.sections:
+            if '/' in name and name.split('/', 1)[0] in BinarySnapshot.LINE_MAP_KEYS:
+                mapKey, fileName = name.split('/', 1)
+                if mapKey not in lineMaps:
+                    lineMaps[mapKey] = OrderedDict()
+                lineMaps[mapKey][fileName] = partial(self.readSectionBytes, name)
+            else:
+                contentMap[name] = tuple(self.readSection(name))
+        for mapKey, sources in lineMaps.items():
+            contentMap[mapKey] = LazyLineMap(sources)
+        for key, name in self.aliases.items():
+            mapKey, fileName = name.split('/', 1)
+            contentMap[key] = DeferredLineStore(contentMap[mapKey], fileName)
+        return contentMap
+
+
+class SnapshotWriter(Thread):
+
+    COMPRESS_LEVEL  = 6
+
+    def __init__(self, contentMap: dict, filePath: str=HW_PROBE_SNAPSHOT, callback=None,
+                 snapshotFormat: SnapshotFormat=SnapshotFormat.BINARY):
+        """
+        Call start() to write the snapshot.
+        :param contentMap:      The hw-probe content map, as returned by HardwareProbe.loadLatest().
+        :param filePath:        The file to write.  It is written under a temporary name and renamed when
+                                complete, so an earlier snapshot stays intact if this one fails.
+        :param callback:        Called from the writer thread with a message dict when the write completes or
+                                fails.  It must not touch any Tk widget; a Queue.put to be polled with after() is
+                                the intended use.
+        :param snapshotFormat:  BINARY for a .gbs snapshot or JSON_GZIP for the hw.info.gzip format.
+        """
+        if not isinstance(contentMap, dict):
+            raise Exception("SnapshotWriter constructor - Invalid contentMap argument:  " + str(contentMap))
+        if not isinstance(filePath, str):
+            raise Exception("SnapshotWriter constructor - Invalid filePath argument:  " + str(filePath))
+        if callback is not None and not callable(callback):
+            raise Exception("SnapshotWriter constructor - Invalid callback argument:  " + str(callback))
+        if not isinstance(snapshotFormat, SnapshotFormat):
+            raise Exception("SnapshotWriter constructor - Invalid snapshotFormat argument:  " + str(snapshotFormat))
+        Thread.__init__(self, name="SnapshotWriter", daemon=True)
+        self.contentMap = contentMap
+        self.filePath   = filePath
+        self.callback   = callback
+        self.snapshotFormat = snapshotFormat
+
+    def run(self):
+        try:
+            if self.snapshotFormat == SnapshotFormat.BINARY:
+                BinarySnapshot.write(self.contentMap, self.filePath + '.part')
+            else:
+                SnapshotWriter.writeJSON(self.contentMap, self.filePath + '.part')
+            replace(self.filePath + '.part', self.filePath)
+            message = {'source': 'SnapshotWriter.run', 'status': 'complete', 'path': self.filePath}
+        except Exception as exception:
+            message = {'source': 'SnapshotWriter.run', 'status': 'failed', 'path': self.filePath,
+                       'error': str(exception)}
+        if DEBUG:
+            print("SnapshotWriter.run:\t" + str(message))
+        if self.callback is not None:
+            self.callback(message)
+
+    @staticmethod
+    def writeJSON(contentMap: dict, filePath: str):
+        encoder = JSONEncoder(default=LazyLineMap.jsonDefault)
+        with gzip.open(filePath, 'wt', encoding='utf-8', compresslevel=SnapshotWriter.COMPRESS_LEVEL) as snapshotFile:
+            for chunk in encoder.iterencode(contentMap):
+                snapshotFile.write(chunk)
+
+
+if __name__ == '__main__':
+    #   Converts an existing JSON or gzip snapshot, by default hw.info.gzip, to a binary one.
+    #       python3 -m model.Snapshot [source [destination]]
+    sourcePath = HW_PROBE_ZIPFILE
+    destPath = HW_PROBE_SNAPSHOT
+    if len(argv) > 1:
+        sourcePath = argv[1]
+    if len(argv) > 2:
+        destPath = argv[2]
+    print("Converted " + sourcePath + " to " + BinarySnapshot.convert(sourcePath, destPath))
@@ -0,0 +1,522 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         model/Storage.py
+#   Date Started:   October 16, 2026
+#   Purpose:        One storage topology joining the block device tree, blkid, the mount table, and udev.
+#   Development:
+#       The block device tree comes from sysfs, filesystem identities from blkid and udev's ID_FS_* properties,
+#       which udev reads without needing root, and mounts from /proc/self/mountinfo.  The sources are collected
+#       on the LinuxTools pool at the same time and joined on device path, maj:min, and UUID.
+#       Nodes refer to each other by key rather than by reference, so a refresh can keep every node whose
+#       attributes and links are unchanged and replace only the others.
+#       A watched topology is updated on a timer thread once block device events have stopped for QUIET_PERIOD,
+#       never on the udev monitor's thread, which delivers events to every other listener as well.  The update
+#       rebuilds only the nodes of the devices in the events and of their parents and children, reading each from
+#       its own sysfs folder and running blkid on just those devices.  The whole topology is only collected and
+#       built by refresh(), when it is first loaded.
+#
+
+from collections import OrderedDict
+from enum import Enum
+from threading import Lock, Timer
+from time import monotonic
+from sys import stderr, exc_info
+
+from service.Linux import LinuxUtilities, LinuxTools, DeviceCommand
+from model.Sysfs import SysfsBlock
+from model.Hardware import BlockSet, BlkIdSet, DeviceIndex
+
+
+PROGRAM_TITLE = "Storage Topology"
+INSTALLING  = False
+TESTING     = True
+DEBUG       = False
+
+
+class NodeKind(Enum):
+    DISK        = 'disk'
+    PARTITION   = 'partition'
+    HOLDER      = 'holder'
+    FILESYSTEM  = 'filesystem'
+    MOUNT       = 'mount'
+
+    def __str__(self):
+        return self.value
+
+
+BLOCK_KINDS = (NodeKind.DISK, NodeKind.PARTITION, NodeKind.HOLDER)
+
+
+class StorageNode:
+    """
+    One disk, partition, holder (device mapper, md, and the like), filesystem, or mount in the topology.
+    parentKeys and childKeys hold the keys of the linked nodes, to be looked up with StorageTopology.getNode().
+    """
+
+    __slots__ = ('kind', 'key', 'attributes', 'parentKeys', 'childKeys', 'diskKeys')
+
+    def __init__(self, kind: NodeKind, key: str, attributes: OrderedDict):
+        if not isinstance(kind, NodeKind):
+            raise Exception("StorageNode constructor - Invalid kind argument:  " + str(kind))
+        self.kind       = kind
+        self.key        = key
+        self.attributes = attributes
+        self.parentKeys = []
+        self.childKeys  = []
+        #   Keys of the disks this node is on, worked out once when the topology is built.
+        self.diskKeys   = ()
+
+    def get(self, attributeName: str, default=None):
+        return self.attributes.get(attributeName, default)
+
+    def sameAs(self, other):
+        return other is not None and self.kind == other.kind and self.attributes == other.attributes and \
+            self.parentKeys == other.parentKeys and self.childKeys == other.childKeys
+
+    def __str__(self):
+        return str(self.kind) + ':' + self.key
+
+
+class StorageTopology:
+    """
+    disk -> partition -> filesystem -> mount graph, with holders between a device and what is built on it.
+    Every lookup is a dict access into indexes built once per refresh or update.
+    """
+
+    #   udev properties kept on block device nodes.
+    UDEV_PROPERTIES = ('ID_BUS', 'ID_MODEL', 'ID_SERIAL', 'ID_FS_TYPE', 'ID_FS_UUID', 'ID_FS_LABEL', 'ID_FS_VERSION',
+                       'ID_PART_ENTRY_UUID', 'ID_PART_ENTRY_NAME', 'DEVLINKS')
+    #   Seconds with no block device event before a watched topology is updated, so that a burst of events, as
+    #   from partitioning a disk or plugging in a hub, costs one update.  Under a steady stream of events it is
+    #   still updated at least every MAX_REFRESH_DELAY seconds.
+    QUIET_PERIOD        = 0.5
+    MAX_REFRESH_DELAY   = 5.0
+
+    def __init__(self, collect: bool=True):
+        self.lock           = Lock()
+        self.nodes          = OrderedDict()
+        self.devPathIndex   = {}
+        self.majMinIndex    = {}
+        self.uuidIndex      = {}
+        self.partUUIDIndex  = {}
+        self.mountIndex     = {}
+        self.removablePartitions = ()
+        self.watching       = False
+        #   Guards the event times and the refresh timer, shared by the udev monitor and timer threads.
+        self.eventLock      = Lock()
+        self.firstEventTime = None
+        self.lastEventTime  = None
+        self.refreshTimer   = None
+        #   Names of the block devices in the events since the last update, in the order first seen.
+        self.changedNames   = OrderedDict()
+        if collect:
+            self.refresh()
+
+    @staticmethod
+    def collectSafely(function, *arguments):
+        try:
+            return function(*arguments)
+        except Exception as exception:
+            if DEBUG:
+                print("StorageTopology.collect - source not available:\t" + str(exception), file=stderr)
+            return None
+
+    @staticmethod
+    def collect():
+        """
+        Reads every source at once on the LinuxTools pool.  A source which is not available, e.g. udev in a
+        container, is None, and the topology is built from the others.
+        :return:    (blockSet, blkIdSet, mountList, udevRecords)
+        """
+        executor = LinuxTools.getExecutor()
+        futures = (executor.submit(StorageTopology.collectSafely, BlockSet.fromSysfs),
+                   executor.submit(StorageTopology.collectSafely, lambda: BlkIdSet(
+                       LinuxUtilities.runCachedTool(DeviceCommand.BLKID_EXPORT))),
+                   executor.submit(StorageTopology.collectSafely, lambda: list(SysfsBlock.mountInfo())),
+                   executor.submit(StorageTopology.collectSafely,
+                                   lambda: DeviceIndex.shared().getBySubsystem('block')))
+        return tuple(future.result() for future in futures)
+
+    @staticmethod
+    def build(blockSet, blkIdSet, mountList, udevRecords):
+        """
+        Joins the sources into nodes.
+        :return:    OrderedDict of node key to StorageNode.
+        """
+        nodes = OrderedDict()
+        if blockSet is None:
+            return nodes
+        udevMap = {}
+        for record in udevRecords or ():
+            udevMap[record.sysName] = record
+        mountMap = {}
+        for mount in mountList or ():
+            mountMap.setdefault(mount['majMin'], []).append(mount)
+
+        for name, blockDev in blockSet.nameIndex.items():
+            StorageTopology.addDeviceNodes(nodes, blockDev.record, [parent.name for parent in blockDev.parents],
+                                           [child.name for child in blockDev.children], udevMap.get(name),
+                                           blkIdSet, mountMap.get(blockDev.maj_min, []))
+
+        for node in nodes.values():
+            StorageTopology.findDisks(nodes, node)
+        return nodes
+
+    @staticmethod
+    def addDeviceNodes(nodes: OrderedDict, record: dict, parentKeys: list, childKeys: list, udevRecord, blkIdSet,
+                       mounts: list):
+        """
+        Adds the node of one block device to nodes, followed by its filesystem and mount nodes if it has a
+        filesystem.
+        :param record:  The device's lsblk record, or the same as SysfsBlock reads it.
+        :param mounts:  The SysfsBlock.mountInfo() dicts of the device, in mount order.
+        :return:        The device's node.
+        """
+        name = record.get('name')
+        if record.get('type') == 'part':
+            kind = NodeKind.PARTITION
+        elif len(parentKeys) == 0:
+            kind = NodeKind.DISK
+        else:
+            kind = NodeKind.HOLDER
+        attributes = OrderedDict()
+        attributes['name']      = name
+        attributes['maj:min']   = record.get('maj:min')
+        attributes['type']      = record.get('type')
+        attributes['size']      = record.get('size')
+        attributes['rm']        = record.get('rm')
+        attributes['ro']        = record.get('ro')
+        attributes['devPath']   = '/dev/' + name
+        devPaths = [attributes['devPath']]
+        if udevRecord is not None:
+            for propertyName in StorageTopology.UDEV_PROPERTIES:
+                if propertyName in udevRecord.properties:
+                    attributes[propertyName] = udevRecord.properties[propertyName]
+            devPaths += udevRecord.get('DEVLINKS', '').split()
+        attributes['devPaths'] = tuple(devPaths)
+        #   blkid names device mapper devices by their /dev/mapper links, which udev lists in DEVLINKS.
+        blockId = None
+        if blkIdSet is not None:
+            for devPath in devPaths:
+                blockId = blkIdSet.getByDevPath(devPath)
+                if blockId is not None:
+                    break
+        if blockId is not None:
+            for attributeName, value in blockId.attributes.items():
+                if attributeName != str(BlkIdSet.BlockIdAttr.DEVNAME):
+                    attributes['blkid.' + attributeName] = value
+        node = StorageNode(kind, name, attributes)
+        node.parentKeys = parentKeys
+        node.childKeys = childKeys
+        nodes[name] = node
+
+        fsType = attributes.get('blkid.TYPE', attributes.get('ID_FS_TYPE'))
+        if fsType is None and len(mounts) > 0:
+            fsType = mounts[0]['fsType']
+        if fsType is None:
+            return node
+        fsAttributes = OrderedDict()
+        fsAttributes['type']    = fsType
+        fsAttributes['uuid']    = attributes.get('blkid.UUID', attributes.get('ID_FS_UUID'))
+        fsAttributes['label']   = attributes.get('blkid.LABEL', attributes.get('ID_FS_LABEL'))
+        fsAttributes['version'] = attributes.get('ID_FS_VERSION')
+        fsNode = StorageNode(NodeKind.FILESYSTEM, 'fs:' + name, fsAttributes)
+        fsNode.parentKeys = [name]
+        node.childKeys.append(fsNode.key)
+        nodes[fsNode.key] = fsNode
+        for mount in mounts:
+            #   Mounts can be stacked on one mount point, so the key includes the mount's unique ID.
+            mountNode = StorageNode(NodeKind.MOUNT, 'mount:' + mount['mountId'] + ':' + mount['mountPoint'],
+                                    OrderedDict(mount))
+            mountNode.parentKeys = [fsNode.key]
+            fsNode.childKeys.append(mountNode.key)
+            nodes[mountNode.key] = mountNode
+        return node
+
+    @staticmethod
+    def deviceNodeKeys(nodes: OrderedDict, name: str):
+        """
+        The keys in nodes of the block device name and of the filesystem and mounts on it.
+        """
+        keys = []
+        if name in nodes:
+            keys.append(name)
+            fsNode = nodes.get('fs:' + name)
+            if fsNode is not None:
+                keys.append(fsNode.key)
+                keys += [key for key in fsNode.childKeys if key in nodes]
+        return keys
+
+    @staticmethod
+    def findDisks(nodes: OrderedDict, node: StorageNode):
+        """
+        Sets and returns node.diskKeys.  A holder on several devices can be built before the last of them, so
+        its disks are found through its parents rather than in build order.
+        """
+        if len(node.diskKeys) == 0:
+            if node.kind == NodeKind.DISK:
+                node.diskKeys = (node.key,)
+            else:
+                diskKeys = []
+                for parentKey in node.parentKeys:
+                    if parentKey in nodes:
+                        for diskKey in StorageTopology.findDisks(nodes, nodes[parentKey]):
+                            if diskKey not in diskKeys:
+                                diskKeys.append(diskKey)
+                node.diskKeys = tuple(diskKeys)
+        return node.diskKeys
+
+    def refresh(self):
+        """
+        Collects and joins every source.  Nodes whose attributes and links are unchanged are kept as they are,
+        so anything holding one sees no difference.
+        :return:    {'added': [<key>, ...], 'removed': [<key>, ...], 'changed': [<key>, ...]}
+        """
+        newNodes = StorageTopology.build(*StorageTopology.collect())
+        delta = {'added': [], 'removed': [], 'changed': []}
+        with self.lock:
+            for key, node in newNodes.items():
+                oldNode = self.nodes.get(key)
+                if oldNode is None:
+                    delta['added'].append(key)
+                elif oldNode.sameAs(node):
+                    newNodes[key] = oldNode
+                else:
+                    delta['changed'].append(key)
+            delta['removed'] = [key for key in self.nodes if key not in newNodes]
+            if len(delta['added']) + len(delta['changed']) + len(delta['removed']) > 0 or len(self.nodes) == 0:
+                self.nodes = newNodes
+                self.buildIndexes()
+        return delta
+
+    def update(self, deviceNames: tuple):
+        """
+        Rebuilds the nodes of the named block devices, and of the devices they are on or have on them, whose links
+        to them may have changed.  Every other node is left as it is.  Each device is read from its own sysfs
+        folder, blkid is run on just these devices, and udev properties come from the DeviceIndex, so the cost is
+        in the number of devices changed rather than the number present.  With no topology yet, this is a
+        refresh().
+        :return:    As refresh() returns.
+        """
+        with self.lock:
+            oldNodes = self.nodes
+        if len(oldNodes) == 0:
+            return self.refresh()
+        names = list(deviceNames)
+        links = {}
+        for name in deviceNames:
+            links[name] = SysfsBlock.deviceLinks(name, SysfsBlock.CLASS_BLOCK + '/' + name)
+            neighbours = links[name][0] + links[name][1]
+            if name in oldNodes:
+                neighbours += oldNodes[name].parentKeys + oldNodes[name].childKeys
+            for neighbour in neighbours:
+                if neighbour not in names and (neighbour not in oldNodes or oldNodes[neighbour].kind in BLOCK_KINDS):
+                    names.append(neighbour)
+
+        mountList = list(SysfsBlock.mountInfo())
+        mountMap = {}
+        mountPointMap = {}
+        for mount in mountList:
+            mountMap.setdefault(mount['majMin'], []).append(mount)
+            mountPointMap.setdefault(mount['majMin'], []).append(mount['mountPoint'])
+        records = OrderedDict()
+        for name in names:
+            devicePath = SysfsBlock.CLASS_BLOCK + '/' + name
+            record = SysfsBlock.deviceRecord(name, devicePath, mountPointMap)
+            if record is not None:
+                records[name] = record
+                if name not in links:
+                    links[name] = SysfsBlock.deviceLinks(name, devicePath)
+        blkIdSet = None
+        if len(records) > 0:
+            blkIdSet = StorageTopology.collectSafely(lambda: BlkIdSet(LinuxUtilities.runLinuxTool(
+                DeviceCommand.BLKID_EXPORT.value + tuple('/dev/' + name for name in records))))
+        deviceIndex = StorageTopology.collectSafely(DeviceIndex.shared)
+        newNodes = OrderedDict()
+        for name, record in records.items():
+            udevRecord = StorageTopology.collectSafely(deviceIndex.getByName, 'block', name) \
+                if deviceIndex is not None else None
+            parentNames, childNames = links[name]
+            StorageTopology.addDeviceNodes(newNodes, record, list(parentNames), list(childNames), udevRecord,
+                                           blkIdSet, mountMap.get(record['maj:min'], []))
+
+        delta = {'added': [], 'removed': [], 'changed': []}
+        with self.lock:
+            nodes = OrderedDict(self.nodes)
+            replacedNodes = {}
+            for name in names:
+                for key in StorageTopology.deviceNodeKeys(nodes, name):
+                    replacedNodes[key] = nodes.pop(key)
+            for key, node in newNodes.items():
+                oldNode = replacedNodes.get(key)
+                if oldNode is None:
+                    delta['added'].append(key)
+                elif oldNode.sameAs(node):
+                    newNodes[key] = oldNode
+                else:
+                    delta['changed'].append(key)
+                nodes[key] = newNodes[key]
+            delta['removed'] = [key for key in replacedNodes if key not in newNodes]
+            for key in delta['added'] + delta['changed']:
+                StorageTopology.findDisks(nodes, nodes[key])
+            if len(delta['added']) + len(delta['changed']) + len(delta['removed']) > 0:
+                self.nodes = nodes
+                self.buildIndexes()
+        return delta
+
+    def buildIndexes(self):
+        devPathIndex    = {}
+        majMinIndex     = {}
+        uuidIndex       = {}
+        partUUIDIndex   = {}
+        mountIndex      = {}
+        removablePartitions = []
+        for key, node in self.nodes.items():
+            if node.kind in (NodeKind.DISK, NodeKind.PARTITION, NodeKind.HOLDER):
+                for devPath in node.get('devPaths', ()):
+                    devPathIndex[devPath] = node
+                majMinIndex[node.get('maj:min')] = node
+                partUUID = node.get('blkid.PARTUUID', node.get('ID_PART_ENTRY_UUID'))
+                if partUUID is not None:
+                    partUUIDIndex[partUUID] = node
+                if node.kind == NodeKind.PARTITION and \
+                        any(self.nodes[diskKey].get('rm') for diskKey in node.diskKeys):
+                    removablePartitions.append(node)
+            elif node.kind == NodeKind.FILESYSTEM:
+                if node.get('uuid') is not None:
+                    uuidIndex[node.get('uuid')] = self.nodes[node.parentKeys[0]]
+            elif node.kind == NodeKind.MOUNT:
+                #   The device behind a mount point is the block device under its filesystem node.  Mounts are in
+                #   mount order, so for stacked mounts this ends with the one on top, which is the one visible.
+                mountIndex[node.get('mountPoint')] = self.nodes[self.nodes[node.parentKeys[0]].parentKeys[0]]
+        self.devPathIndex   = devPathIndex
+        self.majMinIndex    = majMinIndex
+        self.uuidIndex      = uuidIndex
+        self.partUUIDIndex  = partUUIDIndex
+        self.mountIndex     = mountIndex
+        self.removablePartitions = tuple(removablePartitions)
+
+    def startWatching(self):
+        """
+        Updates the topology whenever udev reports a change to a block device.
+        """
+        if not self.watching:
+            DeviceIndex.shared().addListener(self.deviceEvent)
+            self.watching = True
+
+    def stopWatching(self):
+        if self.watching:
+            DeviceIndex.shared().removeListener(self.deviceEvent)
+            self.watching = False
+            with self.eventLock:
+                if self.refreshTimer is not None:
+                    self.refreshTimer.cancel()
+                    self.refreshTimer = None
+                self.firstEventTime = None
+                self.changedNames.clear()
+
+    def deviceEvent(self, action: str, record):
+        """
+        Called on the udev monitor's thread, which must not wait on an update, so this only notes the device and
+        the time and leaves the update to a timer thread once events stop coming.
+        """
+        if record.subsystem != 'block':
+            return
+        with self.eventLock:
+            self.changedNames[record.sysName] = True
+            self.lastEventTime = monotonic()
+            if self.firstEventTime is None:
+                self.firstEventTime = self.lastEventTime
+            if self.refreshTimer is None:
+                self.scheduleRefresh(StorageTopology.QUIET_PERIOD)
+
+    def scheduleRefresh(self, delay: float):
+        self.refreshTimer = Timer(delay, self.refreshWhenQuiet)
+        self.refreshTimer.daemon = True
+        self.refreshTimer.start()
+
+    def refreshWhenQuiet(self):
+        with self.eventLock:
+            if self.firstEventTime is None:
+                self.refreshTimer = None
+                return
+            now = monotonic()
+            quietTime = now - self.lastEventTime
+            waitedTime = now - self.firstEventTime
+            if quietTime < StorageTopology.QUIET_PERIOD and waitedTime < StorageTopology.MAX_REFRESH_DELAY:
+                self.scheduleRefresh(min(StorageTopology.QUIET_PERIOD - quietTime,
+                                         StorageTopology.MAX_REFRESH_DELAY - waitedTime))
+                return
+            self.firstEventTime = None
+            deviceNames = tuple(self.changedNames)
+            self.changedNames.clear()
+        try:
+            self.update(deviceNames)
+        except Exception:
+            outputText = 'StorageTopology.refreshWhenQuiet - update failed:\n'
+            for line in exc_info():
+                outputText += str(line) + '\n'
+            print(outputText, file=stderr)
+        with self.eventLock:
+            self.refreshTimer = None
+            #   Events which came in during the update may not be reflected in it.
+            if self.firstEventTime is not None and self.watching:
+                self.scheduleRefresh(StorageTopology.QUIET_PERIOD)
+
+    def getNode(self, key: str):
+        return self.nodes.get(key)
+
+    def getParents(self, node: StorageNode):
+        return tuple(self.nodes[key] for key in node.parentKeys if key in self.nodes)
+
+    def getChildren(self, node: StorageNode):
+        return tuple(self.nodes[key] for key in node.childKeys if key in self.nodes)
+
+    def getDisks(self, node: StorageNode=None):
+        """
+        The disks node is on, or with no node, every disk.
+        """
+        if node is None:
+            return tuple(node for node in self.nodes.values() if node.kind == NodeKind.DISK)
+        return tuple(self.nodes[key] for key in node.diskKeys if key in self.nodes)
+
+    def getByDevPath(self, devPath: str):
+        return self.devPathIndex.get(devPath)
+
+    def getByMajMin(self, majMin: str):
+        return self.majMinIndex.get(majMin)
+
+    def getByUUID(self, uuid: str):
+        return self.uuidIndex.get(uuid)
+
+    def getByPartUUID(self, partUUID: str):
+        return self.partUUIDIndex.get(partUUID)
+
+    def getByMountPoint(self, mountPoint: str):
+        return self.mountIndex.get(mountPoint)
+
+    def getDiskForMountPoint(self, mountPoint: str):
+        """
+        The disk holding the filesystem mounted at mountPoint.  For a filesystem spread across disks, e.g. on RAID,
+        this is the first of them; getDisks() gives them all.
+        """
+        node = self.mountIndex.get(mountPoint)
+        if node is None or len(node.diskKeys) == 0:
+            return None
+        return self.nodes.get(node.diskKeys[0])
+
+    def getRemovablePartitions(self):
+        return self.removablePartitions
+
+    def list(self):
+        print("\nStorage Topology:")
+        for node in self.nodes.values():
+            print("\t" + str(node) + "\tparents: " + str(node.parentKeys) + "\tchildren: " + str(node.childKeys))
+
+
+if __name__ == '__main__':
+    storageTopology = StorageTopology()
+    storageTopology.list()
+    print("Disk holding /:\t" + str(storageTopology.getDiskForMountPoint('/')))
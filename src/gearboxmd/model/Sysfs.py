@@ -0,0 +1,443 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         model/Sysfs.py
+#   Date Started:   October 16, 2026
+#   Purpose:        Device inventory read directly from the kernel's sysfs and procfs files, without running
+#                   lsblk, blkid, or any other command.
+#   Development:
+#       The block device inventory has the same shape as the JSON lsblk prints for 'lsblk --all --json --bytes',
+#       so BlockSet can be constructed from either.  Reading it takes a few hundred small file reads and no
+#       fork, so it can be done on every pass of a polling loop.
+#       The USB inventory is decoded from each device's binary 'descriptors' file, which any user can read, into
+#       the same descriptor tree USBset builds from the text of 'lsusb --verbose'.
+#
+
+from os import listdir, readlink
+from os.path import isdir, isfile, split
+from collections import OrderedDict
+from struct import unpack_from
+import re
+
+
+PROGRAM_TITLE = "Sysfs Device Inventory"
+INSTALLING  = False
+TESTING     = True
+DEBUG       = False
+
+
+class SysfsBlock:
+    """
+    Block device inventory from /sys/class/block, /sys/dev/block, and /proc/self/mountinfo, with /proc/partitions
+    used when sysfs is not mounted.
+    Whole disks which are not built on any other device are at the top level.  Each device's 'children' are its
+    partitions followed by its holders, i.e. the device mapper, md, and other devices built on it, as lsblk nests
+    them.  A holder built on more than one device appears under each of them.
+    """
+
+    CLASS_BLOCK     = '/sys/class/block'
+    DEV_BLOCK       = '/sys/dev/block'
+    MOUNT_INFO      = '/proc/self/mountinfo'
+    PARTITIONS      = '/proc/partitions'
+    #   sysfs sizes are always in 512 byte sectors, whatever the device's logical block size.
+    SECTOR_SIZE     = 512
+    #   dm/uuid prefixes which lsblk reports as a type of their own.
+    DM_TYPES        = {'LVM': 'lvm', 'CRYPT': 'crypt', 'mpath': 'mpath', 'part': 'part'}
+    MOUNT_ESCAPE    = re.compile(r'\\([0-7]{3})')
+
+    @staticmethod
+    def readAttribute(devicePath: str, attributeName: str):
+        try:
+            with open(devicePath + '/' + attributeName, 'r') as attributeFile:
+                return attributeFile.read().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def naturalKey(name: str):
+        return tuple(int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name))
+
+    @staticmethod
+    def mountInfo(mountInfoPath: str=MOUNT_INFO):
+        """
+        Generator of one dict per line of mountinfo:
+            {'mountId': <str>, 'majMin': <str>, 'mountPoint': <str>, 'mountOptions': <str>, 'fsType': <str>,
+             'source': <str>, 'superOptions': <str>}
+        """
+        try:
+            with open(mountInfoPath, 'r') as mountInfoFile:
+                for line in mountInfoFile:
+                    #   Optional fields come between the mount options and the ' - ' separator.
+                    fields, separator, tail = line.rstrip('\n').partition(' - ')
+                    fields = fields.split(' ')
+                    tail = tail.split(' ')
+                    if len(fields) < 6:
+                        continue
+                    #   Spaces, tabs, newlines and backslashes in paths are written as octal escapes.
+                    yield {'mountId':       fields[0],
+                           'majMin':        fields[2],
+                           'mountPoint':    SysfsBlock.unescape(fields[4]),
+                           'mountOptions':  fields[5],
+                           'fsType':        tail[0] if len(tail) > 0 else None,
+                           'source':        SysfsBlock.unescape(tail[1]) if len(tail) > 1 else None,
+                           'superOptions':  tail[2] if len(tail) > 2 else None}
+        except OSError:
+            return
+
+    @staticmethod
+    def unescape(path: str):
+        return SysfsBlock.MOUNT_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), path)
+
+    @staticmethod
+    def mountPoints(mountInfoPath: str=MOUNT_INFO):
+        """
+        :return:    Map of 'major:minor' to the list of places the device is mounted, in mount order.
+        """
+        mountMap = {}
+        for mount in SysfsBlock.mountInfo(mountInfoPath):
+            mountMap.setdefault(mount['majMin'], []).append(mount['mountPoint'])
+        return mountMap
+
+    @staticmethod
+    def deviceName(majMin: str):
+        """
+        Name of the block device with the given 'major:minor' number, from the /sys/dev/block link, or None.
+        """
+        try:
+            return split(readlink(SysfsBlock.DEV_BLOCK + '/' + majMin))[-1]
+        except OSError:
+            return None
+
+    @staticmethod
+    def deviceType(name: str, devicePath: str):
+        if isfile(devicePath + '/partition'):
+            return 'part'
+        if name.startswith('loop'):
+            return 'loop'
+        dmUUID = SysfsBlock.readAttribute(devicePath, 'dm/uuid')
+        if dmUUID is not None:
+            return SysfsBlock.DM_TYPES.get(dmUUID.split('-', 1)[0], 'dm')
+        mdLevel = SysfsBlock.readAttribute(devicePath, 'md/level')
+        if mdLevel:
+            return mdLevel
+        #   SCSI peripheral type 5 is a CD/DVD drive.
+        if SysfsBlock.readAttribute(devicePath, 'device/type') == '5':
+            return 'rom'
+        return 'disk'
+
+    def __init__(self, classBlock: str=CLASS_BLOCK, mountInfoPath: str=MOUNT_INFO):
+        if not isinstance(classBlock, str):
+            raise Exception("SysfsBlock constructor - Invalid classBlock argument:  " + str(classBlock))
+        self.classBlock     = classBlock
+        self.mountMap       = SysfsBlock.mountPoints(mountInfoPath)
+        #   Key is the device name and value is the record read from its sysfs folder, without 'children'.
+        self.deviceMap      = OrderedDict()
+        self.partitionMap   = {}
+        self.holderMap      = {}
+        self.slaveMap       = {}
+        if isdir(classBlock):
+            self.readClassBlock()
+        else:
+            self.readPartitions()
+
+    @staticmethod
+    def deviceRecord(name: str, devicePath: str, mountMap: dict):
+        """
+        The record of the one device whose sysfs folder is devicePath, as lsblk reports it, without 'children'.
+        :param mountMap:    As returned by mountPoints().
+        :return:            None if it is not a block device, or no longer exists.
+        """
+        majMin = SysfsBlock.readAttribute(devicePath, 'dev')
+        if majMin is None:
+            return None
+        size = SysfsBlock.readAttribute(devicePath, 'size')
+        record = OrderedDict()
+        record['name']          = name
+        record['maj:min']       = majMin
+        record['rm']            = SysfsBlock.readAttribute(devicePath, 'removable') == '1'
+        record['size']          = int(size) * SysfsBlock.SECTOR_SIZE if size is not None else 0
+        record['ro']            = SysfsBlock.readAttribute(devicePath, 'ro') == '1'
+        record['type']          = SysfsBlock.deviceType(name, devicePath)
+        record['mountpoints']   = mountMap.get(majMin, [None])
+        return record
+
+    @staticmethod
+    def deviceLinks(name: str, devicePath: str):
+        """
+        The names of the devices the one at devicePath is on and of those on it, in the order lsblk nests them:
+        a partition is on its disk and a holder on its slaves, and a device's children are its partitions
+        followed by its holders.
+        :return:    (parentNames, childNames)
+        """
+        try:
+            if isfile(devicePath + '/partition'):
+                parentNames = [split(split(readlink(devicePath))[0])[-1]]
+            elif isdir(devicePath + '/slaves'):
+                parentNames = sorted(listdir(devicePath + '/slaves'), key=SysfsBlock.naturalKey)
+            else:
+                parentNames = []
+            childNames = sorted((entry for entry in listdir(devicePath)
+                                 if isfile(devicePath + '/' + entry + '/partition')), key=SysfsBlock.naturalKey)
+            if isdir(devicePath + '/holders'):
+                childNames += sorted(listdir(devicePath + '/holders'), key=SysfsBlock.naturalKey)
+        except OSError:
+            #   Removed while being read.
+            return [], []
+        return parentNames, childNames
+
+    def readClassBlock(self):
+        for name in sorted(listdir(self.classBlock), key=SysfsBlock.naturalKey):
+            devicePath = self.classBlock + '/' + name
+            record = SysfsBlock.deviceRecord(name, devicePath, self.mountMap)
+            if record is None:
+                continue
+            self.deviceMap[name] = record
+            if record['type'] == 'part' or isfile(devicePath + '/partition'):
+                #   A partition's sysfs folder is inside its disk's folder.
+                diskName = split(split(readlink(devicePath))[0])[-1]
+                self.partitionMap.setdefault(diskName, []).append(name)
+            if isdir(devicePath + '/holders'):
+                self.holderMap[name] = sorted(listdir(devicePath + '/holders'), key=SysfsBlock.naturalKey)
+            if isdir(devicePath + '/slaves'):
+                self.slaveMap[name] = listdir(devicePath + '/slaves')
+
+    def readPartitions(self):
+        """
+        /proc/partitions has only names, numbers and sizes, so a device is taken to be a partition of another when
+        its name is the other's followed by a number, as with sda1 or nvme0n1p1.
+        """
+        try:
+            with open(SysfsBlock.PARTITIONS, 'r') as partitionsFile:
+                lines = partitionsFile.read().split('\n')[2:]
+        except OSError:
+            raise Exception("SysfsBlock.readPartitions - neither " + self.classBlock + " nor " +
+                            SysfsBlock.PARTITIONS + " is readable")
+        for line in lines:
+            fields = line.split()
+            if len(fields) != 4:
+                continue
+            majMin = fields[0] + ':' + fields[1]
+            record = OrderedDict()
+            record['name']          = fields[3]
+            record['maj:min']       = majMin
+            record['rm']            = False
+            #   /proc/partitions sizes are in 1024 byte blocks.
+            record['size']          = int(fields[2]) * 1024
+            record['ro']            = False
+            record['type']          = 'loop' if fields[3].startswith('loop') else 'disk'
+            record['mountpoints']   = self.mountMap.get(majMin, [None])
+            self.deviceMap[fields[3]] = record
+        for name, record in self.deviceMap.items():
+            match = re.fullmatch(r'(.+?)p?\d+', name)
+            if match is not None and match.group(1) in self.deviceMap and record['type'] != 'loop':
+                record['type'] = 'part'
+                self.partitionMap.setdefault(match.group(1), []).append(name)
+
+    def deviceTree(self, name: str, ancestors: tuple=()):
+        """
+        A copy of the device's record with its partitions and holders nested under 'children'.
+        """
+        record = OrderedDict(self.deviceMap[name])
+        ancestors = ancestors + (name,)
+        children = [self.deviceTree(childName, ancestors)
+                    for childName in self.partitionMap.get(name, []) + self.holderMap.get(name, [])
+                    if childName in self.deviceMap and childName not in ancestors]
+        if len(children) > 0:
+            record['children'] = children
+        return record
+
+    def topLevelNames(self):
+        partitionNames = set()
+        for names in self.partitionMap.values():
+            partitionNames.update(names)
+        return [name for name in self.deviceMap
+                if name not in partitionNames and len(self.slaveMap.get(name, [])) == 0]
+
+    def getBlockJSON(self):
+        """
+        :return:    {'blockdevices': [...]}, as parsed from the output of 'lsblk --all --json --bytes'.
+        """
+        return {'blockdevices': [self.deviceTree(name) for name in self.topLevelNames()]}
+
+    def list(self):
+        print("\nSysfs Block Devices:")
+        for name, record in self.deviceMap.items():
+            print("\t" + name + ":\t" + str(dict(record)))
+
+
+class SysfsUSB:
+    """
+    USB device inventory from /sys/bus/usb/devices.  For each device, getDevices() gives the 'Bus ... Device ...'
+    line lsusb would print and the descriptor tree of USBset.USBRecord, with values formatted as lsusb formats them,
+    so the result can be handed to USBset.USBRecord as if it had been parsed from lsusb's output.
+    Strings which lsusb reads from the device, such as the product name, come from the sysfs attributes the
+    kernel caches them in.  Vendor and class names, which lsusb looks up in its usb.ids database, are not
+    included.
+    """
+
+    DEVICES             = '/sys/bus/usb/devices'
+
+    DEVICE_DESCRIPTOR   = 1
+    CONFIG_DESCRIPTOR   = 2
+    INTERFACE_DESCRIPTOR = 4
+    ENDPOINT_DESCRIPTOR = 5
+
+    #   struct formats of the fixed part of each standard descriptor, with its field names.
+    DEVICE_FORMAT       = '<BBHBBBBHHHBBBB'
+    DEVICE_FIELDS       = ('bLength', 'bDescriptorType', 'bcdUSB', 'bDeviceClass', 'bDeviceSubClass',
+                           'bDeviceProtocol', 'bMaxPacketSize0', 'idVendor', 'idProduct', 'bcdDevice',
+                           'iManufacturer', 'iProduct', 'iSerial', 'bNumConfigurations')
+    CONFIG_FORMAT       = '<BBHBBBBB'
+    CONFIG_FIELDS       = ('bLength', 'bDescriptorType', 'wTotalLength', 'bNumInterfaces', 'bConfigurationValue',
+                           'iConfiguration', 'bmAttributes', 'MaxPower')
+    INTERFACE_FORMAT    = '<BBBBBBBBB'
+    INTERFACE_FIELDS    = ('bLength', 'bDescriptorType', 'bInterfaceNumber', 'bAlternateSetting', 'bNumEndpoints',
+                           'bInterfaceClass', 'bInterfaceSubClass', 'bInterfaceProtocol', 'iInterface')
+    ENDPOINT_FORMAT     = '<BBBBHB'
+    ENDPOINT_FIELDS     = ('bLength', 'bDescriptorType', 'bEndpointAddress', 'bmAttributes', 'wMaxPacketSize',
+                           'bInterval')
+
+    #   Names of descriptors which are not decoded field by field.
+    OTHER_DESCRIPTORS   = {0x0b: 'Interface Association', 0x21: 'HID Device Descriptor', 0x24: 'Class Specific',
+                           0x30: 'SuperSpeed Endpoint Companion'}
+
+    TRANSFER_TYPES      = ('Control', 'Isochronous', 'Bulk', 'Interrupt')
+
+    @staticmethod
+    def node(name: str, value=None, description=None):
+        return {'name': name, 'value': value, 'description': description, 'children': []}
+
+    @staticmethod
+    def bcdText(bcd: int):
+        return '%2x.%02x' % (bcd >> 8, bcd & 0xff)
+
+    @staticmethod
+    def fieldNodes(fieldNames: tuple, values: tuple, formats: dict, descriptions: dict):
+        nodes = []
+        for name, value in zip(fieldNames, values):
+            valueFormat = formats.get(name)
+            if valueFormat is None:
+                text = str(value)
+            elif callable(valueFormat):
+                text = valueFormat(value)
+            else:
+                text = valueFormat % value
+            nodes.append(SysfsUSB.node(name, text.strip(), descriptions.get(name)))
+        return nodes
+
+    @staticmethod
+    def decode(descriptors: bytes, strings: dict):
+        """
+        Decodes the contents of a device's 'descriptors' file: the device descriptor, followed by every
+        configuration descriptor with the interface, endpoint, and other descriptors which follow it.
+        :param strings:     Map of string index field name, e.g. 'iProduct', to the string the device gave for it.
+        :return:            The 'Device Descriptor' node, or None if descriptors is too short to hold one.
+        """
+        data = memoryview(descriptors)
+        if len(data) < 18 or data[1] != SysfsUSB.DEVICE_DESCRIPTOR:
+            return None
+        deviceValues = unpack_from(SysfsUSB.DEVICE_FORMAT, data, 0)
+        bcdUSB = deviceValues[2]
+        deviceNode = SysfsUSB.node('Device Descriptor')
+        deviceNode['children'] = SysfsUSB.fieldNodes(SysfsUSB.DEVICE_FIELDS, deviceValues,
+                                                     {'bcdUSB': SysfsUSB.bcdText, 'bcdDevice': SysfsUSB.bcdText,
+                                                      'idVendor': '0x%04x', 'idProduct': '0x%04x'}, strings)
+        #   SuperSpeed devices give MaxPower in units of 8mA rather than 2mA.
+        powerUnit = 8 if bcdUSB >= 0x0300 else 2
+        configNode = None
+        interfaceNode = None
+        offset = data[0]
+        while offset + 2 <= len(data):
+            length, descriptorType = data[offset], data[offset + 1]
+            if length < 2 or offset + length > len(data):
+                break
+            if descriptorType == SysfsUSB.CONFIG_DESCRIPTOR and length >= 9:
+                configNode = SysfsUSB.node('Configuration Descriptor')
+                configNode['children'] = SysfsUSB.fieldNodes(
+                    SysfsUSB.CONFIG_FIELDS, unpack_from(SysfsUSB.CONFIG_FORMAT, data, offset),
+                    {'wTotalLength': '0x%04x', 'bmAttributes': '0x%02x',
+                     'MaxPower': lambda value: str(value * powerUnit) + 'mA'}, strings)
+                deviceNode['children'].append(configNode)
+                interfaceNode = None
+            elif descriptorType == SysfsUSB.INTERFACE_DESCRIPTOR and length >= 9 and configNode is not None:
+                interfaceNode = SysfsUSB.node('Interface Descriptor')
+                interfaceNode['children'] = SysfsUSB.fieldNodes(
+                    SysfsUSB.INTERFACE_FIELDS, unpack_from(SysfsUSB.INTERFACE_FORMAT, data, offset), {}, {})
+                configNode['children'].append(interfaceNode)
+            elif descriptorType == SysfsUSB.ENDPOINT_DESCRIPTOR and length >= 7 and interfaceNode is not None:
+                endpointValues = unpack_from(SysfsUSB.ENDPOINT_FORMAT, data, offset)
+                address, attributes = endpointValues[2], endpointValues[3]
+                endpointNode = SysfsUSB.node('Endpoint Descriptor')
+                endpointNode['children'] = SysfsUSB.fieldNodes(
+                    SysfsUSB.ENDPOINT_FIELDS, endpointValues,
+                    {'bEndpointAddress': '0x%02x', 'wMaxPacketSize': '0x%04x'},
+                    {'bEndpointAddress': 'EP ' + str(address & 0x0f) + (' IN' if address & 0x80 else ' OUT')})
+                endpointNode['children'][3]['children'].append(
+                    SysfsUSB.node('Transfer Type', SysfsUSB.TRANSFER_TYPES[attributes & 0x03]))
+                interfaceNode['children'].append(endpointNode)
+            else:
+                otherNode = SysfsUSB.node(SysfsUSB.OTHER_DESCRIPTORS.get(descriptorType,
+                                                                         'Descriptor 0x%02x' % descriptorType))
+                otherNode['children'] = [SysfsUSB.node('bLength', str(length)),
+                                         SysfsUSB.node('bDescriptorType', str(descriptorType)),
+                                         SysfsUSB.node('data', data[offset + 2: offset + length].hex())]
+                parentNode = interfaceNode if interfaceNode is not None else configNode
+                (parentNode if parentNode is not None else deviceNode)['children'].append(otherNode)
+            offset += length
+        return deviceNode
+
+    def __init__(self, devicesFolder: str=DEVICES):
+        if not isinstance(devicesFolder, str) or not isdir(devicesFolder):
+            raise Exception("SysfsUSB constructor - Invalid devicesFolder argument:  " + str(devicesFolder))
+        self.devicesFolder = devicesFolder
+
+    def getDevices(self):
+        """
+        :return:    A list of {'busLine': <str>, 'descriptorTree': [<node>, ...], 'sysPath': <str>}, one per device,
+                    in bus and device number order.
+        """
+        devices = []
+        #   Interfaces are listed here too, with a ':' in their names, e.g. 1-1:1.0.
+        for name in listdir(self.devicesFolder):
+            if ':' in name:
+                continue
+            devicePath = self.devicesFolder + '/' + name
+            try:
+                with open(devicePath + '/descriptors', 'rb') as descriptorsFile:
+                    descriptors = descriptorsFile.read()
+            except OSError:
+                continue
+            strings = {}
+            for fieldName, attributeName in (('iManufacturer', 'manufacturer'), ('iProduct', 'product'),
+                                             ('iSerial', 'serial'), ('iConfiguration', 'configuration')):
+                value = SysfsBlock.readAttribute(devicePath, attributeName)
+                if value:
+                    strings[fieldName] = value
+            deviceNode = SysfsUSB.decode(descriptors, strings)
+            if deviceNode is None:
+                continue
+            busNumber = SysfsBlock.readAttribute(devicePath, 'busnum')
+            deviceNumber = SysfsBlock.readAttribute(devicePath, 'devnum')
+            if busNumber is None or deviceNumber is None:
+                continue
+            vendorId, productId = unpack_from('<HH', descriptors, 8)
+            busLine = 'Bus %03d Device %03d: ID %04x:%04x %s' % (int(busNumber), int(deviceNumber), vendorId,
+                                                                 productId, ' '.join(strings[fieldName] for fieldName in
+                                                                 ('iManufacturer', 'iProduct') if fieldName in strings))
+            devices.append({'busLine': busLine.rstrip(), 'descriptorTree': [deviceNode], 'sysPath': devicePath,
+                            'busNumber': int(busNumber), 'deviceNumber': int(deviceNumber)})
+        devices.sort(key=lambda device: (device['busNumber'], device['deviceNumber']))
+        return devices
+
+    def list(self):
+        print("\nSysfs USB Devices:")
+        for device in self.getDevices():
+            print("\t" + device['busLine'])
+
+
+if __name__ == '__main__':
+    from json import dumps
+    print(dumps(SysfsBlock().getBlockJSON(), indent=3))
+    if isdir(SysfsUSB.DEVICES):
+        SysfsUSB().list()
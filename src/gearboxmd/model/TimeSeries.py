@@ -0,0 +1,559 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         model/TimeSeries.py
+#   Date Started:   October 16, 2026
+#   Purpose:        Retained history of the metrics collected from psutil and procfs, for correlating hardware
+#                   faults with the load on the machine at the time.
+#   Development:
+#       Each series has a fixed set of numeric fields, and is kept in three tiers, as an RRD keeps them:
+#       raw samples for an hour, ten second rollups for a week, and one minute rollups for a year.  A rollup row
+#       holds the min, max, mean, and count of each field over its interval.  A field which is NaN in a sample is
+#       left out of that field's statistics, so each field has its own count.
+#       A tier is a series of chunks, each covering a fixed span of time with one numpy column per field, so a
+#       range query is a binary search and a slice of each chunk it overlaps.  Only the chunk each tier is filling
+#       is kept in memory.  When a sample falls past its end, it is sealed and saved as a .npy file of one record
+#       per row under TIME_SERIES_FOLDER, and from then on is read only by queries, through a memory map, so a
+#       query pages in only the part of the file it slices.  Chunks that have aged out of their tier's retention
+#       are dropped along with their files.
+#       TimeSeriesStore.append() saves the chunks being filled every FLUSH_INTERVAL seconds, and the store's owner
+#       calls flush() when it stops recording.
+#
+
+import os
+from collections import OrderedDict
+from bisect import bisect_right
+from threading import Lock
+from time import monotonic
+from urllib.parse import quote, unquote
+from sys import exc_info, stderr
+
+import numpy as np
+
+from model.Paths import TIME_SERIES_FOLDER
+
+
+PROGRAM_TITLE = "Time Series Store"
+INSTALLING  = False
+TESTING     = True
+DEBUG       = False
+
+
+class Tier:
+    """
+    One resolution at which a series is kept.  A resolution of 0 means raw samples.  Times are seconds.
+    """
+
+    __slots__ = ('name', 'resolution', 'retention', 'chunkSpan')
+
+    def __init__(self, name: str, resolution: int, retention: int, chunkSpan: int):
+        self.name       = name
+        self.resolution = resolution
+        self.retention  = retention
+        self.chunkSpan  = chunkSpan
+
+    def __str__(self):
+        return self.name
+
+
+RAW_TIER            = Tier('raw', 0, 3600, 600)
+TEN_SECOND_TIER     = Tier('10s', 10, 7 * 86400, 6 * 3600)
+ONE_MINUTE_TIER     = Tier('1min', 60, 365 * 86400, 86400)
+TIERS               = (RAW_TIER, TEN_SECOND_TIER, ONE_MINUTE_TIER)
+
+ROLLUP_STATISTICS   = ('min', 'max', 'mean', 'count')
+CHUNK_SUFFIX        = '.npy'
+
+
+class Chunk:
+    """
+    The rows of one tier of a series from startTime until startTime + span, one numpy array per column, with the
+    row times in the 'time' column in increasing order.  Arrays are allocated for the rows a rollup chunk can
+    hold, or doubled as needed for raw samples, and only the first count rows are valid.  A chunk read from its
+    file without copy has its columns as views of the memory mapped file, and is only for reading.
+    """
+
+    def __init__(self, startTime: float, span: int, columnNames: tuple, capacity: int, columns=None,
+                 copy: bool=True):
+        self.startTime  = startTime
+        self.endTime    = startTime + span
+        self.columnNames = ('time',) + columnNames
+        if columns is None:
+            self.columns = OrderedDict((name, np.empty(capacity)) for name in self.columnNames)
+            self.count  = 0
+        elif copy:
+            self.columns = OrderedDict((name, np.array(columns[name], dtype=np.float64))
+                                       for name in self.columnNames)
+            self.count  = len(self.columns['time'])
+        else:
+            self.columns = OrderedDict((name, columns[name]) for name in self.columnNames)
+            self.count  = len(self.columns['time'])
+        #   True when there are rows not yet saved.
+        self.dirty      = False
+
+    def append(self, row: tuple):
+        """
+        :param row: The time followed by a value for each of the other columns, in order.
+        """
+        if self.count == len(self.columns['time']):
+            for name, column in self.columns.items():
+                grown = np.empty(max(16, 2 * len(column)))
+                grown[:self.count] = column[:self.count]
+                self.columns[name] = grown
+        for column, value in zip(self.columns.values(), row):
+            column[self.count] = value
+        self.count += 1
+        self.dirty = True
+
+    def getRows(self, startTime: float, endTime: float, columnNames: tuple):
+        """
+        :return:    OrderedDict of column name to a view of its rows with times from startTime through endTime.
+        """
+        times = self.columns['time'][:self.count]
+        low = np.searchsorted(times, startTime, 'left')
+        high = np.searchsorted(times, endTime, 'right')
+        return OrderedDict((name, self.columns[name][low:high]) for name in ('time',) + columnNames)
+
+    @staticmethod
+    def read(filePath: str, span: int, columnNames: tuple, copy: bool):
+        """
+        :param copy:    Copy the rows into memory, for a chunk which will be appended to, rather than map them.
+        """
+        fileName = os.path.basename(filePath)
+        rows = np.load(filePath, mmap_mode='r')
+        return Chunk(float(fileName[:-len(CHUNK_SUFFIX)]), span, columnNames, 0, rows, copy)
+
+    def save(self, filePath: str):
+        #   One record per row, with a float64 field per column, so the file keeps the column names.
+        rows = np.empty(self.count, dtype=[(name, np.float64) for name in self.columnNames])
+        for name, column in self.columns.items():
+            rows[name] = column[:self.count]
+        #   Written beside the file it replaces and then renamed over it, so a crash never leaves half a chunk.
+        partPath = filePath + '.part'
+        with open(partPath, 'wb') as chunkFile:
+            np.save(chunkFile, rows)
+        os.replace(partPath, filePath)
+        self.dirty = False
+
+
+class Rollup:
+    """
+    The min, max, sum, and count of each field over the interval of one rollup row, while it is accumulating.
+    NaN values are skipped, so a field's count is the number of values it actually had.
+    """
+
+    def __init__(self, fieldCount: int):
+        self.bucketStart    = None
+        self.minimum        = np.full(fieldCount, np.inf)
+        self.maximum        = np.full(fieldCount, -np.inf)
+        self.total          = np.zeros(fieldCount)
+        self.count          = np.zeros(fieldCount)
+
+    def add(self, minimum: np.ndarray, maximum: np.ndarray, total: np.ndarray, count: np.ndarray):
+        np.fmin(self.minimum, minimum, out=self.minimum)
+        np.fmax(self.maximum, maximum, out=self.maximum)
+        self.total = np.nansum((self.total, total), axis=0)
+        self.count += count
+
+    def isEmpty(self):
+        return not self.count.any()
+
+    def row(self):
+        """
+        :return:    The bucket start time followed by min, max, mean, and count for each field, as a tuple in the
+                    order of a rollup chunk's columns.  The min, max, and mean of a field with no values are NaN.
+        """
+        hasValues = self.count > 0
+        minimum = np.where(hasValues, self.minimum, np.nan)
+        maximum = np.where(hasValues, self.maximum, np.nan)
+        mean = np.divide(self.total, self.count, out=np.full(len(self.total), np.nan), where=hasValues)
+        row = [self.bucketStart]
+        for fieldStatistics in zip(minimum, maximum, mean, self.count):
+            row += fieldStatistics
+        return tuple(row)
+
+    def reset(self, bucketStart: float):
+        self.bucketStart = bucketStart
+        self.minimum.fill(np.inf)
+        self.maximum.fill(-np.inf)
+        self.total.fill(0.0)
+        self.count.fill(0.0)
+
+
+class Series:
+    """
+    The history of one named set of numeric fields, in every tier.  Samples must be appended in time order;
+    a sample older than the latest one is dropped.  Without a folder, sealed chunks have nowhere to be saved and
+    are kept in memory until they expire.
+    """
+
+    def __init__(self, name: str, fieldNames: tuple, folder: str=None):
+        if not isinstance(name, str) or len(name) == 0:
+            raise Exception("Series constructor - Invalid name argument:  " + str(name))
+        if not isinstance(fieldNames, tuple) or len(fieldNames) == 0:
+            raise Exception("Series constructor - Invalid fieldNames argument:  " + str(fieldNames))
+        self.name       = name
+        self.fieldNames = fieldNames
+        self.folder     = folder
+        self.latestTime = None
+        self.columnNames = OrderedDict()
+        self.columnNames[RAW_TIER.name] = fieldNames
+        rollupColumns = tuple(fieldName + '.' + statistic for fieldName in fieldNames
+                              for statistic in ROLLUP_STATISTICS)
+        for tier in TIERS[1:]:
+            self.columnNames[tier.name] = rollupColumns
+        #   The chunk each tier is filling, or None before its first row.
+        self.openChunks = OrderedDict((tier.name, None) for tier in TIERS)
+        #   For each tier, start time to sealed chunk in time order.  The chunk is None when it is in its file.
+        self.sealedChunks = OrderedDict((tier.name, OrderedDict()) for tier in TIERS)
+        self.rollups    = OrderedDict((tier.name, Rollup(len(fieldNames))) for tier in TIERS[1:])
+        if folder is not None:
+            self.load()
+
+    def tierFolder(self, tier: Tier):
+        return os.path.join(self.folder, quote(self.name, safe=''), tier.name)
+
+    def chunkPath(self, tier: Tier, startTime: float):
+        return os.path.join(self.tierFolder(tier), str(int(startTime)) + CHUNK_SUFFIX)
+
+    def load(self):
+        """
+        Lists the saved chunks of each tier, and reads the latest of them into memory to go on filling.
+        """
+        for tier in TIERS:
+            tierFolder = self.tierFolder(tier)
+            if not os.path.isdir(tierFolder):
+                continue
+            startTimes = []
+            for fileName in os.listdir(tierFolder):
+                if fileName.endswith(CHUNK_SUFFIX) and fileName[:-len(CHUNK_SUFFIX)].isdigit():
+                    startTimes.append(float(fileName[:-len(CHUNK_SUFFIX)]))
+            startTimes.sort()
+            for startTime in startTimes[:-1]:
+                self.sealedChunks[tier.name][startTime] = None
+            if len(startTimes) > 0:
+                chunk = self.readChunk(tier, startTimes[-1], True)
+                if chunk is not None and chunk.count > 0:
+                    self.openChunks[tier.name] = chunk
+                    lastTime = chunk.columns['time'][chunk.count - 1]
+                    if self.latestTime is None or lastTime > self.latestTime:
+                        self.latestTime = float(lastTime)
+        if self.latestTime is not None:
+            for tier in TIERS:
+                self.expire(tier)
+            #   Rollups in progress when the series was last saved were lost, so start with the next buckets.
+            for tier in TIERS[1:]:
+                self.rollups[tier.name].reset(self.bucketStart(tier, self.latestTime) + tier.resolution)
+
+    @staticmethod
+    def bucketStart(tier: Tier, timeStamp: float):
+        return timeStamp - timeStamp % tier.resolution
+
+    def append(self, timeStamp: float, values: tuple):
+        """
+        :param values:  One number for each field, in order.  NaN for a field which has no value in this sample.
+        """
+        if self.latestTime is not None and timeStamp < self.latestTime:
+            return
+        self.latestTime = timeStamp
+        self.store(RAW_TIER, (timeStamp,) + tuple(values))
+        sample = np.array(values, dtype=np.float64)
+        self.accumulate(1, timeStamp, sample, sample, sample, (~np.isnan(sample)).astype(np.float64))
+
+    def accumulate(self, tierIndex: int, timeStamp: float, minimum: np.ndarray, maximum: np.ndarray,
+                   total: np.ndarray, count: np.ndarray):
+        """
+        Adds a sample, or a finished rollup row of the tier below, to the rollup of tier TIERS[tierIndex].
+        Finishing a bucket stores its row and passes it on to the next tier up.
+        """
+        if tierIndex >= len(TIERS):
+            return
+        tier = TIERS[tierIndex]
+        rollup = self.rollups[tier.name]
+        bucketStart = Series.bucketStart(tier, timeStamp)
+        if rollup.bucketStart is None:
+            rollup.reset(bucketStart)
+        elif bucketStart < rollup.bucketStart:
+            #   Belongs to a bucket already stored, as after a reload.
+            return
+        elif bucketStart > rollup.bucketStart:
+            if not rollup.isEmpty():
+                self.store(tier, rollup.row())
+                self.accumulate(tierIndex + 1, rollup.bucketStart, rollup.minimum.copy(), rollup.maximum.copy(),
+                                rollup.total.copy(), rollup.count.copy())
+            rollup.reset(bucketStart)
+        rollup.add(minimum, maximum, total, count)
+
+    def store(self, tier: Tier, row: tuple):
+        chunk = self.openChunks[tier.name]
+        timeStamp = row[0]
+        if chunk is None or timeStamp >= chunk.endTime:
+            if chunk is not None:
+                self.seal(tier, chunk)
+            capacity = 64 if tier.resolution == 0 else tier.chunkSpan // tier.resolution
+            chunk = Chunk(timeStamp - timeStamp % tier.chunkSpan, tier.chunkSpan, self.columnNames[tier.name],
+                          capacity)
+            self.openChunks[tier.name] = chunk
+            self.expire(tier)
+        chunk.append(row)
+
+    def save(self, tier: Tier, chunk: Chunk):
+        if self.folder is not None and chunk.dirty:
+            os.makedirs(self.tierFolder(tier), exist_ok=True)
+            chunk.save(self.chunkPath(tier, chunk.startTime))
+
+    def seal(self, tier: Tier, chunk: Chunk):
+        """
+        Saves chunk, which will get no more rows, and releases it to be read back from its file when queried.
+        """
+        self.save(tier, chunk)
+        self.sealedChunks[tier.name][chunk.startTime] = None if self.folder is not None else chunk
+
+    def readChunk(self, tier: Tier, startTime: float, copy: bool=False):
+        """
+        :return:    The saved chunk of tier starting at startTime, or None if it cannot be read.
+        """
+        filePath = self.chunkPath(tier, startTime)
+        try:
+            return Chunk.read(filePath, tier.chunkSpan, self.columnNames[tier.name], copy)
+        except Exception:
+            #   Written by a version with other fields, or damaged.
+            print("Series.readChunk - unable to read chunk:  " + filePath + '\n' + str(exc_info()[1]),
+                  file=stderr)
+            return None
+
+    def expire(self, tier: Tier):
+        """
+        Drops the chunks of tier which end before its retention period, counted back from the latest sample.
+        """
+        oldestTime = self.latestTime - tier.retention
+        expired = []
+        sealedChunks = self.sealedChunks[tier.name]
+        for startTime in sealedChunks:
+            if startTime + tier.chunkSpan > oldestTime:
+                break
+            expired.append(startTime)
+        for startTime in expired:
+            del sealedChunks[startTime]
+        chunk = self.openChunks[tier.name]
+        if chunk is not None and chunk.endTime <= oldestTime:
+            self.openChunks[tier.name] = None
+            expired.append(chunk.startTime)
+        if self.folder is not None:
+            for startTime in expired:
+                filePath = self.chunkPath(tier, startTime)
+                if os.path.isfile(filePath):
+                    os.remove(filePath)
+
+    def flush(self):
+        """
+        Saves the chunk each tier is filling, so that nothing but the rollups in progress is lost if the program
+        stops.
+        """
+        for tier in TIERS:
+            if self.openChunks[tier.name] is not None:
+                self.save(tier, self.openChunks[tier.name])
+
+    def selectTier(self, startTime: float):
+        """
+        The finest tier whose retention still reaches back to startTime.
+        """
+        for tier in TIERS:
+            if self.latestTime - tier.retention <= startTime:
+                return tier
+        return TIERS[-1]
+
+    def getRange(self, fieldName: str, startTime: float, endTime: float=None, tier: Tier=None):
+        """
+        :param tier:    The finest tier covering startTime if None.
+        :return:        OrderedDict of 'time' and 'value' to numpy arrays for the raw tier, or of 'time', 'min',
+                        'max', 'mean', and 'count' for a rollup tier, with NaN statistics where count is 0.  The arrays are empty if nothing is in range.
+        """
+        if fieldName not in self.fieldNames:
+            raise Exception("Series.getRange - Invalid fieldName argument:  " + str(fieldName))
+        if tier is not None and tier not in TIERS:
+            raise Exception("Series.getRange - Invalid tier argument:  " + str(tier))
+        if endTime is None:
+            endTime = self.latestTime if self.latestTime is not None else startTime
+        if tier is None:
+            tier = self.selectTier(startTime) if self.latestTime is not None else RAW_TIER
+        if tier.resolution == 0:
+            columnNames = (fieldName,)
+            resultNames = ('time', 'value')
+        else:
+            columnNames = tuple(fieldName + '.' + statistic for statistic in ROLLUP_STATISTICS)
+            resultNames = ('time',) + ROLLUP_STATISTICS
+        sealedChunks = self.sealedChunks[tier.name]
+        startTimes = tuple(sealedChunks.keys())
+        #   The chunk which could hold startTime, found by its start, then every chunk after it until endTime.
+        index = max(0, bisect_right(startTimes, startTime) - 1)
+        parts = []
+        while index < len(startTimes) and startTimes[index] <= endTime:
+            chunk = sealedChunks[startTimes[index]]
+            if chunk is None:
+                chunk = self.readChunk(tier, startTimes[index])
+            if chunk is not None:
+                parts.append(chunk.getRows(startTime, endTime, columnNames))
+            index += 1
+        chunk = self.openChunks[tier.name]
+        if chunk is not None and chunk.startTime <= endTime:
+            parts.append(chunk.getRows(startTime, endTime, columnNames))
+        #   Concatenating copies the rows, so the result does not hold the files of sealed chunks open.
+        result = OrderedDict()
+        for resultName, columnName in zip(resultNames, ('time',) + columnNames):
+            if len(parts) == 0:
+                result[resultName] = np.empty(0)
+            else:
+                result[resultName] = np.concatenate([part[columnName] for part in parts])
+        return result
+
+
+class TimeSeriesStore:
+    """
+    The series kept for GearboxMD, by name, saved under folder.  Appends and queries may come from different
+    threads, as when a PollingScheduler records into the store and a view reads from it.  append() saves every
+    series when FLUSH_INTERVAL seconds have passed since the last save, and whoever stops recording into the store
+    calls flush(), so that at most the rollups in progress are lost.
+    """
+
+    #   Seconds.  At most this much of the raw tier is lost if the program is killed.
+    FLUSH_INTERVAL  = 60
+
+    def __init__(self, folder: str=TIME_SERIES_FOLDER):
+        self.folder = folder
+        self.series = OrderedDict()
+        self.lock   = Lock()
+        self.lastFlush = monotonic()
+        if folder is not None and os.path.isdir(folder):
+            for seriesName in sorted(os.listdir(folder)):
+                seriesFolder = os.path.join(folder, seriesName)
+                fieldNames = TimeSeriesStore.savedFieldNames(seriesFolder)
+                if fieldNames is not None:
+                    self.series[unquote(seriesName)] = Series(unquote(seriesName), fieldNames, folder)
+
+    @staticmethod
+    def savedFieldNames(seriesFolder: str):
+        """
+        The field names of the series saved in seriesFolder, from the columns of one of its raw chunks.
+        """
+        rawFolder = os.path.join(seriesFolder, RAW_TIER.name)
+        if not os.path.isdir(rawFolder):
+            return None
+        for fileName in sorted(os.listdir(rawFolder), reverse=True):
+            if fileName.endswith(CHUNK_SUFFIX):
+                try:
+                    #   Only the header is read.
+                    rows = np.load(os.path.join(rawFolder, fileName), mmap_mode='r')
+                    return tuple(name for name in rows.dtype.names if name != 'time')
+                except Exception:
+                    continue
+        return None
+
+    def getSeries(self, name: str, fieldNames: tuple=None):
+        """
+        The series named name, which is created with fieldNames if it does not exist yet.
+        """
+        with self.lock:
+            if name not in self.series:
+                if fieldNames is None:
+                    return None
+                self.series[name] = Series(name, fieldNames, self.folder)
+            return self.series[name]
+
+    def getSeriesNames(self):
+        with self.lock:
+            return tuple(self.series.keys())
+
+    def append(self, name: str, timeStamp: float, values: OrderedDict):
+        """
+        :param values:  Field name to number.  The first sample of a series fixes its fields; later samples are
+                        matched to them by name, and a field missing from one is recorded as NaN.
+        """
+        series = self.getSeries(name, tuple(values.keys()))
+        with self.lock:
+            series.append(timeStamp, tuple(float(values[fieldName]) if values.get(fieldName) is not None
+                                           else np.nan for fieldName in series.fieldNames))
+            if monotonic() - self.lastFlush >= TimeSeriesStore.FLUSH_INTERVAL:
+                self.saveAll()
+
+    def getRange(self, name: str, fieldName: str, startTime: float, endTime: float=None, tier: Tier=None):
+        series = self.getSeries(name)
+        if series is None:
+            raise Exception("TimeSeriesStore.getRange - Invalid name argument:  " + str(name))
+        with self.lock:
+            result = series.getRange(fieldName, startTime, endTime, tier)
+            #   Copied, so that later appends to the same chunk cannot change what the caller was given.
+            return OrderedDict((key, column.copy()) for key, column in result.items())
+
+    def flush(self):
+        with self.lock:
+            self.saveAll()
+
+    def saveAll(self):
+        #   Set first, so that a failing disk is retried each interval rather than on every append.
+        self.lastFlush = monotonic()
+        for series in self.series.values():
+            series.flush()
+
+    @staticmethod
+    def numericFields(value):
+        """
+        The numeric attributes of a psutil named tuple, or the members of a plain tuple by index.
+        """
+        if hasattr(value, '_asdict'):
+            items = value._asdict().items()
+        else:
+            items = ((str(index), member) for index, member in enumerate(value))
+        return OrderedDict((name, float(member)) for name, member in items
+                           if isinstance(member, (int, float)))
+
+    def recordBatch(self, results: OrderedDict):
+        """
+        Records a batch from a PollingScheduler, to which this can be subscribed.  Each collector's result becomes
+        a series named after the collector, or one series per key, as 'disk_io_counters/sda', for collectors
+        returning a dict.  Sensor lists become one field per sensor, named by its label.
+        """
+        for collectorName, (timeStamp, value) in results.items():
+            try:
+                if value is None:
+                    continue
+                if isinstance(value, dict):
+                    for key, member in value.items():
+                        if isinstance(member, list):
+                            fields = OrderedDict()
+                            for index, sensor in enumerate(member):
+                                label = getattr(sensor, 'label', '') or str(index)
+                                for fieldName, number in TimeSeriesStore.numericFields(sensor).items():
+                                    fields[label + '.' + fieldName] = number
+                        else:
+                            fields = TimeSeriesStore.numericFields(member)
+                        if len(fields) > 0:
+                            self.append(collectorName + '/' + key, timeStamp, fields)
+                elif isinstance(value, tuple):
+                    fields = TimeSeriesStore.numericFields(value)
+                    if len(fields) > 0:
+                        self.append(collectorName, timeStamp, fields)
+                elif isinstance(value, (int, float)):
+                    self.append(collectorName, timeStamp, OrderedDict((('value', float(value)),)))
+            except Exception:
+                outputText = 'TimeSeriesStore.recordBatch - unable to record ' + collectorName + ':\n'
+                for line in exc_info():
+                    outputText += str(line) + '\n'
+                print(outputText, file=stderr)
+
+
+if __name__ == '__main__':
+    from time import time, sleep
+    from model.PsUtil import PollingScheduler
+
+    timeSeriesStore = TimeSeriesStore()
+    pollingScheduler = PollingScheduler()
+    pollingScheduler.subscribe(timeSeriesStore.recordBatch)
+    pollingScheduler.start()
+    sleep(30)
+    pollingScheduler.stop()
+    timeSeriesStore.flush()
+    for seriesName in timeSeriesStore.getSeriesNames():
+        series = timeSeriesStore.getSeries(seriesName)
+        print(seriesName + ":\t" + str(timeSeriesStore.getRange(seriesName, series.fieldNames[0], time() - 60)))
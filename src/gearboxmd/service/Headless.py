@@ -0,0 +1,131 @@
+#   Project:        GearboxMD
+#   Author:         George Keith Watson
+#   Date Started:   September 05, 2020
+#   Copyright:      (c) Copyright 2022 George Keith Watson
+#   Module:         service/Headless.py
+#   Date Started:   October 16, 2026
+#   Purpose:        Command line interface for running and ingesting hw-probe without a display.
+#   Development:
+#       Run from gearboxmd.py:
+#           python3 gearboxmd.py probe [--helper sudo] [--save DIR] [--snapshot PATH] [--format gbs]
+#           python3 gearboxmd.py ingest ARCHIVE [--snapshot PATH] [--format gbs]
+#       Neither command imports any view module or tkinter, so both work on servers with no display, and
+#       both can be scheduled from cron for nightly collection across a fleet.
+#
+
+from argparse import ArgumentParser
+from os import replace
+from os.path import isfile
+from sys import stderr
+from time import time
+
+from model.Hardware import HardwareProbe, HwProbeOption, KeyName, PrivilegeHelper, ProbeRunner
+from model.Snapshot import BinarySnapshot, SnapshotFormat, SnapshotWriter
+from model.Paths import COMMAND_OUTPUT_FOLDER, HW_PROBE_SNAPSHOT
+
+
+PROGRAM_TITLE = "GearboxMD Headless"
+INSTALLING  = False
+TESTING     = False
+DEBUG       = False
+
+
+def probeArguments(saveFolder: str, check: bool, acpi: bool):
+    hwProbeArgs = [HwProbeOption.ALL.value[KeyName.TEXT], HwProbeOption.PROBE.value[KeyName.TEXT]]
+    if acpi:
+        hwProbeArgs += [HwProbeOption.DUMP_ACPI.value[KeyName.TEXT], HwProbeOption.DECODE_ACPI.value[KeyName.TEXT]]
+    if check:
+        hwProbeArgs.append(HwProbeOption.CHECK.value[KeyName.TEXT])
+    hwProbeArgs += [HwProbeOption.SAVE_TO_DIR.value[KeyName.TEXT], saveFolder]
+    return tuple(hwProbeArgs)
+
+
+def runProbe(arguments):
+    commandList = HardwareProbe.probeCommand(probeArguments(arguments.save, arguments.check, arguments.acpi),
+                                             PrivilegeHelper(arguments.helper))
+    print("Running:\t" + ' '.join(commandList))
+    #   Archives already in the save folder are older than this and are not mistaken for this run's output.
+    startTime = time()
+    probeRunner = ProbeRunner(commandList)
+    probeRunner.start()
+    try:
+        while True:
+            event = probeRunner.events.get()
+            if event['type'] == 'output':
+                print(event['line'])
+            elif event['type'] == 'error':
+                print("hw-probe could not be started:  " + event['error'], file=stderr)
+                return 1
+            elif event['type'] == 'exit':
+                if event['returnCode'] != 0:
+                    print("hw-probe exited with code " + str(event['returnCode']), file=stderr)
+                    return 1
+                break
+    except KeyboardInterrupt:
+        probeRunner.cancel()
+        probeRunner.join()
+        print("hw-probe cancelled", file=stderr)
+        return 130
+    #   hw-probe names its archive hw.info.txz or with a suffix, as the GUI's ProbeCompletionHandler matches it.
+    archives = HardwareProbe.ProbeCompletionHandler.archivesSince(arguments.save, startTime)
+    if len(archives) == 0:
+        print("hw-probe wrote no archive to " + arguments.save, file=stderr)
+        return 1
+    arguments.archive = archives[0]
+    return ingestArchive(arguments)
+
+
+def ingestArchive(arguments):
+    if not isfile(arguments.archive):
+        print("hw-probe archive not found:  " + arguments.archive, file=stderr)
+        return 1
+    contentMap = HardwareProbe().loadArchive(arguments.archive)
+    if contentMap is None:
+        return 1
+    snapshotFormat = SnapshotFormat(arguments.format)
+    if snapshotFormat == SnapshotFormat.BINARY:
+        BinarySnapshot.write(contentMap, arguments.snapshot + '.part')
+    else:
+        SnapshotWriter.writeJSON(contentMap, arguments.snapshot + '.part')
+    replace(arguments.snapshot + '.part', arguments.snapshot)
+    logCount = len(contentMap['logMap']) if 'logMap' in contentMap else 0
+    testCount = len(contentMap['testMap']) if 'testMap' in contentMap else 0
+    print("Snapshot of " + arguments.archive + " written to " + arguments.snapshot + ":  " +
+          str(logCount) + " logs, " + str(testCount) + " tests")
+    return 0
+
+
+def argumentParser():
+    parser = ArgumentParser(prog='gearboxmd', description="Run hw-probe and save its results without the GUI.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    probeParser = commands.add_parser('probe', help="Run hw-probe, then ingest the archive it writes.")
+    probeParser.add_argument('--helper', choices=[str(helper) for helper in PrivilegeHelper],
+                             default=str(PrivilegeHelper.SUDO),
+                             help="How to run hw-probe as root.  'sudo' prompts on this terminal if it needs to.")
+    probeParser.add_argument('--save', default=COMMAND_OUTPUT_FOLDER, help="Folder hw-probe saves its archive to.")
+    probeParser.add_argument('--no-check', dest='check', action='store_false',
+                             help="Skip hw-probe's device operability checks.")
+    probeParser.add_argument('--no-acpi', dest='acpi', action='store_false',
+                             help="Skip the ACPI table dump and decode.")
+    probeParser.set_defaults(action=runProbe)
+
+    ingestParser = commands.add_parser('ingest', help="Parse an existing hw-probe archive into a snapshot.")
+    ingestParser.add_argument('archive', help="A hw.info.txz file written by hw-probe.")
+    ingestParser.set_defaults(action=ingestArchive)
+
+    for commandParser in (probeParser, ingestParser):
+        commandParser.add_argument('--snapshot', default=HW_PROBE_SNAPSHOT, help="Snapshot file to write.")
+        commandParser.add_argument('--format', choices=[str(snapshotFormat) for snapshotFormat in SnapshotFormat],
+                                   default=str(SnapshotFormat.BINARY), help="Snapshot file format.")
+    return parser
+
+
+def main(argumentList: list):
+    arguments = argumentParser().parse_args(argumentList)
+    return arguments.action(arguments)
+
+
+if __name__ == '__main__':
+    from sys import argv
+    exit(main(argv[1:]))
@@ -17,15 +17,20 @@
 #   Development:
 #
 
-from subprocess import Popen, STDOUT, PIPE
+from subprocess import Popen, STDOUT, PIPE, TimeoutExpired
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
 from sys import exc_info, stderr
 from signal import Signals, valid_signals, SIGKILL, SIGSTOP, signal
 from collections import OrderedDict
 from datetime import datetime
+from time import time, monotonic
+from array import array
+from math import fsum
 from functools import partial
 from enum import Enum
 
-from tkinter import Tk, messagebox
+import pyudev
 
 
 PROGRAM_TITLE = "Linux Services"
@@ -39,18 +44,128 @@ class DeviceCommand(Enum):
     LSBLK_FS    = ('lsblk', '--all', '--bytes', '--json', '-o', 'NAME,FSTYPE,FSVER,LABEL,UUID,FSAVAIL,FSUSE%,MOUNTPOINTS')
     LSUSB       = ('lsusb', '--verbose')
     BLKID       = ('blkid', '-o', 'full')
+    BLKID_EXPORT = ('blkid', '-o', 'export')
 
     def __str__(self):
         return str(self.value)
 
+    def subsystems(self):
+        """
+        The udev subsystems whose add, remove, and change events can alter this command's output.
+        """
+        if self == DeviceCommand.LSUSB:
+            return ('usb',)
+        return ('block',)
+
+
+class ToolCache:
+    """
+    Output of DeviceCommands, keyed by the command tuple, kept until a udev event arrives on one of the
+    command's subsystems.  Refreshing an inventory on an idle system then runs nothing, while a hotplug is seen
+    by the next call.
+    Each subsystem has a generation count which every event on it advances.  Output is only stored if the
+    generation did not move while the command ran, so an event racing a run can never leave stale output cached.
+    If the udev monitor cannot be started, nothing is cached and every call runs its command.
+    """
+
+    def __init__(self):
+        self.outputMap      = {}
+        self.generations    = {}
+        self.lock           = Lock()
+        self.observer       = None
+        self.enabled        = None
+
+    def startMonitor(self):
+        #   Called with self.lock held.  The monitor is only started on first use.
+        subsystems = set()
+        for command in DeviceCommand:
+            subsystems.update(command.subsystems())
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            for subsystem in sorted(subsystems):
+                monitor.filter_by(subsystem)
+            self.observer = pyudev.MonitorObserver(monitor, callback=self.deviceEvent, name='ToolCache')
+            self.observer.daemon = True
+            self.observer.start()
+            self.enabled = True
+        except Exception as exception:
+            print("ToolCache.startMonitor - udev monitor not available, output will not be cached:\t" +
+                  str(exception), file=stderr)
+            self.enabled = False
+
+    def deviceEvent(self, device):
+        subsystem = device.subsystem
+        with self.lock:
+            self.generations[subsystem] = self.generations.get(subsystem, 0) + 1
+            for commandList in [commandList for commandList in self.outputMap
+                                if subsystem in DeviceCommand(commandList).subsystems()]:
+                del self.outputMap[commandList]
+
+    def generation(self, command: DeviceCommand):
+        return tuple(self.generations.get(subsystem, 0) for subsystem in command.subsystems())
+
+    def run(self, command: DeviceCommand, timeout: float=None):
+        if not isinstance(command, DeviceCommand):
+            raise Exception('ToolCache.run - invalid command argument:\t' + str(command))
+        with self.lock:
+            if self.enabled is None:
+                self.startMonitor()
+            if command.value in self.outputMap:
+                return self.outputMap[command.value]
+            generation = self.generation(command)
+        outputText, completed = LinuxUtilities.execute(command.value, timeout)
+        if completed:
+            with self.lock:
+                if self.enabled and self.generation(command) == generation:
+                    self.outputMap[command.value] = outputText
+        return outputText
+
+    def invalidate(self, command: DeviceCommand=None):
+        with self.lock:
+            if command is None:
+                self.outputMap.clear()
+            else:
+                self.outputMap.pop(command.value, None)
+
 
 class LinuxTools:
+    """
+    Runs each DeviceCommand in toolList concurrently on a thread pool shared by all instances, so an inventory
+    takes as long as its slowest tool rather than the sum of them all.  The constructor returns as soon as the
+    commands are submitted.  futures maps each DeviceCommand to the Future of its output text, and asCompleted()
+    yields outputs in the order they finish so a caller can start rendering whichever is ready first.
+    getOutput() waits for the one command asked for.
+    Outputs come from LinuxUtilities.toolCache, so a command already run since its subsystem last changed is
+    not run again.
+    """
+
+    #   Bounds the number of tools running at once across all LinuxTools instances.
+    MAX_WORKERS     = 4
+    #   Seconds a tool may run before it is killed.  lsusb --verbose can take several on a busy hub.
+    DEFAULT_TIMEOUT = 30.0
+
+    executor        = None
+    executorLock    = Lock()
 
-    def __init__(self, toolList: tuple=None):
+    @staticmethod
+    def getExecutor():
+        with LinuxTools.executorLock:
+            if LinuxTools.executor is None:
+                LinuxTools.executor = ThreadPoolExecutor(max_workers=LinuxTools.MAX_WORKERS,
+                                                         thread_name_prefix='LinuxTools')
+            return LinuxTools.executor
+
+    def __init__(self, toolList: tuple=None, timeout: float=None):
         if toolList is None or not isinstance(toolList, tuple):
             raise Exception('LinuxTools constructor  - invalid commandList argument:\t' + str(toolList))
-        #   Key is the command tuple and value is the text output.
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise Exception('LinuxTools constructor  - invalid timeout argument:\t' + str(timeout))
+        self.timeout = timeout if timeout is not None else LinuxTools.DEFAULT_TIMEOUT
+        #   Key is the command tuple and value is the Future of its text output.
         #   A second run with the same commandList will overwrite and replace previous.
+        self.futures    = OrderedDict()
+        #   Key is the command tuple and value is the text output, filled in as each command finishes.
         self.toolOutput = OrderedDict()
         if toolList is not None:
             for commandList in toolList:
@@ -60,65 +175,253 @@ class LinuxTools:
     def runTool(self, commandList: DeviceCommand):
         if commandList is None or not isinstance(commandList, DeviceCommand):
             raise Exception('LinuxTools.runTool - invalid commandList argument:\t' + str(commandList))
-        self.toolOutput[commandList]    = LinuxUtilities.runLinuxTool(commandList.value)
+        future = LinuxTools.getExecutor().submit(LinuxUtilities.runCachedTool, commandList, self.timeout)
+        future.add_done_callback(partial(self.toolFinished, commandList))
+        self.futures[commandList] = future
+        return future
+
+    def toolFinished(self, commandList: DeviceCommand, future):
+        if self.futures.get(commandList) is future:
+            self.toolOutput[commandList] = future.result()
 
     def getOutput(self, commandList: DeviceCommand):
         if commandList is None or not isinstance(commandList, DeviceCommand):
             raise Exception('LinuxTools.getOutput - invalid commandList argument:\t' + str(commandList))
-        return self.toolOutput[commandList]
+        return self.futures[commandList].result()
+
+    def asCompleted(self):
+        """
+        Generator of (DeviceCommand, outputText) pairs in the order the commands finish.
+        """
+        commandMap = {future: commandList for commandList, future in self.futures.items()}
+        for future in as_completed(commandMap):
+            yield commandMap[future], future.result()
 
     def list(self):
-        for commandList, outputText in self.toolOutput.items():
+        for commandList, future in self.futures.items():
             print("\nLinuxTool:\t" + str(commandList))
-            print("Output:\n" + outputText)
+            print("Output:\n" + future.result())
 
 
 class LinuxUtilities:
 
+    toolCache = ToolCache()
+
     def __init__(self):
         pass
 
     @staticmethod
-    def runLinuxTool(commandList):
+    def runCachedTool(command: DeviceCommand, timeout: float=None):
+        """
+        Like runLinuxTool(), but the output is shared with every other caller until a udev event on one of the
+        command's subsystems invalidates it.
+        """
+        return LinuxUtilities.toolCache.run(command, timeout)
+
+    @staticmethod
+    def runLinuxTool(commandList, timeout: float=None):
+        """
+        Runs commandList and returns its combined stdout and stderr text.  If timeout seconds pass first, the
+        process is killed and whatever it wrote is returned, followed by a line saying it timed out.
+        """
+        return LinuxUtilities.execute(commandList, timeout)[0]
+
+    @staticmethod
+    def execute(commandList, timeout: float=None):
+        """
+        runLinuxTool(), also returning whether the command ran to completion, which is False when it could not be
+        started or timed out.
+        :return:    (outputText, completed)
+        """
         if commandList is None or not isinstance(commandList, tuple):
             raise Exception('runLinuxCommand - invalid command list argument:\t' + str(commandList))
         outputText = ''
+        completed = False
         try:
             sub     = Popen(commandList, stdout=PIPE, stderr=STDOUT )
-            output, error_message = sub.communicate()
-            outputText  = output.decode('utf-8')
+            try:
+                output, error_message = sub.communicate(timeout=timeout)
+                outputText  = output.decode('utf-8')
+                completed   = True
+            except TimeoutExpired:
+                sub.kill()
+                output, error_message = sub.communicate()
+                outputText  = output.decode('utf-8', errors='replace') + \
+                              '\nrunLinuxCommand - timed out after ' + str(timeout) + ' seconds:\t' + str(commandList)
         except Exception:
             outputText = ''
             for line in exc_info():
                 outputText += str(line) + '\n'
         finally:
-            return outputText
+            return outputText, completed
+
+
+class RingBuffer:
+    """
+    Fixed capacity store of timestamped numeric samples, one preallocated array of doubles per field plus one for
+    the timestamps.  Once full, each new sample overwrites the oldest, so memory use never grows after
+    construction.  Window statistics run min(), max() and fsum() over array slices, which loop in C.
+    Each sample also records monotonic() when it was appended, and windows are found by that, since the wall clock
+    time stamps can step backwards or forwards when the clock is set.
+    """
+
+    def __init__(self, fieldNames: tuple, capacity: int):
+        if not isinstance(fieldNames, tuple) or len(fieldNames) == 0:
+            raise Exception("RingBuffer constructor - Invalid fieldNames argument:  " + str(fieldNames))
+        if not isinstance(capacity, int) or capacity < 1:
+            raise Exception("RingBuffer constructor - Invalid capacity argument:  " + str(capacity))
+        self.fieldNames = fieldNames
+        self.capacity   = capacity
+        self.times      = array('d', bytes(8 * capacity))
+        self.ticks      = array('d', bytes(8 * capacity))
+        self.columns    = OrderedDict((name, array('d', bytes(8 * capacity))) for name in fieldNames)
+        #   Slot the next sample goes in, and the number of slots holding samples.
+        self.nextSlot   = 0
+        self.count      = 0
+
+    def append(self, timeStamp: float, values: tuple):
+        slot = self.nextSlot
+        self.times[slot] = timeStamp
+        self.ticks[slot] = monotonic()
+        for column, value in zip(self.columns.values(), values):
+            column[slot] = value
+        self.nextSlot = (slot + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def slotOf(self, position: int):
+        """
+        Slot of the sample at position, in order from 0 for the oldest sample held.
+        """
+        return (self.nextSlot - self.count + position) % self.capacity
+
+    def mostRecent(self):
+        """
+        :return:    (timeStamp, OrderedDict of field name to value) of the latest sample, or None if there is none.
+        """
+        if self.count == 0:
+            return None
+        slot = self.slotOf(self.count - 1)
+        return self.times[slot], OrderedDict((name, column[slot]) for name, column in self.columns.items())
+
+    def positionAfter(self, startTick: float):
+        """
+        Position of the oldest sample appended at or after startTick, a monotonic() time, by binary search, since
+        samples are held in the order appended.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.ticks[self.slotOf(middle)] < startTick:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def positionOfWindow(self, seconds: float, methodName: str):
+        """
+        Position of the oldest sample appended in the last seconds before the latest one, or 0 if seconds is None.
+        """
+        if seconds is None:
+            return 0
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or not seconds >= 0:
+            raise Exception("RingBuffer." + methodName + " - Invalid seconds argument:  " + str(seconds))
+        if self.count == 0:
+            return 0
+        return self.positionAfter(self.ticks[self.slotOf(self.count - 1)] - seconds)
+
+    def slices(self, data: array, fromPosition: int):
+        """
+        The samples in data from fromPosition to the latest, as at most two array slices, since they may wrap
+        around the end of the array.
+        """
+        if fromPosition >= self.count:
+            return ()
+        first = self.slotOf(fromPosition)
+        last = self.slotOf(self.count - 1)
+        if first <= last:
+            return (data[first:last + 1],)
+        return (data[first:], data[:last + 1])
+
+    def getWindow(self, fieldName: str, seconds: float=None):
+        """
+        :return:    (timeStamps, values), arrays of the samples in the last seconds, or of all samples held.
+        """
+        if fieldName not in self.columns:
+            raise Exception("RingBuffer.getWindow - Invalid fieldName argument:  " + str(fieldName))
+        position = self.positionOfWindow(seconds, 'getWindow')
+        timeStamps, values = array('d'), array('d')
+        for part in self.slices(self.times, position):
+            timeStamps.extend(part)
+        for part in self.slices(self.columns[fieldName], position):
+            values.extend(part)
+        return timeStamps, values
+
+    def getStatistics(self, seconds: float=None):
+        """
+        :return:    OrderedDict of field name to {'count', 'min', 'max', 'mean', 'last'} over the samples in the last
+                    seconds, or over all samples held.  Empty if there are none.
+        """
+        statistics = OrderedDict()
+        position = self.positionOfWindow(seconds, 'getStatistics')
+        if self.count == 0:
+            return statistics
+        count = self.count - position
+        for name, column in self.columns.items():
+            parts = self.slices(column, position)
+            statistics[name] = {'count': count,
+                                'min': min(min(part) for part in parts),
+                                'max': max(max(part) for part in parts),
+                                'mean': fsum(fsum(part) for part in parts) / count,
+                                'last': column[self.slotOf(self.count - 1)]}
+        return statistics
 
 
 class MemoryMonitor:
+    """
+    Samples /proc/meminfo into a RingBuffer, in megabytes as 'free --mega' reports them.  The file is kept open
+    and reread from the start for each sample, so polling costs one read and no fork.
+    """
+
+    MEM_INFO            = '/proc/meminfo'
+    #   A day of samples at one per second.
+    DEFAULT_CAPACITY    = 86400
+    #   The columns of 'free', with swap added.
+    FIELD_NAMES         = ('total', 'used', 'free', 'shared', 'buff/cache', 'available', 'swapTotal', 'swapFree')
+    #   meminfo values are in kibibytes, and free --mega reports in units of 10^6 bytes.
+    KIB_TO_MB           = 1024 / 1000000
+
+    def __init__(self, capacity: int=DEFAULT_CAPACITY):
+        self.samples = RingBuffer(MemoryMonitor.FIELD_NAMES, capacity)
+        self.memInfoFile = open(MemoryMonitor.MEM_INFO, 'rb')
 
-    def __init__(self):
-        self.index = []
-        self.monitorLog = {}
+    @staticmethod
+    def parseMemInfo(memInfoText: bytes):
+        memInfo = {}
+        for line in memInfoText.split(b'\n'):
+            name, separator, value = line.partition(b':')
+            if separator:
+                memInfo[name] = int(value.split()[0])
+        return memInfo
 
     def poll(self):
-        memoryStats = {}
+        memoryStats = OrderedDict()
         try:
-            sub = Popen( ["free", "--mega"], stdout=PIPE, stderr=STDOUT)
-            lastCommandRunTime = str(datetime.now())
-            #   print("Sortable Time Stamp:\t" + lastCommandRunTime)
-            output, error_message = sub.communicate()
-            outputLines = output.decode('utf-8').split('\n')
-            fieldNames = outputLines[0].split()
-            fieldValues = outputLines[1].split()
-            del (fieldValues[0])
-            idx = 0
-            while idx < len(fieldNames):
-                memoryStats[fieldNames[idx]] = fieldValues[idx]
-                idx += 1
-            #   print('memoryStats (MB):\t' + str(memoryStats))
-            self.index.append(lastCommandRunTime)
-            self.monitorLog[lastCommandRunTime] = memoryStats
+            self.memInfoFile.seek(0)
+            memInfo = MemoryMonitor.parseMemInfo(self.memInfoFile.read())
+            lastCommandRunTime = time()
+            #   As free computes them.
+            buffCache = memInfo[b'Buffers'] + memInfo[b'Cached'] + memInfo.get(b'SReclaimable', 0)
+            available = memInfo.get(b'MemAvailable', memInfo[b'MemFree'])
+            values = (memInfo[b'MemTotal'], memInfo[b'MemTotal'] - available, memInfo[b'MemFree'],
+                      memInfo.get(b'Shmem', 0), buffCache, available,
+                      memInfo.get(b'SwapTotal', 0), memInfo.get(b'SwapFree', 0))
+            values = tuple(value * MemoryMonitor.KIB_TO_MB for value in values)
+            self.samples.append(lastCommandRunTime, values)
+            memoryStats = OrderedDict(zip(MemoryMonitor.FIELD_NAMES, values))
         except Exception:
             outputText = ''
             for line in exc_info():
@@ -128,7 +431,19 @@ class MemoryMonitor:
         return memoryStats
 
     def getMostRecent(self):
-        pass
+        """
+        :return:    (timeStamp, OrderedDict of field name to megabytes), or None before the first poll.
+        """
+        return self.samples.mostRecent()
+
+    def getStatistics(self, seconds: float=None):
+        return self.samples.getStatistics(seconds)
+
+    def getWindow(self, fieldName: str, seconds: float=None):
+        return self.samples.getWindow(fieldName, seconds)
+
+    def close(self):
+        self.memInfoFile.close()
 
     def __setattr__(self, key, value):
         if key not in self.__dict__:
@@ -202,6 +517,8 @@ def ExitProgram():
 
 
 if __name__ == '__main__':
+    from tkinter import Tk, messagebox
+
     mainView = Tk()
     mainView.geometry("800x500+200+100")
     mainView.title(PROGRAM_TITLE)
@@ -9,19 +9,20 @@
 #
 
 from collections import OrderedDict
+from collections.abc import Mapping
 from enum import Enum
 from copy import deepcopy
 from functools import partial
 
 from tkinter import Tk, Frame, LabelFrame, Listbox, messagebox, Checkbutton, Label, Button, Text, Toplevel, Message, \
-                    N, S, E, W, FLAT, SUNKEN, RAISED, RIDGE, GROOVE, HORIZONTAL, VERTICAL, X, Y, BOTH, \
-                    END, SINGLE, MULTIPLE, EXTENDED, DISABLED, NORMAL, \
+                    Scrollbar, N, S, E, W, FLAT, SUNKEN, RAISED, RIDGE, GROOVE, HORIZONTAL, VERTICAL, X, Y, BOTH, \
+                    RIGHT, END, SINGLE, MULTIPLE, EXTENDED, DISABLED, NORMAL, \
                     StringVar, BooleanVar
 from tksheet import Sheet
 
 
 from model.Util import ModelType
-from model.Hardware import KeyName, ContentID
+from model.Hardware import KeyName, ContentID, LineStore, LazyLineMap
 from view.FrameScroller import FrameScroller
 
 PROGRAM_TITLE = "GUI Components"
@@ -198,17 +199,25 @@ class ContentGridFrame(LabelFrame):
     """
     This only works for Listbox content so far, but any type can potentially be placed in a frame and arranged
     in a grid using this class.
+    Each list is filled the first time it is shown, so the entries of a LazyLineMap are only read and indexed
+    when their cells are mapped.
     """
 
     DEFAULT_DESCRIPTOR  = {        'columns': 2    }
     MAX_LIST_LINES  = 10
 
     def __init__(self, container, frameContents: OrderedDict, descriptor: dict=None, listener=None, **keyWordArguments):
-        if not isinstance(frameContents, OrderedDict):
+        if not isinstance(frameContents, Mapping):
             raise Exception("TextFrame constructor - Invalid frameContents argument:  " + str(frameContents))
-        for name, lineList in frameContents.items():
-            if not isinstance(lineList, tuple):
+        for name in frameContents:
+            if isinstance(frameContents, LazyLineMap):
+                #   Its entries are always LineStores, and looking one up here would decode it.
+                continue
+            lineList = frameContents[name]
+            if not isinstance(lineList, (tuple, LineStore)):
                 raise Exception("TextFrame constructor - Invalid lineList in frameContents argument:  " + str(lineList))
+            if isinstance(lineList, LineStore):
+                continue
             for line in lineList:
                 if not isinstance(line, str):
                     raise Exception("TextFrame constructor - Invalid line in lineList in frameContents argument:  " + str(line))
@@ -223,20 +232,15 @@ class ContentGridFrame(LabelFrame):
         LabelFrame.__init__(self, container, keyWordArguments)
 
         self.contentFrames = OrderedDict()
-        for listName, lineList in self.frameContents.items():
+        self.listBoxes = OrderedDict()
+        for listName in self.frameContents:
             self.contentFrames[listName] = LabelFrame(self, text=listName, border=2, relief=SUNKEN)
-            maxLineLen = 0
-            for line in lineList:
-                if len(line) > maxLineLen:
-                    maxLineLen = len(line)
-            listHeight = min(ContentGridFrame.MAX_LIST_LINES, len(lineList))
             listContent = Listbox(self.contentFrames[listName], border=3, relief=RIDGE,
-                                                   selectmode=SINGLE, height=listHeight, width=maxLineLen+2)
-            listContent.insert(END, *lineList)
-            if len(lineList) > 0:
-                listContent.selection_set(0, 0)
+                                                   selectmode=SINGLE, height=ContentGridFrame.MAX_LIST_LINES)
             listContent.bind('<<ListboxSelect>>', partial(self.listSelection, listName))
+            listContent.bind('<Map>', partial(self.fillList, listName))
             listContent.pack(expand=True, fill=BOTH)
+            self.listBoxes[listName] = listContent
 
         if 'columns' in self.descriptor and isinstance(self.descriptor['columns'], int):
             self.colCount = self.descriptor['columns']
@@ -251,6 +255,19 @@ class ContentGridFrame(LabelFrame):
                 rowIdx += 1
                 colIdx = 0
 
+    def fillList(self, listName: str, event):
+        listContent = self.listBoxes[listName]
+        listContent.unbind('<Map>')
+        lineList = self.frameContents[listName]
+        maxLineLen = 0
+        for line in lineList:
+            if len(line) > maxLineLen:
+                maxLineLen = len(line)
+        listContent.config(height=min(ContentGridFrame.MAX_LIST_LINES, len(lineList)), width=maxLineLen+2)
+        listContent.insert(END, *lineList)
+        if len(lineList) > 0:
+            listContent.selection_set(0, 0)
+
     def listSelection(self, event, listName: str):
         pass
 
@@ -269,12 +286,13 @@ class ContentGridFrame(LabelFrame):
 
 class TextFrame(LabelFrame):
 
-    def __init__(self, container, content: tuple, descriptor: dict=None, listener=None, **keyWordArguments):
-        if not isinstance(content, tuple):
+    def __init__(self, container, content, descriptor: dict=None, listener=None, **keyWordArguments):
+        if not isinstance(content, (tuple, LineStore)):
             raise Exception("TextFrame constructor - Invalid content argument:  " + str(content))
-        for line in content:
-            if not isinstance(line, str):
-                raise Exception("TextFrame constructor - Invalid line in content argument:  " + str(line))
+        if isinstance(content, tuple):
+            for line in content:
+                if not isinstance(line, str):
+                    raise Exception("TextFrame constructor - Invalid line in content argument:  " + str(line))
         self.content = content
         if not isinstance(descriptor, dict):
             raise Exception("TextFrame constructor - Invalid descriptor argument:  " + str(descriptor))
@@ -307,20 +325,82 @@ class TextFrame(LabelFrame):
         pass
 
 
+class ListWindow:
+    """
+    Shows content longer than WINDOW_THRESHOLD lines in a Listbox through a window:  the Listbox only ever holds
+    the lines currently visible and the scroll bar pages the window over the content, so with a MappedLineStore
+    only the lines looked at are read from the file.  Shorter content is inserted whole and the scroll bar is not
+    used.
+    """
+
+    WINDOW_THRESHOLD    = 2000
+
+    def __init__(self, listBox: Listbox, scrollBar: Scrollbar, height: int):
+        self.listBox    = listBox
+        self.scrollBar  = scrollBar
+        self.height     = height
+        self.content    = ()
+        self.windowed   = False
+        self.firstLine  = 0
+        self.scrollBar.config(command=self.scrollWindow)
+        self.listBox.bind('<Button-4>', partial(self.wheelWindow, -3))
+        self.listBox.bind('<Button-5>', partial(self.wheelWindow, 3))
+
+    def setContent(self, content):
+        self.content = content
+        self.windowed = len(content) > ListWindow.WINDOW_THRESHOLD
+        self.listBox.delete(0, END)
+        if self.windowed:
+            self.showWindow(0)
+        else:
+            self.listBox.insert(END, *content)
+
+    def showWindow(self, firstLine: int):
+        lineCount = len(self.content)
+        firstLine = max(0, min(firstLine, lineCount - self.height))
+        self.firstLine = firstLine
+        self.listBox.delete(0, END)
+        self.listBox.insert(END, *self.content[firstLine:firstLine + self.height])
+        self.scrollBar.set(firstLine / lineCount, min(1.0, (firstLine + self.height) / lineCount))
+
+    def scrollWindow(self, *args):
+        if not self.windowed:
+            return
+        #   Scrollbar commands are ('moveto', fraction) or ('scroll', count, 'units' | 'pages').
+        if args[0] == 'moveto':
+            self.showWindow(int(float(args[1]) * len(self.content)))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.height
+            self.showWindow(self.firstLine + step)
+
+    def wheelWindow(self, step: int, event):
+        if not self.windowed:
+            #   The Listbox scrolls its own lines.
+            return None
+        self.showWindow(self.firstLine + step)
+        return 'break'
+
+
 class ListFrame(LabelFrame):
     """
     2022-09-12:
     This list container can contain lists of any length, and an ACPI dump can have tens of thousands of lines.
     It therefore should have the option of a regular expression based filter available and activated
     using the descriptor argument.
+    Content longer than ListWindow.WINDOW_THRESHOLD lines is shown through a ListWindow.
     """
 
-    def __init__(self, container, content: tuple, descriptor: dict=None,listener=None, **keyWordArguments):
-        if not isinstance(content, tuple):
+    LIST_HEIGHT         = 30
+
+    def __init__(self, container, content, descriptor: dict=None,listener=None, **keyWordArguments):
+        if not isinstance(content, (tuple, LineStore)):
             raise Exception("TextFrame constructor - Invalid content argument:  " + str(content))
-        for line in content:
-            if not isinstance(line, str):
-                raise Exception("TextFrame constructor - Invalid line in content argument:  " + str(line))
+        if isinstance(content, tuple):
+            for line in content:
+                if not isinstance(line, str):
+                    raise Exception("TextFrame constructor - Invalid line in content argument:  " + str(line))
         self.content = content
         if not isinstance(descriptor, dict):
             raise Exception("TextFrame constructor - Invalid descriptor argument:  " + str(descriptor))
@@ -331,8 +411,13 @@ class ListFrame(LabelFrame):
         LabelFrame.__init__(self, container, keyWordArguments)
         if 'name' in self.descriptor:
             self.config(text=self.descriptor['name'])
-        self.listBoxContent = Listbox(self, border=3, relief=RIDGE, selectmode=SINGLE, height=30, width=100)
-        self.listBoxContent.insert(END, *self.content)
+        self.listBoxContent = Listbox(self, border=3, relief=RIDGE, selectmode=SINGLE,
+                                      height=ListFrame.LIST_HEIGHT, width=100)
+        self.scrollBar = Scrollbar(self, orient=VERTICAL)
+        self.listWindow = ListWindow(self.listBoxContent, self.scrollBar, ListFrame.LIST_HEIGHT)
+        self.listWindow.setContent(self.content)
+        if self.listWindow.windowed:
+            self.scrollBar.pack(side=RIGHT, fill=Y)
         if len(self.content) > 0:
             self.listBoxContent.selection_set(0, 0)
         self.listBoxContent.bind('<<ListboxSelect>>', self.listSelection)
@@ -725,6 +810,7 @@ class MasterSlaveLists(LabelFrame):
 
     DEFAULT_MASTER_WIDTH        = 30
     DEFAULT_SLAVE_WIDTH         = 40
+    LIST_HEIGHT                 = 20
 
     def __init__(self, container, descriptor: dict, listener, **keyWordArguments):
         if not isinstance(descriptor, OrderedDict):
@@ -732,13 +818,18 @@ class MasterSlaveLists(LabelFrame):
         if not KeyName.VIEW in descriptor or not KeyName.INFO in descriptor:
             raise Exception("MasterSlaveLists constructor - Key missing in configuration argument:  " + str(descriptor))
         for item in descriptor[KeyName.INFO]:
-            if not KeyName.NAME in item or not KeyName.TEXT in item or not KeyName.SLAVE_LIST in item:
+            if not KeyName.NAME in item or not KeyName.TEXT in item or \
+                    (not KeyName.SLAVE_LIST in item and not KeyName.SLAVE_SOURCE in item):
                 raise Exception(
                     "MasterSlaveLists constructor - Key missing in info list in configuration argument:  " + str(descriptor))
-            for slaveItem in item[KeyName.SLAVE_LIST]:
-                if not KeyName.TEXT in slaveItem:
-                    raise Exception(
-                        "MasterSlaveLists constructor - Text missing in slave info list in configuration argument:  " + str(descriptor))
+            if KeyName.SLAVE_SOURCE in item and not callable(item[KeyName.SLAVE_SOURCE]):
+                raise Exception(
+                    "MasterSlaveLists constructor - Slave source not callable in configuration argument:  " + str(descriptor))
+            if KeyName.SLAVE_LIST in item:
+                for slaveItem in item[KeyName.SLAVE_LIST]:
+                    if not KeyName.TEXT in slaveItem:
+                        raise Exception(
+                            "MasterSlaveLists constructor - Text missing in slave info list in configuration argument:  " + str(descriptor))
 
         LabelFrame.__init__(self, container, keyWordArguments)
         self.listener = None
@@ -759,28 +850,44 @@ class MasterSlaveLists(LabelFrame):
         self.slaveMap   = OrderedDict()
         for item in self.descriptor[KeyName.INFO]:
             self.masterList.append(item[KeyName.TEXT])
-            self.slaveMap[item[KeyName.TEXT]] = []
-            for slaveItem in item[KeyName.SLAVE_LIST]:
-                self.slaveMap[item[KeyName.TEXT]].append(slaveItem[KeyName.TEXT])
-            self.slaveMap[item[KeyName.TEXT]] = tuple(self.slaveMap[item[KeyName.TEXT]])
+            if KeyName.SLAVE_LIST in item:
+                self.slaveMap[item[KeyName.TEXT]] = self.slaveTexts(item[KeyName.SLAVE_LIST])
+            else:
+                #   Resolved by getSlaveList() when the item is first selected.
+                self.slaveMap[item[KeyName.TEXT]] = item[KeyName.SLAVE_SOURCE]
         self.masterList = tuple(self.masterList)
 
-        self.listBoxMaster = Listbox(self, border=3, relief=RIDGE, selectmode=SINGLE, height=20, width=self.masterWidth)
+        self.listBoxMaster = Listbox(self, border=3, relief=RIDGE, selectmode=SINGLE,
+                                     height=MasterSlaveLists.LIST_HEIGHT, width=self.masterWidth)
         self.listBoxMaster.insert(END, *self.masterList)
         if len(self.masterList) == 0:
             self.listBoxMaster.insert(END, *('empty',))
         self.listBoxMaster.selection_set(0, 0)
         self.listBoxMaster.bind('<<ListboxSelect>>', self.masterListSelection)
 
-        self.listBoxSlave = Listbox(self, border=3, relief=RIDGE, selectmode=SINGLE, height=20, width=self.slaveWidth)
-        self.slaveList = self.slaveMap[self.masterList[0]]
-        self.listBoxSlave.insert(END, *self.slaveList)
+        self.listBoxSlave = Listbox(self, border=3, relief=RIDGE, selectmode=SINGLE,
+                                    height=MasterSlaveLists.LIST_HEIGHT, width=self.slaveWidth)
+        #   A log such as the ACPI dump is far too long to insert whole, so the slave list is windowed.
+        self.slaveScrollBar = Scrollbar(self, orient=VERTICAL)
+        self.slaveWindow = ListWindow(self.listBoxSlave, self.slaveScrollBar, MasterSlaveLists.LIST_HEIGHT)
+        self.slaveList = ()
+        if len(self.masterList) > 0:
+            self.slaveList = self.getSlaveList(self.masterList[0])
         self.listBoxSlave.bind('<<ListboxSelect>>', self.slaveListSelection)
 
         self.listBoxMaster.grid(row=0, column=0, padx=5, pady=5, sticky=N+W)
         self.listBoxSlave.grid(row=0, column=1, padx=5, pady=5, sticky=N+W)
+        self.slaveScrollBar.grid(row=0, column=2, pady=5, sticky=N+S)
+        self.showSlaveList()
         Initializer.setInitializing(False)
 
+    def showSlaveList(self):
+        self.slaveWindow.setContent(self.slaveList)
+        if self.slaveWindow.windowed:
+            self.slaveScrollBar.grid()
+        else:
+            self.slaveScrollBar.grid_remove()
+
     def messageReceiver(self, message: dict):
         if TESTING:
             print("MasterSlaveLists.messageReceiver:\t" + str(message))
@@ -806,15 +913,29 @@ class MasterSlaveLists(LabelFrame):
             selection = self.listBoxMaster.selection_get()
             if TESTING:
                 print("MasterSlaveLists.masterListSelection:\t" + selection)
-            self.slaveList = self.slaveMap[self.masterList[self.masterList.index(selection)]]
-            self.listBoxSlave.delete(0, END)
-            self.listBoxSlave.insert(END, *self.slaveList)
+            self.slaveList = self.getSlaveList(self.masterList[self.masterList.index(selection)])
+            self.showSlaveList()
 
     def slaveListSelection(self, event):
         if not Initializer.isInitializing():
             if TESTING:
                 print("MasterSlaveLists.slaveListSelection:\t" + str(event))
 
+    def getSlaveList(self, masterText: str):
+        #   A slave source returns the slave texts themselves, e.g. a tuple of str or a LineStore.
+        if callable(self.slaveMap[masterText]):
+            self.slaveMap[masterText] = self.slaveMap[masterText]()
+        return self.slaveMap[masterText]
+
+    @staticmethod
+    def slaveTexts(slaveItems):
+        slaveList = []
+        for slaveItem in slaveItems:
+            if not KeyName.TEXT in slaveItem:
+                raise Exception("MasterSlaveLists.slaveTexts - Text missing in slave item:  " + str(slaveItem))
+            slaveList.append(slaveItem[KeyName.TEXT])
+        return tuple(slaveList)
+
 
 class SimplePropertyListFrame(LabelFrame):
 
@@ -863,10 +984,35 @@ class SimplePropertyListFrame(LabelFrame):
                                                border=1, relief=SUNKEN, padx=5, bg='white')
                 self.valueLabels[name].grid(row=rowIdx, column=1, padx=15, pady=5, ipadx=5)
                 rowIdx += 1
+            self.nextRow = rowIdx
             self.fields = deepcopy(fields)
             return True
         return False
 
+    def setRow(self, name: str, value):
+        """
+        Changes the value shown for name, or adds a row for it at the bottom if there is none, leaving the other
+        rows as they are.
+        """
+        if name in self.valueLabels:
+            self.valueLabels[name].config(text=value)
+        else:
+            self.nameLabels[name] = Label(self, text=name, width=15, anchor=W, border=1, relief=GROOVE, padx=5)
+            self.nameLabels[name].grid(row=self.nextRow, column=0, padx=15, pady=0, ipadx=5)
+            self.valueLabels[name] = Label(self, text=value, anchor=W, width=self.valueWidth,
+                                           border=1, relief=SUNKEN, padx=5, bg='white')
+            self.valueLabels[name].grid(row=self.nextRow, column=1, padx=15, pady=5, ipadx=5)
+            self.nextRow += 1
+        self.fields[name] = value
+
+    def removeRow(self, name: str):
+        if name not in self.valueLabels:
+            return False
+        self.nameLabels.pop(name).destroy()
+        self.valueLabels.pop(name).destroy()
+        self.fields.pop(name, None)
+        return True
+
     def getState(self, modelType: ModelType):
         if modelType == ModelType.JSON:
             return self.fields
@@ -30,16 +30,16 @@
 
 from os import walk
 from os.path import isfile
+from sys import stderr
 from collections import OrderedDict
 from copy import deepcopy
 from PIL import Image, ImageTk
 from enum import Enum
 from functools import partial
 import tarfile
-from gzip import compress, decompress
-from json import dumps
 from math import floor
 from threading import Thread
+from queue import Queue, Empty
 
 
 from tkinter import Tk, LabelFrame, Label, Frame, Checkbutton, Button, Listbox, Text, Toplevel, Message, OptionMenu, \
@@ -51,10 +51,10 @@ from tkinter import Tk, LabelFrame, Label, Frame, Checkbutton, Button, Listbox,
 
 from tkinter.ttk import Treeview, Notebook
 
-from model.Hardware import HardwareProbe, HwProbeOption, ContentID
+from model.Hardware import HardwareProbe, HwProbeOption, ContentID, HotplugEventStream, DeltaType
+from model.Snapshot import SnapshotWriter
 from model.Paths import pathFromList, INSTALLATION_FOLDER, IMAGES_GEARS_FOLDER, \
-                        COMMAND_OUTPUT_FOLDER, HW_PROBE_FOLDER, HW_PROBE_ZIPFILE, \
-                        HW_PROBE_JSONFILE, HW_PROBE_TXZ
+                        COMMAND_OUTPUT_FOLDER, HW_PROBE_FOLDER, HW_PROBE_SNAPSHOT, HW_PROBE_TXZ
 from model.Util import  IMAGE_DEFAULT_MOVING, ModelType
 from view.Components import MasterSlaveLists, CheckBoxList, KeyName, SimplePropertyListFrame, ViewControlPopup, \
                         FrameId, TextFrame, ListFrame, ContentGridFrame, ContentFrameContainer
@@ -152,6 +152,9 @@ class Initializer:
 class HardwareProbeView(LabelFrame):
 
     DEFAULT_VIEW_MODE   = ViewMode.NOTEBOOK
+    POLL_INTERVAL       = 200       #   milliseconds
+    #   Bounds the time spent in one poll when the probe is writing output faster than it can be shown.
+    MAX_EVENTS_PER_POLL = 100
 
     class ToolBar(LabelFrame):
 
@@ -251,6 +254,10 @@ class HardwareProbeView(LabelFrame):
             if self.listener is not None:
                 self.listener({'source': "ToolBar.buttonAction", 'name': buttonName})
 
+        def setButtonText(self, buttonName: str, text: str):
+            if buttonName in self.buttonMap:
+                self.buttonMap[buttonName].config(text=text)
+
         def messageReceiver(self, message: dict):
             if not isinstance(message, dict):
                 return
@@ -286,6 +293,9 @@ class HardwareProbeView(LabelFrame):
         self.hostPropSheetExists = False
         self.devicesPropSheetExists = False
         self.hardwareProbe = HardwareProbe(hwProbeArgs=None)
+        #   Background threads report back through this queue, which is polled on the Tk thread.
+        self.snapshotQueue = Queue()
+        self.probeRunner = None
 
         self.viewMode = HardwareProbeView.DEFAULT_VIEW_MODE
         if options is not None and isinstance(options, dict):
@@ -349,28 +359,18 @@ class HardwareProbeView(LabelFrame):
         if 'source' in message:
             if message['source'] == "ToolBar.buttonAction":
                 if message['name'] == str(HardwareProbeView.ToolBar.ToolName.LOAD_LATEST):
-                    self.hwProbeContentMap = self.hardwareProbe.loadLatest()
-                    if self.listener is not None:
-                        self.listener({'source': 'HardwareProbeView.loadLatest',
-                                       'hwProbeContentMap': self.hwProbeContentMap,
-                                       'viewMode': self.viewMode})
-                    jsonString = dumps(self.hwProbeContentMap, indent=4)
-                    jsonFile = open(HW_PROBE_JSONFILE, 'w')
-                    jsonFile.write(jsonString)
-                    jsonFile.close()
-
-                    #   compressedJSON  = compress(jsonString.encode('utf-8'))
-                    compressedJSON  = compress(jsonString.encode('utf-8'))
-                    gzipFile = open(HW_PROBE_ZIPFILE, 'wb')
-                    gzipFile.write(compressedJSON)
-                    gzipFile.close()
-
-                    if TESTING:
-                        gzipFile = open(HW_PROBE_ZIPFILE, 'rb')
-                        jsonContent = decompress(gzipFile.read()).decode('utf-8')
+                    self.showContentMap(self.hardwareProbe.loadLatest())
 
                 elif message['name'] == str(HardwareProbeView.ToolBar.ToolName.RUN_PROBE):
-                    self.hardwareProbe.launchProbe()
+                    if self.probeRunner is not None and self.probeRunner.isRunning():
+                        if not self.probeRunner.cancel():
+                            self.messageHelp.config(text=GENERAL_HELP + "The probe is running in a terminal " +
+                                                    "window.\nClose that window to stop it.")
+                    else:
+                        self.probeRunner = self.hardwareProbe.launchProbe()
+                        self.toolBar.setButtonText(str(HardwareProbeView.ToolBar.ToolName.RUN_PROBE), 'Cancel Probe')
+                        self.messageHelp.config(text=GENERAL_HELP + "Probe started")
+                        self.after(HardwareProbeView.POLL_INTERVAL, self.pollProbeRunner)
                 elif message['name'] == str(HardwareProbeView.ToolBar.ToolName.SHOW_HIST):
                     pass
                 elif message['name'] == str(HardwareProbeView.ToolBar.ToolName.PROBE_OPTIONS):
@@ -449,6 +449,72 @@ class HardwareProbeView(LabelFrame):
                         self.listener(message)
 
 
+    def showContentMap(self, hwProbeContentMap):
+        self.hwProbeContentMap = hwProbeContentMap
+        if self.listener is not None:
+            self.listener({'source': 'HardwareProbeView.loadLatest',
+                           'hwProbeContentMap': self.hwProbeContentMap,
+                           'viewMode': self.viewMode})
+        if self.hwProbeContentMap is not None:
+            SnapshotWriter(self.hwProbeContentMap, HW_PROBE_SNAPSHOT,
+                           callback=self.snapshotQueue.put).start()
+            self.after(HardwareProbeView.POLL_INTERVAL, self.pollSnapshotQueue)
+
+    def pollSnapshotQueue(self):
+        try:
+            message = self.snapshotQueue.get_nowait()
+        except Empty:
+            self.after(HardwareProbeView.POLL_INTERVAL, self.pollSnapshotQueue)
+            return
+        if message['status'] == 'complete':
+            self.messageHelp.config(text=GENERAL_HELP + "Probe snapshot saved to:\n" + message['path'])
+        else:
+            self.messageHelp.config(text=GENERAL_HELP + "Probe snapshot not saved:\n" + message['error'])
+
+    def pollProbeRunner(self):
+        lastLine = None
+        finalEvent = None
+        eventCount = 0
+        while eventCount < HardwareProbeView.MAX_EVENTS_PER_POLL:
+            try:
+                event = self.probeRunner.events.get_nowait()
+            except Empty:
+                break
+            eventCount += 1
+            if event['type'] == 'output':
+                if len(event['line'].strip()) > 0:
+                    lastLine = event['line']
+            else:
+                finalEvent = event
+                break
+        if lastLine is not None:
+            self.messageHelp.config(text=GENERAL_HELP + "Probe running:\n" + lastLine)
+        if finalEvent is None:
+            self.after(HardwareProbeView.POLL_INTERVAL, self.pollProbeRunner)
+            return
+        self.toolBar.setButtonText(str(HardwareProbeView.ToolBar.ToolName.RUN_PROBE), 'Run Probe')
+        if finalEvent['type'] == 'error':
+            self.messageHelp.config(text=GENERAL_HELP + "Probe failed:\n" + finalEvent['error'])
+        elif finalEvent['cancelled']:
+            self.messageHelp.config(text=GENERAL_HELP + "Probe cancelled")
+        else:
+            self.messageHelp.config(text=GENERAL_HELP + "Probe finished, exit code " + str(finalEvent['returnCode']) +
+                                    "\nLoading results")
+            self.after(HardwareProbeView.POLL_INTERVAL, self.pollArchiveEvents)
+
+    def pollArchiveEvents(self):
+        #   The model loads the probe's archive itself once it is complete, and posts the result here.
+        try:
+            event = self.hardwareProbe.archiveEvents.get_nowait()
+        except Empty:
+            self.after(HardwareProbeView.POLL_INTERVAL, self.pollArchiveEvents)
+            return
+        if event['type'] == 'loaded':
+            self.messageHelp.config(text=GENERAL_HELP + "Probe results loaded from:\n" + event['path'])
+            self.showContentMap(event['hwProbeContentMap'])
+        else:
+            self.messageHelp.config(text=GENERAL_HELP + "Probe results not loaded:\n" + event['error'])
+
     def playGifAnim(self, gifImageFile: str, width, height):
         canvas = Image.new("RGB", (width, height), "white")
         gif = Image.open(gifImageFile, 'r')
@@ -468,6 +534,8 @@ class HardwareProbeView(LabelFrame):
 class HardwareProbeViewController(LabelFrame):
 
     VIEW_MODE_DEFAULT   = ViewMode.NOTEBOOK
+    #   Milliseconds between collections of hotplug events for the open Devices views.
+    HOTPLUG_POLL_INTERVAL   = 250
 
     def __init__(self, container, options: dict=None, **keyWordArguments):
         self.container = container
@@ -489,6 +557,13 @@ class HardwareProbeViewController(LabelFrame):
         self.optionHelpMap = OrderedDict()
         self.topLevelMap = OrderedDict()
         self.topLevelThreadMap = OrderedDict()
+        #   Every Devices property list which is open, in the notebook or in a Toplevel, to patch on hotplug.
+        self.devicesViews = []
+        self.hotplugStream = None
+        #   The rows added for devices plugged in since the probe, by sys_path, as (row name, value).  Rows from
+        #   the probe's own listing are keyed by hw-probe's device ids, which udev events cannot be matched to,
+        #   so only these rows are ever changed or removed.
+        self.hotplugRows = OrderedDict()
 
         for option in self.hwProbeOptionList:
             self.optionHelpMap[option[KeyName.TEXT]] = option[KeyName.HELP]
@@ -931,6 +1006,41 @@ class HardwareProbeViewController(LabelFrame):
         self.optionsToplevel.destroy()
         self.optionsToplevel = None
 
+    def startHotplug(self):
+        if self.hotplugStream is not None:
+            return
+        try:
+            self.hotplugStream = HotplugEventStream()
+        except Exception as exception:
+            print("HardwareProbeViewController.startHotplug - udev not available, Devices will not update:\t" +
+                  str(exception), file=stderr)
+            return
+        self.hotplugStream.start()
+        self.after(HardwareProbeViewController.HOTPLUG_POLL_INTERVAL, self.pollHotplug)
+
+    def pollHotplug(self):
+        self.devicesViews = [view for view in self.devicesViews if view.winfo_exists()]
+        for delta in self.hotplugStream.nextBatch():
+            #   Only the row for the device which changed is touched.
+            sysPath = delta.record.sysPath
+            if delta.deltaType == DeltaType.REMOVED:
+                if sysPath in self.hotplugRows:
+                    rowName = self.hotplugRows.pop(sysPath)[0]
+                    for devicesView in self.devicesViews:
+                        devicesView.removeRow(rowName)
+            elif delta.deltaType == DeltaType.ADDED or sysPath in self.hotplugRows:
+                #   The row keeps the name it was added with, even if the device's type is reported differently
+                #   by a later event.
+                if sysPath in self.hotplugRows:
+                    rowName = self.hotplugRows[sysPath][0]
+                else:
+                    rowName = str(delta.deviceType) + ' ' + delta.record.sysName
+                value = HotplugEventStream.describe(delta.record)
+                self.hotplugRows[sysPath] = (rowName, value)
+                for devicesView in self.devicesViews:
+                    devicesView.setRow(rowName, value)
+        self.after(HardwareProbeViewController.HOTPLUG_POLL_INTERVAL, self.pollHotplug)
+
     def propertySheetAdapter(self, properties):
         fields = OrderedDict()
         for propertyLine in properties:
@@ -949,19 +1059,20 @@ class HardwareProbeViewController(LabelFrame):
                                     },
                                     KeyName.INFO: []
                                  })
-        for name, content in contentMap.items():
+        #   Only the names are read here.  The lines of an entry are not looked up until it is selected in the
+        #   master list, which for a LazyLineMap is also when they are decoded.
+        for name in contentMap.keys():
             descriptor[KeyName.INFO].append({
                 KeyName.NAME: name,
                 KeyName.TEXT: name,
-                KeyName.SLAVE_LIST: []
+                KeyName.SLAVE_SOURCE: partial(self.slaveListAdapter, contentMap, name)
             })
-            for logLine in content:
-                descriptor[KeyName.INFO][-1][KeyName.SLAVE_LIST].append( {
-                    KeyName.TEXT: logLine
-                })
-            descriptor[KeyName.INFO][-1][KeyName.SLAVE_LIST] = tuple(descriptor[KeyName.INFO][-1][KeyName.SLAVE_LIST])
         return descriptor
 
+    def slaveListAdapter(self, contentMap: dict, name: str):
+        #   Log lines are passed through as they are stored, rather than copied into a tuple of text items.
+        return contentMap[name]
+
     def scrollableContent(self, contentId: ContentID, container=None):
         if container is None:
             container = self
@@ -1001,6 +1112,10 @@ class HardwareProbeViewController(LabelFrame):
                                                   valueWidth=maxLineLen, listener=self.messageReceiver, text=title,
                                                   border=3, relief=GROOVE)
             self.container.geometry("1200x600+50+50")
+            for rowName, value in self.hotplugRows.values():
+                contentView.setRow(rowName, value)
+            self.devicesViews.append(contentView)
+            self.startHotplug()
         elif contentId == ContentID.LOGS:
             contentView = MasterSlaveLists(scrollFrame, self.masterSlaveAdapter(self.hwProbeContentMap['logMap']),
                                             listener=self.messageReceiver, text=title, border=3, relief=GROOVE)
@@ -1008,19 +1123,14 @@ class HardwareProbeViewController(LabelFrame):
             return scrollFrame
 
         elif contentId == ContentID.TESTS:
-            testContents = OrderedDict({
-                'CPU Performance': self.hwProbeContentMap['testMap']['cpu_perf'],
-                'Graphics': self.hwProbeContentMap['testMap']['glxgears'],
-                'Hard Disk': self.hwProbeContentMap['testMap']['hdd_read'],
-                'Memory': self.hwProbeContentMap['testMap']['memtester'],
-            })
             contentView = ContentGridFrame(scrollFrame, self.hwProbeContentMap['testMap'], descriptor = {},
                                             listener=self.messageReceiver, text=title, border=3, relief=GROOVE)
             contentView.pack(fill=BOTH, expand=True)
             return scrollFrame
 
         elif contentId == ContentID.ACPI_DUMP:
-            contentView = TextFrame(scrollFrame, self.hwProbeContentMap['acpidump'], descriptor={'name': "ACPI Dump"},
+            #   A ListFrame, like ACPI Decoded, so that only the visible lines of the mapped dump are read.
+            contentView = ListFrame(scrollFrame, self.hwProbeContentMap['acpidump'], descriptor={'name': "ACPI Dump"},
                                             listener=self.messageReceiver, text=title, border=3, relief=GROOVE)
             contentView.pack(fill=BOTH, expand=True)
 